@@ -1,4 +1,6 @@
 from pipeline_setup import *
+from async_calculator import arun_calculator
+import asyncio
 
 # Create an class with anobjective function suitable for giving to the scipy minimizer
 # Including a cache to avoid recomputing the same values
@@ -18,47 +20,137 @@ class FFCObjectiveWithCache:
         self._cache = {}
         self.verbosity = verbosity
 
+        # Optional callback called with (x_tuple, zval_dict) after each new
+        # evaluation, used to checkpoint long runs
+        self.on_evaluate = None
+
+        # Asynchronous evaluations in flight, keyed by x tuple, shared by
+        # concurrent callers for the same x
+        self._inflight = {}
+
+        # Optional memory_profile.MemoryProfile measuring each new evaluation
+        self.memory_profile = None
+
         # Define the names of the z variables returned by the calculator
-        self.z_names = ["SSR weight",
-                   "SSR prot",
-                   "SSR fat",
-                   "SSR kcal",
-                   "emissions",
-                   "herd size",
-                   "animals",
-                   'woodland']
+        self.z_names = list(Z_NAMES)
+
+    def _params(self, x):
+        # Update the parameters with the current values
+        params = self.params_default.copy()
+        for i_name, name_string in enumerate(self.names_x):
+            params[name_string] = x[i_name]
+        return params
+
+    def _store(self, x_tuple, z_val):
+        # cached dict
+        zval_dict = {zn: zv for zn, zv in zip(self.z_names, z_val)}
+
+        # Store the results in the cache
+        self._cache[x_tuple] = zval_dict
+
+        if self.on_evaluate is not None:
+            self.on_evaluate(x_tuple, zval_dict)
+
+    def _print(self, x_tuple):
+        for i_name, name_string in enumerate(self.names_x):
+            print(f"{name_string} = {x_tuple[i_name]:.10f}; ", end="")
+        for i_name, name_string in enumerate(list(self._cache[x_tuple].keys())):
+            print(f"{name_string} = {self._cache[x_tuple][name_string]:.10f}; ", end="")
+        print()
 
     def _calculate(self, x_tuple, verbosity):
         
-        x = list(x_tuple)
         # Only recompute if not already cached
-        
         if x_tuple not in self._cache:
 
-            # Update the parameters with the current values
-            params = self.params_default.copy()
-            for i_name, name_string in enumerate(self.names_x):
-                params[name_string] = x[i_name]
-            
             # Perform the SSR and emissions calculation
-            z_val = run_calculator(self.datablock_init, params)
+            z_val = run_calculator(self.datablock_init, self._params(x_tuple),
+                                   memory=self.memory_profile)
+            self._store(x_tuple, z_val)
+
+        # Print out what's going on 
+        if (verbosity > 1):
+            self._print(x_tuple)
 
-            # cached dict
-            zval_dict = {zn: zv for zn, zv in zip(self.z_names, z_val)}
+        return self._cache[x_tuple]
 
-            # Store the results in the cache
-            self._cache[x_tuple] = zval_dict
+    def calculate_many(self, xs, calculator=None, verbosity=None):
+        """Evaluates several parameter vectors as a single batch. Vectors
+        already in the cache, and repeated vectors, are only evaluated once.
+
+        Parameters:
+            xs (list): Parameter vectors, with values for names_x.
+            calculator (callable): Batch calculator, called with the datablock
+                and a list of parameter sets. Defaults to run_calculator_batch.
+            verbosity (int): Level of verbosity for output messages.
+        Returns:
+            list: Output dicts, in the same order as xs.
+        """
+        if calculator is None:
+            def calculator(datablock, params_list):
+                return run_calculator_batch(datablock, params_list, memory=self.memory_profile)
+        if verbosity is None:
+            verbosity = self.verbosity
+
+        x_tuples = [tuple(x) for x in xs]
+        new = list(dict.fromkeys(x for x in x_tuples if x not in self._cache))
+
+        if new:
+            z_vals = calculator(self.datablock_init, [self._params(x) for x in new])
+            for x_tuple, z_val in zip(new, z_vals):
+                self._store(x_tuple, z_val)
+                if (verbosity > 1):
+                    self._print(x_tuple)
+
+        return [self._cache[x] for x in x_tuples]
+
+    async def acalculate(self, x, calculator=None, verbosity=None):
+        """Asynchronous version of the cached calculation. Uses and fills the
+        same cache as the blocking methods.
+
+        Parameters:
+            x (list): Values of the parameters in names_x.
+            calculator (AsyncCalculator): Calculator to use. Defaults to the
+                shared calculator of async_calculator.
+            verbosity (int): Level of verbosity for output messages.
+        Returns:
+            dict: Calculator outputs keyed by z name.
+        """
+        x_tuple = tuple(x)
+        if verbosity is None:
+            verbosity = self.verbosity
+
+        if x_tuple not in self._cache:
+            task = self._inflight.get(x_tuple)
+            if task is None:
+                task = asyncio.ensure_future(self._aevaluate(x_tuple, calculator))
+                self._inflight[x_tuple] = task
+                task.add_done_callback(lambda _: self._inflight.pop(x_tuple, None))
+            # Cancelling one caller must not cancel the shared evaluation
+            await asyncio.shield(task)
 
-        # Print out what's going on 
         if (verbosity > 1):
-            for i_name, name_string in enumerate(self.names_x):
-                print(f"{name_string} = {x[i_name]:.10f}; ", end="")
-            for i_name, name_string in enumerate(list(self._cache[x_tuple].keys())):
-                print(f"{name_string} = {self._cache[x_tuple][name_string]:.10f}; ", end="")
-            print()
+            self._print(x_tuple)
 
         return self._cache[x_tuple]
 
+    async def _aevaluate(self, x_tuple, calculator):
+        z_val = await arun_calculator(self.datablock_init, self._params(x_tuple),
+                                      calculator=calculator)
+        # A blocking call may have filled the cache in the meantime
+        if x_tuple not in self._cache:
+            self._store(x_tuple, z_val)
+
+    async def acalculate_many(self, xs, calculator=None, verbosity=None):
+        """Evaluates several parameter vectors concurrently. Returns the list
+        of output dicts, in the same order as xs."""
+        return await asyncio.gather(*[self.acalculate(x, calculator, verbosity)
+                                      for x in xs])
+
+    def objective_values(self, x, verbosity=0):
+        """Returns all the calculator outputs for x, as a dictionary"""
+        return dict(self._calculate(tuple(x), verbosity))
+
     # Define the objective function for minimization
     def objective(self, x, z_name_requested, verbosity=None):
         x_tuple = tuple(x)
@@ -0,0 +1,230 @@
+"""asyncio interface to the calculator.
+
+The blocking calculator runs on an executor, so event loops (web handlers,
+async notebook code) are never blocked. Concurrency is limited with a
+semaphore, callers are held back once too many computations are pending, and
+identical requests that are already in flight share a single computation.
+
+The calculator is CPU bound and most of its xarray work holds the GIL, so by
+default it runs on a pool of worker processes. Each datablock is published
+once in shared memory, see shared_datablock, and the workers attach to it
+instead of receiving a pickled copy with every call. A thread pool can be
+used instead with processes=False, but it only overlaps the parts of an
+evaluation that release the GIL, and does not use every core.
+
+Example
+-------
+>>> z = await arun_calculator(datablock, params)
+>>> zs = await arun_many(datablock, [params_1, params_2, params_1])
+"""
+
+import asyncio
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from pipeline_setup import params_key, run_calculator
+
+# Datablocks attached by each worker process, keyed by shared segment name
+_worker_datablocks = {}
+
+def _run_shared(calculator, manifest, params):
+    """Runs the calculator in a worker process on a shared datablock"""
+    from shared_datablock import attach_datablock
+
+    name = manifest["segment"]
+    if name not in _worker_datablocks:
+        _worker_datablocks[name] = attach_datablock(manifest)
+    return calculator(_worker_datablocks[name], params)
+
+
+class _LoopState:
+    """Synchronisation primitives of an AsyncCalculator for one event loop"""
+
+    def __init__(self, max_concurrency, max_pending):
+        self.running = asyncio.Semaphore(max_concurrency)
+        self.pending = asyncio.Semaphore(max_pending)
+        self.inflight = {}
+
+
+class AsyncCalculator:
+    """Runs the calculator on an executor with a concurrency limit,
+    backpressure and in-flight request coalescing.
+
+    Parameters
+    ----------
+    max_concurrency : int, optional
+        Maximum number of calculator evaluations running at the same time.
+        Defaults to the number of CPUs.
+    max_pending : int, optional
+        Maximum number of distinct evaluations either running or waiting for
+        a free slot. Further callers wait until one of them finishes.
+        Defaults to four times max_concurrency.
+    executor : concurrent.futures.Executor, optional
+        Executor used to run the calculator. If not provided, a pool of
+        max_concurrency worker processes sharing the datablocks, or of
+        threads if processes is False, is created. A process pool given here
+        receives a pickled datablock with every call.
+    calculator : callable, optional
+        Blocking calculator with the signature of run_calculator. With the
+        default process pool it must be picklable, such as a module level
+        function.
+    processes : bool, optional
+        Create a process pool rather than a thread pool when no executor is
+        given.
+    """
+
+    def __init__(self, max_concurrency=None, max_pending=None, executor=None,
+                 calculator=run_calculator, processes=True):
+
+        if max_concurrency is None:
+            max_concurrency = os.cpu_count() or 1
+        if max_pending is None:
+            max_pending = 4 * max_concurrency
+        if max_pending < max_concurrency:
+            raise ValueError("max_pending must be at least max_concurrency")
+
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.calculator = calculator
+
+        self._own_executor = executor is None
+        self._share_datablocks = executor is None and processes
+        if executor is None and processes:
+            executor = ProcessPoolExecutor(max_workers=max_concurrency)
+        elif executor is None:
+            executor = ThreadPoolExecutor(max_workers=max_concurrency,
+                                          thread_name_prefix="calculator")
+        self.executor = executor
+
+        # Datablocks published for the worker processes, keyed by content
+        # fingerprint, so a datablock changed in place is published again
+        self._shared = {}
+
+        self._states = weakref.WeakKeyDictionary()
+        self.counters = {"requests": 0, "coalesced": 0, "evaluations": 0}
+
+    def _state(self):
+        # asyncio primitives are bound to the loop they are first used in
+        loop = asyncio.get_running_loop()
+        state = self._states.get(loop)
+        if state is None:
+            state = _LoopState(self.max_concurrency, self.max_pending)
+            self._states[loop] = state
+        return state
+
+    async def _evaluate(self, state, input_datablock, params):
+        try:
+            async with state.running:
+                loop = asyncio.get_running_loop()
+                self.counters["evaluations"] += 1
+                if self._share_datablocks:
+                    manifest = self._manifest(input_datablock)
+                    return await loop.run_in_executor(self.executor, _run_shared,
+                                                      self.calculator, manifest, params)
+                return await loop.run_in_executor(self.executor, self.calculator,
+                                                  input_datablock, params)
+        finally:
+            state.pending.release()
+
+    def _manifest(self, input_datablock):
+        """Publishes a datablock in shared memory the first time its contents
+        are used, and returns its manifest"""
+        from fingerprint import fingerprint_datablock
+        from shared_datablock import SharedDatablock
+
+        key = fingerprint_datablock(input_datablock)
+        shared = self._shared.get(key)
+        if shared is None:
+            shared = SharedDatablock(input_datablock)
+            self._shared[key] = shared
+        return shared.manifest
+
+    async def run(self, input_datablock, params):
+        """Evaluates the calculator for a parameter set.
+
+        Parameters
+        ----------
+        input_datablock : dict
+            Datablock as passed to run_calculator. It must not be modified
+            while evaluations are in flight.
+        params : dict
+            Scenario parameters.
+
+        Returns
+        -------
+        z_val : tuple
+            run_calculator outputs.
+        """
+
+        state = self._state()
+        key = (id(input_datablock), params_key(params))
+        self.counters["requests"] += 1
+
+        task = state.inflight.get(key)
+        if task is None:
+            await state.pending.acquire()
+            # Another caller may have started the same evaluation while this
+            # one was waiting for a pending slot
+            task = state.inflight.get(key)
+            if task is None:
+                task = asyncio.ensure_future(self._evaluate(state, input_datablock, params))
+                state.inflight[key] = task
+                task.add_done_callback(lambda _: state.inflight.pop(key, None))
+            else:
+                state.pending.release()
+                self.counters["coalesced"] += 1
+        else:
+            self.counters["coalesced"] += 1
+
+        # Cancelling one caller must not cancel the shared evaluation
+        return await asyncio.shield(task)
+
+    async def run_many(self, input_datablock, params_list):
+        """Evaluates a list of parameter sets concurrently. Results are
+        returned in the same order as params_list."""
+        return await asyncio.gather(*[self.run(input_datablock, params)
+                                      for params in params_list])
+
+    def shutdown(self, wait=True):
+        """Shuts down the executor, if it was created by this instance, and
+        releases the shared datablocks"""
+        if self._own_executor:
+            self.executor.shutdown(wait=wait)
+        for shared in self._shared.values():
+            shared.close()
+        self._shared.clear()
+
+
+_default_calculator = None
+
+def default_calculator():
+    """Returns the AsyncCalculator shared by arun_calculator and arun_many"""
+    global _default_calculator
+    if _default_calculator is None:
+        _default_calculator = AsyncCalculator()
+    return _default_calculator
+
+async def arun_calculator(input_datablock, params, calculator=None):
+    """Asynchronous version of run_calculator.
+
+    Parameters
+    ----------
+    input_datablock : dict
+        Datablock as passed to run_calculator.
+    params : dict
+        Scenario parameters.
+    calculator : AsyncCalculator, optional
+        Calculator to use. The shared default calculator is used if not
+        provided.
+    """
+    if calculator is None:
+        calculator = default_calculator()
+    return await calculator.run(input_datablock, params)
+
+async def arun_many(input_datablock, params_list, calculator=None):
+    """Evaluates a list of parameter sets concurrently, deduplicating
+    identical ones. Results are returned in the same order as params_list."""
+    if calculator is None:
+        calculator = default_calculator()
+    return await calculator.run_many(input_datablock, params_list)
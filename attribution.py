@@ -0,0 +1,136 @@
+"""Attribution of a scenario's outputs to its levers.
+
+The change in the calculator outputs between the baseline and a scenario is
+attributed to groups of levers in three ways:
+
+- one at a time: the change when only the group is moved to its scenario
+  value, with every other lever at its baseline value.
+- leave one out: the change lost when only the group is moved back to its
+  baseline value, with every other lever at its scenario value.
+- Shapley: the change averaged over every order in which the groups can be
+  moved from the baseline to the scenario. Shapley contributions add up to
+  the total change, but need 2**n evaluations for n groups.
+
+All the points needed are collected first and evaluated as one
+deduplicated batch, reusing the evaluations already in the cache of the
+objective wrapper, such as those of the optimisation that found the scenario.
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+def _lever_groups(names_x, x, x_base, groups):
+    """Returns the group names and a (group, lever) membership matrix"""
+
+    if groups is None:
+        groups = {n: [n] for n, xi, bi in zip(names_x, x, x_base) if xi != bi}
+
+    membership = np.zeros((len(groups), len(names_x)), dtype=bool)
+    for i, levers in enumerate(groups.values()):
+        unknown = set(levers) - set(names_x)
+        if unknown:
+            raise ValueError(f"Levers {sorted(unknown)} are not varied parameters")
+        membership[i] = np.isin(names_x, levers)
+
+    if np.any(membership.sum(axis=0) > 1):
+        raise ValueError("Lever groups must not overlap")
+
+    return list(groups), membership
+
+def attribute(ffc_wrapper, x, x_base=None, groups=None, shapley=False,
+              max_shapley_groups=10, calculator=None):
+    """Attributes the change in the outputs of a scenario to lever groups.
+
+    Parameters
+    ----------
+    ffc_wrapper : FFCObjectWithCache.FFCObjectiveWithCache
+        Objective wrapper of the scenario. Its cache is used and filled.
+    x : array_like
+        Scenario values of the levers in ffc_wrapper.names_x.
+    x_base : array_like, optional
+        Baseline values of the levers. Defaults to the values in the wrapper
+        default parameters.
+    groups : dict, optional
+        Group name -> list of levers. Levers not in any group are kept at
+        their baseline value. Defaults to one group for each lever changed by
+        the scenario.
+    shapley : bool, optional
+        Also compute Shapley contributions.
+    max_shapley_groups : int, optional
+        Maximum number of groups for Shapley contributions.
+    calculator : callable, optional
+        Batch calculator passed to ffc_wrapper.calculate_many.
+
+    Returns
+    -------
+    attribution : dict
+        "baseline" and "scenario" outputs as pandas Series, "one_at_a_time",
+        "leave_one_out" and, if requested, "shapley" contributions as pandas
+        DataFrames with one row per group and one column per output, and the
+        number of new "evaluations".
+    """
+
+    names_x = ffc_wrapper.names_x
+    z_names = ffc_wrapper.z_names
+
+    x = np.asarray(x, dtype=float)
+    if x_base is None:
+        x_base = [ffc_wrapper.params_default[n] for n in names_x]
+    x_base = np.asarray(x_base, dtype=float)
+
+    group_names, membership = _lever_groups(names_x, x, x_base, groups)
+    n = len(group_names)
+
+    if shapley and n > max_shapley_groups:
+        raise ValueError(f"Shapley contributions over {n} groups need {2**n} evaluations, "
+                         f"more than allowed by max_shapley_groups={max_shapley_groups}")
+
+    # Points are identified by the bit mask of the groups at their scenario
+    # value
+    full = 2**n - 1
+    if shapley:
+        masks = list(range(2**n))
+    else:
+        bits = [1 << i for i in range(n)]
+        masks = list(dict.fromkeys([0, full] + bits + [full ^ b for b in bits]))
+
+    def point(mask):
+        active = np.array([(mask >> i) & 1 for i in range(n)], dtype=bool)
+        use = membership[active].any(axis=0)
+        return np.where(use, x, x_base).tolist()
+
+    n_cached = len(ffc_wrapper._cache)
+    z_dicts = ffc_wrapper.calculate_many([point(m) for m in masks], calculator=calculator)
+    evaluations = len(ffc_wrapper._cache) - n_cached
+
+    values = {m: np.array([float(z[zn]) for zn in z_names]) for m, z in zip(masks, z_dicts)}
+
+    base = values[0]
+    scenario = values[full]
+
+    one_at_a_time = np.array([values[1 << i] - base for i in range(n)]).reshape(n, len(z_names))
+    leave_one_out = np.array([scenario - values[full ^ (1 << i)] for i in range(n)]).reshape(n, len(z_names))
+
+    attribution = {"baseline": pd.Series(base, index=z_names),
+                   "scenario": pd.Series(scenario, index=z_names),
+                   "one_at_a_time": pd.DataFrame(one_at_a_time, index=group_names, columns=z_names),
+                   "leave_one_out": pd.DataFrame(leave_one_out, index=group_names, columns=z_names),
+                   "evaluations": evaluations}
+
+    if shapley:
+        V = np.array([values[m] for m in range(2**n)])
+        sizes = np.array([bin(m).count("1") for m in range(2**n)])
+        weights = np.array([math.factorial(k) * math.factorial(n - k - 1) / math.factorial(n)
+                            for k in range(n)])
+
+        contributions = np.zeros((n, len(z_names)))
+        for i in range(n):
+            without = np.array([m for m in range(2**n) if not (m >> i) & 1], dtype=int)
+            marginal = V[without | (1 << i)] - V[without]
+            contributions[i] = weights[sizes[without]] @ marginal
+
+        attribution["shapley"] = pd.DataFrame(contributions, index=group_names, columns=z_names)
+
+    return attribution
@@ -0,0 +1,446 @@
+"""Long-running local calculator service.
+
+Keeps a warm datablock in memory and serves calculator evaluations over HTTP,
+either on a local TCP port or on a Unix socket. Concurrent requests are
+coalesced into micro-batches, and recent results are cached so repeated
+slider positions return immediately.
+
+The calculator has no vectorised path over scenarios: each distinct scenario
+is still one run_calculator evaluation. What batching buys is that identical
+requests in a batch are evaluated once, and that the distinct scenarios of a
+batch are spread over the worker processes of a parallel_batch.BatchPool, so
+with --workers N up to N scenarios are evaluated at the same time. With a
+single worker, batches are evaluated one scenario after another, and only
+the deduplication and the cache save work.
+
+Endpoints
+---------
+POST /run       {"params": {...}}              -> {"z": {...}, "latency_ms": ...}
+POST /run_many  {"scenarios": [{...}, ...]}    -> {"z": [{...}, ...], "latency_ms": ...}
+GET  /metrics                                  -> latency and throughput metrics
+GET  /health                                   -> {"status": "ok"}
+
+Parameters passed in a request override the service default parameters.
+
+Usage
+-----
+python calculator_service.py --port 8765 --workers 4
+python calculator_service.py --socket /tmp/ffc_calculator.sock
+"""
+
+import json
+import queue
+import socketserver
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pipeline_setup import Z_NAMES, params_key
+
+def _check_results(results, n):
+    """Returns the results of a batch evaluation as a list, checking there is
+    one result for each of the n parameter sets"""
+
+    results = list(results)
+    if len(results) != n:
+        raise ValueError(f"The calculator returned {len(results)} results for {n} parameter sets")
+
+    return results
+
+class MicroBatcher:
+    """Coalesces concurrent calculator requests into micro-batches.
+
+    Requests are collected until max_batch_size distinct parameter sets are
+    waiting or max_wait seconds have passed since the first one arrived. The
+    batch is then deduplicated, served from the result cache where possible,
+    and the rest is evaluated with a single call to evaluate_batch.
+
+    Parameters
+    ----------
+    evaluate_batch : callable
+        Function taking a list of parameter dicts and returning a list of
+        results in the same order.
+    max_batch_size : int, optional
+        Maximum number of distinct parameter sets per batch.
+    max_wait : float, optional
+        Maximum time, in seconds, to wait for more requests before a batch is
+        evaluated.
+    cache_size : int, optional
+        Number of results kept in the least recently used result cache.
+    latency_window : int, optional
+        Number of recent requests used to compute latency percentiles.
+    """
+
+    def __init__(self, evaluate_batch, max_batch_size=16, max_wait=0.005,
+                 cache_size=1024, latency_window=1000):
+        self.evaluate_batch = evaluate_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.cache_size = cache_size
+
+        self._queue = queue.Queue()
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._start_time = time.perf_counter()
+        self._latencies = deque(maxlen=latency_window)
+        self._counters = {"requests": 0,
+                          "cache_hits": 0,
+                          "batches": 0,
+                          "evaluations": 0,
+                          "errors": 0}
+
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, params):
+        """Queues a parameter set for evaluation and returns a Future"""
+
+        future = Future()
+        key = params_key(params)
+
+        with self._lock:
+            self._counters["requests"] += 1
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self._counters["cache_hits"] += 1
+                future.set_result(self._cache[key])
+                self._latencies.append(0.0)
+                return future
+
+        self._queue.put((key, params, future, time.perf_counter()))
+        return future
+
+    def _collect(self):
+        """Blocks until a request arrives, then gathers a batch"""
+
+        batch = [self._queue.get()]
+        keys = {batch[0][0]}
+        deadline = time.perf_counter() + self.max_wait
+
+        while len(keys) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(request)
+            keys.add(request[0])
+
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._process(batch)
+            except Exception as exc:
+                # An unexpected failure must neither stop the worker thread nor
+                # leave the requests of the batch waiting forever
+                with self._lock:
+                    self._counters["errors"] += sum(not future.done() for _, _, future, _ in batch)
+                for _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+
+    def _process(self, batch):
+        """Evaluates a batch of requests and resolves their futures"""
+
+        # Deduplicate identical requests within the batch
+        unique = OrderedDict()
+        for key, params, _, _ in batch:
+            unique.setdefault(key, params)
+
+        results, errors = self._evaluate(unique)
+
+        now = time.perf_counter()
+        with self._lock:
+            self._counters["batches"] += 1
+            self._counters["evaluations"] += len(unique)
+            for key, result in results.items():
+                self._cache[key] = result
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+            for key, _, future, t_submit in batch:
+                self._latencies.append(now - t_submit)
+                if key in errors:
+                    self._counters["errors"] += 1
+
+        for key, _, future, _ in batch:
+            if key in errors:
+                future.set_exception(errors[key])
+            else:
+                future.set_result(results[key])
+
+    def _evaluate(self, unique):
+        """Evaluates the distinct parameter sets of a batch. If the batch
+        fails, its parameter sets are evaluated one at a time, so an error only
+        reaches the requests for the parameter set that caused it.
+
+        Returns
+        -------
+        results, errors : dict
+            Results and exceptions, keyed by parameter key.
+        """
+
+        try:
+            results = _check_results(self.evaluate_batch(list(unique.values())), len(unique))
+            return dict(zip(unique.keys(), results)), {}
+        except Exception as exc:
+            if len(unique) == 1:
+                return {}, {next(iter(unique)): exc}
+
+        results = {}
+        errors = {}
+        for key, params in unique.items():
+            try:
+                results[key] = _check_results(self.evaluate_batch([params]), 1)[0]
+            except Exception as exc:
+                errors[key] = exc
+
+        return results, errors
+
+    def metrics(self):
+        """Returns a dictionary with request counters, latency percentiles in
+        milliseconds and throughput in requests per second"""
+
+        with self._lock:
+            counters = dict(self._counters)
+            latencies = sorted(self._latencies)
+
+        uptime = time.perf_counter() - self._start_time
+
+        def percentile(q):
+            if not latencies:
+                return None
+            return 1000 * latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+        metrics = counters
+        metrics["uptime_s"] = uptime
+        metrics["throughput_rps"] = counters["requests"] / uptime if uptime > 0 else 0.0
+        metrics["mean_batch_size"] = counters["evaluations"] / counters["batches"] if counters["batches"] else 0.0
+        metrics["latency_ms_mean"] = 1000 * sum(latencies) / len(latencies) if latencies else None
+        metrics["latency_ms_p50"] = percentile(0.50)
+        metrics["latency_ms_p95"] = percentile(0.95)
+        metrics["latency_ms_max"] = 1000 * latencies[-1] if latencies else None
+        metrics["queue_length"] = self._queue.qsize()
+
+        return metrics
+
+
+class CalculatorService:
+    """Calculator with a warm datablock, shared by all the service requests.
+
+    Parameters
+    ----------
+    datablock : dict
+        Datablock returned by datablock_setup, already including any fixed
+        parameters.
+    params_default : dict
+        Default scenario parameters. Request parameters override these.
+    calculator : callable, optional
+        Batch calculator with the signature of run_calculator_batch. Can be
+        replaced by a stub to test the service offline. Defaults to a
+        parallel_batch.BatchPool with the given number of workers.
+    workers : int, optional
+        Worker processes of the default calculator.
+    **batcher_kwargs
+        Passed to MicroBatcher.
+    """
+
+    def __init__(self, datablock, params_default, calculator=None, workers=1,
+                 **batcher_kwargs):
+        self.datablock = datablock
+        self.params_default = params_default
+
+        self._pool = None
+        if calculator is None:
+            from parallel_batch import BatchPool
+
+            self._pool = BatchPool(datablock, workers=workers)
+            calculator = self._pool
+
+        self.calculator = calculator
+        self.batcher = MicroBatcher(self._evaluate_batch, **batcher_kwargs)
+
+        # Batches of up to one scenario per worker keep every worker busy
+        if self._pool is not None and "max_batch_size" not in batcher_kwargs:
+            self.batcher.max_batch_size = max(self.batcher.max_batch_size, workers)
+
+    def _evaluate_batch(self, params_list):
+        return self.calculator(self.datablock, params_list)
+
+    def _full_params(self, params):
+        full = self.params_default.copy()
+        full.update(params)
+        return full
+
+    def submit(self, params):
+        """Queues a scenario and returns a Future with its z outputs"""
+        return self.batcher.submit(self._full_params(params))
+
+    def run(self, params, timeout=None):
+        """Evaluates a scenario and returns its z outputs as a dictionary"""
+        z_val = self.submit(params).result(timeout=timeout)
+        return {zn: float(zv) for zn, zv in zip(Z_NAMES, z_val)}
+
+    def run_many(self, scenarios, timeout=None):
+        """Evaluates a list of scenarios, which are batched together"""
+        futures = [self.submit(params) for params in scenarios]
+        return [{zn: float(zv) for zn, zv in zip(Z_NAMES, f.result(timeout=timeout))}
+                for f in futures]
+
+    def metrics(self):
+        return self.batcher.metrics()
+
+    def close(self):
+        """Stops the worker processes of the default calculator"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+
+    service = None
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return str(self.client_address[0]) if self.client_address else "local"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json({"status": "ok"})
+        elif self.path == "/metrics":
+            self._send_json(self.service.metrics())
+        else:
+            self._send_json({"error": f"Unknown endpoint {self.path}"}, status=404)
+
+    def do_POST(self):
+        t_start = time.perf_counter()
+        try:
+            request = self._read_json()
+            if self.path == "/run":
+                z = self.service.run(request.get("params", {}))
+            elif self.path == "/run_many":
+                z = self.service.run_many(request.get("scenarios", []))
+            else:
+                self._send_json({"error": f"Unknown endpoint {self.path}"}, status=404)
+                return
+        except Exception as exc:
+            self._send_json({"error": f"{type(exc).__name__}: {exc}"}, status=500)
+            return
+
+        self._send_json({"z": z, "latency_ms": 1000 * (time.perf_counter() - t_start)})
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service, host="127.0.0.1", port=8765, unix_socket=None, verbose=False):
+    """Creates an HTTP server for a CalculatorService.
+
+    Parameters
+    ----------
+    service : CalculatorService
+        Service handling the requests.
+    host, port : str, int, optional
+        Local address to listen on. Use port 0 to pick a free port.
+    unix_socket : str, optional
+        If provided, listen on this Unix socket path instead of a TCP port.
+    verbose : bool, optional
+        Log every request.
+
+    Returns
+    -------
+    server : socketserver.BaseServer
+        Call serve_forever() to start serving, and shutdown() to stop.
+    """
+
+    handler = type("RequestHandler", (_RequestHandler,), {"service": service})
+
+    if unix_socket is not None:
+        server = _UnixHTTPServer(unix_socket, handler)
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        server.daemon_threads = True
+
+    server.verbose = verbose
+    return server
+
+
+def main():
+    import argparse
+    import os
+    from datablock_setup import datablock_setup
+    from pipeline_setup import set_baseline_scenario
+    from sheet_snapshots import load_sheet
+
+    parser = argparse.ArgumentParser(description="Local calculator service with a warm datablock")
+    parser.add_argument('--host', type=str, default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--socket', type=str, help='Serve on a Unix socket instead of a TCP port', default=None)
+    parser.add_argument('--settings', type=str, help='Advanced settings URL, CSV snapshot or snapshot directory', default=None)
+    parser.add_argument('--adv_set', nargs=2, action='append', metavar=('KEY', 'VALUE'), default=[])
+    parser.add_argument('--workers', type=int, help='Worker processes evaluating the scenarios of each batch', default=1)
+    parser.add_argument('--max_batch_size', type=int, default=16)
+    parser.add_argument('--max_wait_ms', type=float, default=5.0)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    adv_set_dict = load_sheet("settings", args.settings)
+    adv_set_dict.update({k: float(v) for k, v in args.adv_set})
+    params_default = set_baseline_scenario(adv_set_dict)
+
+    print("Setting up datablock...")
+    datablock = datablock_setup()
+    datablock.update(params_default)
+
+    service = CalculatorService(datablock, params_default,
+                                workers=args.workers,
+                                max_batch_size=args.max_batch_size,
+                                max_wait=args.max_wait_ms / 1000)
+
+    if args.socket is not None and os.path.exists(args.socket):
+        os.remove(args.socket)
+
+    server = make_server(service, args.host, args.port, args.socket, verbose=args.verbose)
+    where = args.socket if args.socket is not None else f"http://{args.host}:{server.server_address[1]}"
+    print(f"Calculator service listening on {where}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if args.socket is not None and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Checkpoint and resume for optimisation runs.
+
+The optimisers used by run_pipeline_scrip.py are deterministic, so their
+internal state does not need to be stored. Restarting them from the same
+starting point with the evaluation cache of a previous run replays the same
+sequence of evaluations from the cache, and continues from where the run was
+interrupted.
+"""
+
+import os
+import pickle
+import time
+
+CHECKPOINT_VERSION = 1
+
+def checkpoint_path(run_name):
+    """Returns the checkpoint file path for a run name"""
+    return f"{run_name}.ckpt"
+
+def is_feasible(z, thresholds):
+    """Checks a dictionary of calculator outputs against the constraint
+    thresholds.
+
+    Parameters
+    ----------
+    z : dict
+        Calculator outputs keyed by z name.
+    thresholds : dict
+        z name -> (sign, threshold) pairs. A positive sign requires the output
+        to be at least the threshold, a negative one at most the threshold.
+    """
+    return all(sign * (z[name] - threshold) >= 0
+               for name, (sign, threshold) in thresholds.items())
+
+
+class RunCheckpoint:
+    """Periodically saves the state of an optimisation run to disk.
+
+    The state holds the run configuration, the evaluation cache, the number of
+    evaluations and the best feasible point found so far. Files are written
+    atomically, so an interrupted write never corrupts the last checkpoint.
+
+    Parameters
+    ----------
+    path : str
+        Checkpoint file path.
+    config : dict
+        Run configuration needed to resume without reading the online sheets:
+        parsed arguments, parameter names, bounds, starting point and baseline
+        parameters.
+    z_name : str
+        Name of the output being optimised.
+    thresholds : dict
+        Constraint thresholds, as used by is_feasible.
+    maximize : bool, optional
+        Whether z_name is maximised or minimised.
+    every : int, optional
+        Save after this many new evaluations. Use 0 to only save on request.
+    """
+
+    def __init__(self, path, config, z_name, thresholds, maximize=True, every=10):
+        self.path = path
+        self.config = config
+        self.z_name = z_name
+        self.thresholds = thresholds
+        self.maximize = maximize
+        self.every = every
+
+        self.cache = {}
+        self.nfev = 0
+        self.best_x = None
+        self.best_z = None
+        self.finished = False
+        self._unsaved = 0
+
+    def _better(self, z):
+        if self.best_z is None:
+            return True
+        if self.maximize:
+            return z[self.z_name] > self.best_z[self.z_name]
+        return z[self.z_name] < self.best_z[self.z_name]
+
+    def update_best(self, x_tuple, z):
+        """Records x_tuple as the best point if it is feasible and improves the
+        objective"""
+        if is_feasible(z, self.thresholds) and self._better(z):
+            self.best_x = x_tuple
+            self.best_z = z
+
+    def attach(self, ffc_wrapper):
+        """Shares the evaluation cache of an FFCObjectiveWithCache instance and
+        saves a checkpoint every `every` new evaluations"""
+
+        # Entries restored from a previous checkpoint are replayed from here
+        ffc_wrapper._cache.update(self.cache)
+        self.cache = ffc_wrapper._cache
+        ffc_wrapper.on_evaluate = self.on_evaluate
+
+    def on_evaluate(self, x_tuple, z):
+        self.nfev += 1
+        self.update_best(x_tuple, z)
+        self._unsaved += 1
+        if self.every and self._unsaved >= self.every:
+            self.save()
+
+    def state(self):
+        return {"version": CHECKPOINT_VERSION,
+                "time": time.time(),
+                "config": self.config,
+                "z_name": self.z_name,
+                "thresholds": self.thresholds,
+                "maximize": self.maximize,
+                "cache": dict(self.cache),
+                "nfev": self.nfev,
+                "best_x": self.best_x,
+                "best_z": self.best_z,
+                "finished": self.finished}
+
+    def save(self, finished=None):
+        """Writes the checkpoint to disk"""
+        if finished is not None:
+            self.finished = finished
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self.state(), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+        self._unsaved = 0
+
+    @classmethod
+    def load(cls, path, every=10):
+        """Restores a checkpoint from disk"""
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+
+        if state.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported checkpoint version {state.get('version')} in {path}")
+
+        checkpoint = cls(path, state["config"], state["z_name"], state["thresholds"],
+                         maximize=state["maximize"], every=every)
+        checkpoint.cache = state["cache"]
+        checkpoint.nfev = state["nfev"]
+        checkpoint.best_x = state["best_x"]
+        checkpoint.best_z = state["best_z"]
+        checkpoint.finished = state["finished"]
+
+        return checkpoint
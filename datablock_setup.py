@@ -3,14 +3,12 @@ import xarray as xr
 import copy
 import base64
 from io import BytesIO
-import base64
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import unpad
 
-from agrifoodpy.impact.model import fbs_impacts, fair_co2_only
-from agrifoodpy.pipeline import Pipeline
+from land_pixels import valid_pixels, pixel_index, to_pixels
 
-def datablock_setup(population_projection="Medium"):
+def datablock_setup(population_projection="Medium", dtype=np.float64,
+                    sparse_land=False, land_chunks=None, land_cover_file=None,
+                    alc_file=None):
 
     """
     This function sets up the datablock for the Agrifood Calculator.
@@ -20,12 +18,30 @@ def datablock_setup(population_projection="Medium"):
     improve performance and avoid re-running the function if the data has not
     changed. It takes a single argument, population_projection, which is a
     string that specifies the population projection to use.
+
+    The optional dtype argument sets the floating point precision of the
+    returned arrays. Passing np.float32 halves the memory used by the land use
+    maps and food sheets, see cast_datablock.
+
+    If sparse_land is True, the land use maps only store the pixels with valid
+    land use data, along a 1-D "pixel" dimension. The index needed to rebuild
+    the (y, x) maps is stored in datablock["land"]["pixel_index"], see
+    land_pixels.to_map. This is off by default, as consumers that select or
+    plot the maps by their y and x coordinates need the full maps.
+
+    If land_chunks is set, the land use and ALC maps are held as dask arrays,
+    chunked in blocks of land_chunks x land_chunks grid cells (or
+    land_chunks**2 pixels for the sparse representation). Each land node then
+    evaluates its update of the maps chunk by chunk and in parallel, and
+    keeps the result in memory for the nodes after it, see
+    model.persist_land. land_cover_file and alc_file are optional paths to
+    unencrypted netCDF maps, such as higher resolution grids, which are then
+    opened lazily instead of being read into memory.
     """
 
+    from agrifoodpy.impact.model import fbs_impacts
     from agrifoodpy_data.food import FAOSTAT, Nutrients_FAOSTAT
     from agrifoodpy_data.impact import PN18_FAOSTAT, UKNDC_FAOSTAT
-    from agrifoodpy_data.population import UN
-    from agrifoodpy_data.land import NaturalEngland_ALC_1000 as ALC
 
     datablock = {}
     datablock["food"] = {}
@@ -49,14 +65,9 @@ def datablock_setup(population_projection="Medium"):
     # Select population data from UN
     # ------------------------------
 
-    pop = UN.Medium.sel(Region=[area_pop, area_pop_world], Year=years, Datatype="Total")*1000
-    # pop_proj = UN[st.session_state["population_projection"]].sel(Region=[area_pop, area_pop_world], Year=years, Datatype="Total")*1000
-    pop_proj = UN[population_projection].sel(Region=[area_pop, area_pop_world], Year=years, Datatype="Total")*1000
-
-    years_with_data = pop_proj.where(np.isfinite(pop_proj), drop=True).Year.values
-    years_to_fill = np.setdiff1d(years, years_with_data)
-    
-    pop_proj.loc[{"Year":years_to_fill}] = pop.sel(Year=years_to_fill)
+    # The Medium variant is loaded once, and reused to fill the projection
+    pop = load_population("Medium")
+    pop_proj = load_population(population_projection, medium=pop)
 
     datablock["population"]["population"] = pop_proj
 
@@ -165,23 +176,53 @@ def datablock_setup(population_projection="Medium"):
     # Land use data
     # -------------------------------
 
-    # Get AES key & IV from secrets
-    AES_KEY = base64.b64decode("U19QNaXcSDjtC2h1SxfPsjCRR7bb06ufu2F571Y31so=")
-    AES_IV = base64.b64decode("RTtcrRl2g/c4AQ9VxYTdeA==")
-    with open("UKCEH_LC_target_percentage.bin", "rb") as f:
-        encrypted_data = f.read()
+    map_chunks = {"y": land_chunks, "x": land_chunks} if land_chunks is not None else None
+
+    if land_cover_file is not None:
+        LC = xr.open_dataarray(land_cover_file, chunks=map_chunks)
+    else:
+        from Crypto.Cipher import AES
+        from Crypto.Util.Padding import unpad
+
+        # Get AES key & IV from secrets
+        AES_KEY = base64.b64decode("U19QNaXcSDjtC2h1SxfPsjCRR7bb06ufu2F571Y31so=")
+        AES_IV = base64.b64decode("RTtcrRl2g/c4AQ9VxYTdeA==")
+        with open("UKCEH_LC_target_percentage.bin", "rb") as f:
+            encrypted_data = f.read()
 
-    # Decrypt the dataset
-    cipher = AES.new(AES_KEY, AES.MODE_CBC, AES_IV)
-    decrypted_data = unpad(cipher.decrypt(encrypted_data), AES.block_size)
-    LC = xr.open_dataarray(BytesIO(decrypted_data))
+        # Decrypt the dataset
+        cipher = AES.new(AES_KEY, AES.MODE_CBC, AES_IV)
+        decrypted_data = unpad(cipher.decrypt(encrypted_data), AES.block_size)
+        LC = xr.open_dataarray(BytesIO(decrypted_data))
+
+    if alc_file is not None:
+        ALC = xr.open_dataset(alc_file, chunks=map_chunks)
+    else:
+        from agrifoodpy_data.land import NaturalEngland_ALC_1000 as ALC
+
+    if map_chunks is not None:
+        LC = LC.chunk(map_chunks)
+        ALC = ALC.chunk(map_chunks)
 
     # Make sure the land use data and ALC data have the same coordinate base
     ALC, LC = xr.align(ALC, LC, join="outer")
 
+    ALC_grade = ALC.grade
+
+    # Drop the pixels outside the land use map (sea, outside the UK)
+    if sparse_land:
+        index = pixel_index(valid_pixels(LC))
+        LC = to_pixels(LC, index)
+        ALC_grade = to_pixels(ALC_grade, index)
+        datablock["land"]["pixel_index"] = index
+
+        if land_chunks is not None:
+            LC = LC.chunk({"pixel": land_chunks**2})
+            ALC_grade = ALC_grade.chunk({"pixel": land_chunks**2})
+
     # datablock["land"]["percentage_land_use"] = LC.where(np.isfinite(ALC.grade))
     datablock["land"]["percentage_land_use"] = LC
-    datablock["land"]["dominant_classification"] = ALC.grade
+    datablock["land"]["dominant_classification"] = ALC_grade
 
     # -------------------------------
     # Baseline data for comparison
@@ -190,4 +231,107 @@ def datablock_setup(population_projection="Medium"):
     datablock["land"]["baseline"] = copy.deepcopy(datablock["land"]["percentage_land_use"])
     datablock["food"]["baseline"] = copy.deepcopy(datablock["food"]["g/cap/day"])
 
-    return datablock
\ No newline at end of file
+    if np.dtype(dtype) != np.float64:
+        datablock = cast_datablock(datablock, dtype)
+
+    return datablock
+
+def load_population(population_projection="Medium", dtype=np.float64, medium=None):
+    """Loads the UK and world population for a UN projection variant. Years
+    without data in the variant are filled with the Medium variant.
+
+    If the Medium variant population was already loaded with
+    load_population("Medium"), it can be passed as medium so it is not
+    loaded again. With the Medium projection, it is then returned as is."""
+
+    from agrifoodpy_data.population import UN
+
+    area_pop = 826 #UK
+    area_pop_world = 900 #WORLD
+    years = np.arange(2020, 2051)
+
+    if medium is None:
+        pop = UN.Medium.sel(Region=[area_pop, area_pop_world], Year=years, Datatype="Total")*1000
+    else:
+        pop = medium
+
+    if population_projection == "Medium":
+        pop_proj = pop
+    else:
+        pop_proj = UN[population_projection].sel(Region=[area_pop, area_pop_world], Year=years, Datatype="Total")*1000
+
+        years_with_data = pop_proj.where(np.isfinite(pop_proj), drop=True).Year.values
+        years_to_fill = np.setdiff1d(years, years_with_data)
+
+        pop_proj.loc[{"Year":years_to_fill}] = pop.sel(Year=years_to_fill)
+
+    if np.dtype(dtype) != np.float64:
+        pop_proj = pop_proj.astype(dtype)
+
+    return pop_proj
+
+def with_population(datablock, population_projection):
+    """Returns a datablock for another population projection.
+
+    Only the population entry is replaced. Food, impact and land data do not
+    depend on the projection, as the per capita baselines use the 2020
+    Medium variant population, so they are shared with the input datablock
+    instead of copied. run_calculator deep copies its input, so the shared
+    entries are never modified by a calculator run.
+    """
+
+    out = dict(datablock)
+    out["population"] = dict(datablock["population"])
+
+    dtype = datablock["population"]["population"].dtype
+    out["population"]["population"] = load_population(population_projection, dtype=dtype)
+
+    return out
+
+def datablock_variants(population_projections, **kwargs):
+    """Sets up datablocks for several population projections.
+
+    The projection invariant data is only built once, by datablock_setup with
+    the first projection, and is shared by all the returned datablocks, see
+    with_population. Keyword arguments are passed to datablock_setup.
+
+    Returns
+    -------
+    datablocks : dict
+        Population projection -> datablock.
+    """
+
+    base = datablock_setup(population_projections[0], **kwargs)
+
+    datablocks = {population_projections[0]: base}
+    for projection in population_projections[1:]:
+        datablocks[projection] = with_population(base, projection)
+
+    return datablocks
+
+def cast_datablock(datablock, dtype):
+    """Returns a copy of a datablock with every floating point xarray object
+    cast to dtype.
+
+    Integer, string and boolean arrays, as well as scalar entries, are left
+    unchanged. Totals over the land use maps are still accumulated in float64
+    by the model nodes, see model.precise_sum, and the nodes keep the food
+    sheets in the precision they are given, see model.keep_precision.
+    """
+
+    out = {}
+    for key, value in datablock.items():
+        if isinstance(value, dict):
+            out[key] = cast_datablock(value, dtype)
+        elif isinstance(value, xr.DataArray):
+            out[key] = value.astype(dtype) if np.issubdtype(value.dtype, np.floating) else value
+        elif isinstance(value, xr.Dataset):
+            value = value.copy()
+            for name, var in value.data_vars.items():
+                if np.issubdtype(var.dtype, np.floating):
+                    value[name] = var.astype(dtype)
+            out[key] = value
+        else:
+            out[key] = value
+
+    return out
\ No newline at end of file
@@ -0,0 +1,198 @@
+"""Batched FaIR temperature response for sweeps of emission scenarios.
+
+compute_t_anomaly runs agrifoodpy's fair_co2_only once per emission series,
+and most of each call is spent setting up the FaIR model. Here the same CO2
+only configuration is set up once with a scenario axis, and FaIR runs all the
+scenarios at once, vectorised over that axis.
+"""
+
+import functools
+import threading
+
+import numpy as np
+import xarray as xr
+
+from pipeline_setup import run_calculator_batch, Z_NAMES
+
+def fair_co2_only_batch(emissions, scenario_dim="Scenario", chunk_size=None):
+    """CO2 only FaIR response for many emission series at once.
+
+    Uses the configuration set up by agrifoodpy.impact.model.fair_co2_only,
+    read from the FaIR instance it creates: a clean atmosphere, the
+    myhre1998 greenhouse gas method and default climate parameters.
+
+    Parameters
+    ----------
+    emissions : xarray.DataArray
+        Emissions in Gt CO2e per year, with a "Year" dimension of consecutive
+        years and a scenario dimension. Arrays without the scenario dimension
+        are treated as a single scenario.
+    scenario_dim : str, optional
+        Name of the scenario dimension.
+    chunk_size : int, optional
+        Maximum number of scenarios run by a single FaIR instance. If not
+        provided, all scenarios are run together.
+
+    Returns
+    -------
+    T : xarray.DataArray
+        Temperature anomaly in Kelvin degrees at the zero layer.
+    C : xarray.DataArray
+        Atmospheric CO2 concentration in ppm.
+    F : xarray.DataArray
+        Effective radiative forcing in W m^-2.
+        All with dimensions (scenario_dim, "timebounds").
+    """
+
+    if scenario_dim not in emissions.dims:
+        emissions = emissions.expand_dims({scenario_dim: [0]})
+
+    emissions = emissions.transpose(scenario_dim, "Year")
+
+    years = emissions.Year.values
+    if len(years) < 2 or np.any(np.diff(years) != 1):
+        raise ValueError("FaIR needs emissions for consecutive years")
+
+    n_scenarios = emissions.sizes[scenario_dim]
+    if chunk_size is None:
+        chunk_size = n_scenarios
+
+    outputs = [_run_fair(emissions.values[start:start+chunk_size], years)
+               for start in range(0, n_scenarios, chunk_size)]
+
+    T, C, F = [xr.concat(out, dim="scenario") for out in zip(*outputs)]
+
+    scenario_coord = {scenario_dim: emissions[scenario_dim].values}
+    return tuple(da.rename({"scenario": scenario_dim})
+                   .assign_coords(scenario_coord)
+                   .transpose(scenario_dim, "timebounds")
+                 for da in (T, C, F))
+
+# State variables set to their initial conditions at the first timebound
+_INITIAL_STATE = ["concentration", "forcing", "temperature",
+                  "cumulative_emissions", "airborne_emissions"]
+
+# Serialises the replacement of fair.FAIR while the reference is set up
+_fair_lock = threading.Lock()
+
+@functools.lru_cache(maxsize=None)
+def _reference_fair():
+    """Returns the FaIR instance set up by agrifoodpy's fair_co2_only.
+
+    fair_co2_only builds its configuration inside the function, so it is run
+    on two years of zero emissions with FAIR replaced by a subclass that
+    keeps its instances, and the configuration is read from the instance.
+    """
+
+    import fair
+    from agrifoodpy.impact.model import fair_co2_only
+
+    instances = []
+
+    class RecordingFAIR(fair.FAIR):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            instances.append(self)
+
+    emissions = xr.DataArray(np.zeros(2), dims="Year", coords={"Year": [2020, 2021]})
+
+    with _fair_lock:
+        original = fair.FAIR
+        fair.FAIR = RecordingFAIR
+        try:
+            fair_co2_only(emissions)
+        finally:
+            fair.FAIR = original
+
+    return instances[0]
+
+def _run_fair(emissions, years):
+    """Runs FaIR for an array of emissions with shape (scenario, year), with
+    the configuration of fair_co2_only"""
+
+    from fair import FAIR
+
+    reference = _reference_fair()
+
+    f = FAIR()
+
+    # Same method, configs and species, with one scenario per emission series
+    f.ghg_method = reference.ghg_method
+    f.define_time(years[0]-0.5, years[-1]+0.5, 1)
+    f.define_scenarios([str(i) for i in range(len(emissions))])
+    f.define_configs(reference.configs)
+    f.define_species(reference.species, reference.properties)
+    f.allocate()
+
+    # Same climate and species parameters
+    for name, da in reference.climate_configs.items():
+        f.climate_configs[name].data[...] = da.data
+    f.fill_species_configs()
+    for name, da in reference.species_configs.items():
+        f.species_configs[name].data[...] = da.data
+
+    # Same initial conditions for every scenario
+    for name in _INITIAL_STATE:
+        getattr(f, name).data[0] = getattr(reference, name).data[0]
+
+    # Emissions are stored as (timepoints, scenario)
+    config = reference.configs[0]
+    f.emissions.loc[{"specie": "CO2", "config": config}] = emissions.T
+
+    f.run(progress=False)
+
+    T = f.temperature.sel(config=config, layer=0).drop_vars(["config", "layer"])
+    C = f.concentration.sel(config=config, specie="CO2").drop_vars(["config", "specie"])
+    F = f.forcing.sel(config=config, specie="CO2").drop_vars(["config", "specie"])
+
+    return T.drop_vars("scenario"), C.drop_vars("scenario"), F.drop_vars("scenario")
+
+def temperature_sweep(datablock, scenarios, chunk_size=None, calculator=None):
+    """Runs the calculator for a list of scenarios and computes their
+    temperature response with a single batched FaIR run.
+
+    Scenarios are always evaluated over the full trajectory, as FaIR needs
+    the emissions of every year.
+
+    Parameters
+    ----------
+    datablock : dict
+        Datablock, as returned by datablock_setup.
+    scenarios : list of dict
+        Parameter sets to evaluate.
+    chunk_size : int, optional
+        Maximum number of scenarios run by a single FaIR instance.
+    calculator : callable, optional
+        Batch calculator taking the datablock, the list of parameter sets and
+        the endpoint_years and outputs keywords of run_calculator, such as a
+        parallel_batch.BatchPool. Defaults to run_calculator_batch.
+
+    Returns
+    -------
+    sweep : xarray.Dataset
+        Calculator outputs, yearly emissions, and temperature anomaly "T",
+        concentration "C" and forcing "F" over the FaIR "timebounds", along a
+        "Scenario" dimension.
+    """
+
+    if calculator is None:
+        calculator = run_calculator_batch
+
+    results = calculator(datablock, scenarios, endpoint_years=False,
+                         outputs=["emissions_series"])
+
+    scenario_index = np.arange(len(scenarios))
+    emissions = xr.concat([extra["emissions_series"] for _, extra in results],
+                          dim="Scenario").assign_coords(Scenario=scenario_index)
+
+    T, C, F = fair_co2_only_batch(emissions, chunk_size=chunk_size)
+
+    sweep = xr.Dataset({"emissions_series": emissions,
+                        "T": T,
+                        "C": C,
+                        "F": F})
+
+    for i, zn in enumerate(Z_NAMES):
+        sweep[zn] = ("Scenario", np.array([float(z[i]) for z, _ in results]))
+
+    return sweep
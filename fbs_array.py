@@ -0,0 +1,456 @@
+import numpy as np
+import xarray as xr
+
+# Default element used to balance a negative source, as in
+# model.check_negative_source
+_DEFAULT_FALLBACK = {"production": "imports",
+                     "imports": "production",
+                     "exports": "production"}
+
+class FBSMeta:
+    """Immutable metadata shared by all FBSArray instances built from the same
+    food balance sheet.
+
+    Parameters
+    ----------
+    elements : tuple of str
+        Names of the food balance sheet elements, in storage order.
+    items : numpy.ndarray
+        Item coordinate values.
+    years : numpy.ndarray
+        Year coordinate values.
+    coords : dict
+        Non-index coordinates (Item_name, Item_group, Item_origin, scalar
+        coordinates, ...) stored as name -> (dims, values).
+    dims : tuple of str
+        Dimension order of the DataArrays in the original Dataset.
+    attrs : dict
+        Attributes of the original Dataset.
+    """
+
+    __slots__ = ("elements", "element_index", "items", "item_index", "years",
+                 "coords", "dims", "attrs")
+
+    def __init__(self, elements, items, years, coords, dims, attrs):
+        items = np.array(items)
+        years = np.array(years)
+        items.setflags(write=False)
+        years.setflags(write=False)
+
+        frozen_coords = {}
+        for name, (cdims, values) in coords.items():
+            values = np.array(values)
+            values.setflags(write=False)
+            frozen_coords[name] = (tuple(cdims), values)
+
+        set_ = object.__setattr__
+        set_(self, "elements", tuple(elements))
+        set_(self, "element_index", {e: i for i, e in enumerate(elements)})
+        set_(self, "items", items)
+        set_(self, "item_index", {it: i for i, it in enumerate(items.tolist())})
+        set_(self, "years", years)
+        set_(self, "coords", frozen_coords)
+        set_(self, "dims", tuple(dims))
+        set_(self, "attrs", dict(attrs))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("FBSMeta is immutable")
+
+    def item_positions(self, items):
+        """Returns the positions along the Item axis for a list of items.
+
+        items can be None (all items), a scalar, a list of item codes, or a
+        (coordinate, values) tuple as accepted by model.get_items.
+        """
+        if items is None:
+            return slice(None)
+
+        if isinstance(items, tuple):
+            coord, values = items
+            if np.isscalar(values):
+                values = [values]
+            return np.flatnonzero(np.isin(self.coords[coord][1], values))
+
+        if np.isscalar(items):
+            items = [items]
+
+        try:
+            return np.array([self.item_index[it] for it in np.asarray(items).tolist()],
+                            dtype=np.intp)
+        except KeyError as err:
+            raise KeyError(f"Item {err.args[0]} not found in food balance sheet") from None
+
+
+class FBSArray:
+    """Compact array-backed food balance sheet.
+
+    Stores every element of a FoodBalanceSheet-like Dataset in a single
+    contiguous float array of shape (element, Item, Year), together with an
+    FBSMeta instance holding the coordinate labels. Metadata is shared between
+    copies, so copying an FBSArray only copies the float buffer.
+
+    Operations are applied in place and mirror the `fbs` accessor methods used
+    by the model nodes, so nodes can migrate one at a time by converting with
+    `from_xarray` and `to_xarray`.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Array of shape (element, Item, Year).
+    meta : FBSMeta
+        Shared coordinate metadata.
+    """
+
+    __slots__ = ("data", "meta")
+
+    def __init__(self, data, meta):
+        shape = (len(meta.elements), len(meta.items), len(meta.years))
+        if data.shape != shape:
+            raise ValueError(f"Data shape {data.shape} does not match metadata shape {shape}")
+        self.data = data
+        self.meta = meta
+
+    @classmethod
+    def from_xarray(cls, fbs, meta=None, copy=False):
+        """Creates an FBSArray from a FoodBalanceSheet Dataset.
+
+        If the Dataset was produced by `FBSArray.to_xarray` and has not been
+        reallocated since, the underlying buffer is reused without copying,
+        unless copy is True. Otherwise the elements are packed into a new
+        contiguous array.
+
+        Parameters
+        ----------
+        fbs : xarray.Dataset
+            Food balance sheet with "Item" and "Year" dimensions.
+        meta : FBSMeta, optional
+            Metadata to reuse. Must describe the same elements, items and years
+            as the input Dataset.
+        copy : bool, optional
+            Always return an FBSArray with its own buffer, so that in place
+            operations never modify the input Dataset.
+
+        Returns
+        -------
+        out : FBSArray
+        """
+
+        if "Year" not in fbs.dims or "Item" not in fbs.dims:
+            raise ValueError("Food balance sheet must have 'Item' and 'Year' dimensions")
+
+        elements = list(fbs.data_vars)
+        for element in elements:
+            if set(fbs[element].dims) != {"Item", "Year"}:
+                raise ValueError(f"Element {element} must have exactly 'Item' and 'Year' dimensions")
+
+        if meta is None:
+            coords = {name: (coord.dims, coord.values)
+                      for name, coord in fbs.coords.items()
+                      if name not in fbs.dims}
+            meta = FBSMeta(elements=elements,
+                           items=fbs.Item.values,
+                           years=fbs.Year.values,
+                           coords=coords,
+                           dims=fbs[elements[0]].dims,
+                           attrs=fbs.attrs)
+
+        arrays = [fbs[element].transpose("Item", "Year").data for element in elements]
+
+        data = _shared_base(arrays)
+        if data is not None and copy:
+            data = data.copy()
+        if data is None:
+            dtype = np.result_type(*arrays)
+            if not np.issubdtype(dtype, np.floating):
+                dtype = np.float64
+            data = np.empty((len(elements), len(meta.items), len(meta.years)), dtype=dtype)
+            for i, arr in enumerate(arrays):
+                data[i] = arr
+
+        return cls(data, meta)
+
+    def to_xarray(self):
+        """Returns a FoodBalanceSheet Dataset whose elements are views on the
+        FBSArray buffer. No data is copied."""
+
+        order = [("Item", "Year").index(d) for d in self.meta.dims]
+        data_vars = {element: (self.meta.dims, self.data[i].transpose(order))
+                     for i, element in enumerate(self.meta.elements)}
+        coords = {"Item": self.meta.items, "Year": self.meta.years}
+        coords.update(self.meta.coords)
+
+        return xr.Dataset(data_vars, coords=coords, attrs=self.meta.attrs)
+
+    def copy(self):
+        """Returns a copy of the FBSArray sharing the same metadata"""
+        return FBSArray(self.data.copy(), self.meta)
+
+    def element(self, name):
+        """Returns a writeable (Item, Year) view of a single element"""
+        return self.data[self.meta.element_index[name]]
+
+    def _as_array(self, scale, pos):
+        """Converts a scale factor to an array broadcastable to the selected
+        (Item, Year) block.
+
+        DataArrays are aligned on their "Item" and "Year" labels. Labels not
+        present in the food balance sheet are dropped, and items or years
+        missing from the scale are left unscaled (scale factor of one).
+        """
+
+        if isinstance(scale, xr.DataArray):
+            extra = set(scale.dims) - {"Item", "Year"}
+            if extra:
+                raise ValueError(f"Scale has unsupported dimensions {extra}")
+            if "Year" in scale.dims:
+                scale = scale.reindex(Year=self.meta.years, fill_value=1.0)
+            else:
+                scale = scale.expand_dims(Year=1)
+            if "Item" in scale.dims:
+                scale = scale.reindex(Item=self.meta.items[pos], fill_value=1.0)
+            else:
+                scale = scale.expand_dims(Item=1)
+            return scale.transpose("Item", "Year").values
+
+        scale = np.asarray(scale)
+        # One dimensional arrays are interpreted as per-year factors
+        if scale.ndim == 1 and len(scale) == len(self.meta.years):
+            return scale[np.newaxis, :]
+        return scale
+
+    def scale_add(self, element_in, element_out, scale, items=None, add=True,
+                  elasticity=None):
+        """Scales item quantities of an element and adds the difference to
+        other elements, in place.
+
+        Follows the same conventions as the `fbs.scale_add` accessor method.
+
+        Parameters
+        ----------
+        element_in : str
+            Element to be scaled.
+        element_out : str or list of str
+            Destination element or elements the difference is added to.
+        scale : float, array_like or xarray.DataArray
+            Scaling factor. DataArrays are aligned on their "Item" and "Year"
+            coordinates, and items or years missing from the scale are not
+            scaled.
+        items : list, tuple, optional
+            Items to be scaled. If not provided, all items are scaled.
+        add : bool or list of bool
+            Whether to add or subtract the difference to element_out.
+        elasticity : float, float array_like, optional
+            Fraction of the difference added to each element in element_out.
+
+        Returns
+        -------
+        self : FBSArray
+        """
+
+        if np.isscalar(element_out):
+            element_out = [element_out]
+
+        if np.isscalar(add):
+            add = [add] * len(element_out)
+
+        if elasticity is None:
+            elasticity = [1.0/len(element_out)] * len(element_out)
+        elif np.isscalar(elasticity):
+            elasticity = [elasticity] * len(element_out)
+
+        pos = self.meta.item_positions(items)
+        x_in = self.element(element_in)
+
+        orig = x_in[pos]
+        new = orig * self._as_array(scale, pos)
+        dif = np.where(np.isnan(orig), 0, orig) - np.where(np.isnan(new), 0, new)
+        x_in[pos] = new
+
+        for elmnt, add_el, elast in zip(element_out, add, elasticity):
+            x_out = self.element(elmnt)
+            x_out[pos] = x_out[pos] + np.where(add_el, -1, 1)*dif*elast
+
+        return self
+
+    def check_negative_source(self, source, fallback=None, add=True):
+        """Sets negative values of the source element to zero and adds the
+        difference to the fallback element, in place.
+
+        Follows the same conventions as model.check_negative_source.
+
+        Returns
+        -------
+        self : FBSArray
+        """
+
+        if fallback is None:
+            fallback = _DEFAULT_FALLBACK.get(source)
+
+        x_src = self.element(source)
+        delta_neg = np.where(x_src < 0, x_src, 0)
+        x_src -= delta_neg
+
+        x_fb = self.element(fallback)
+        if add:
+            x_fb += delta_neg
+        else:
+            x_fb -= delta_neg
+
+        return self
+
+    def production_totals(self):
+        """Returns the total production per year of animal products, vegetal
+        products and all items, as used by feed_scale"""
+
+        production = self.element("production")
+        origin = self.meta.coords["Item_origin"][1]
+
+        return {"animal": np.nansum(production[origin == "Animal Products"], axis=0),
+                "vegetal": np.nansum(production[origin == "Vegetal Products"], axis=0),
+                "total": np.nansum(production, axis=0)}
+
+    def feed_scale(self, ref, elasticity=None, source="production"):
+        """Scales the feed, seed and processing quantities according to the
+        change in production of animal and vegetal products, in place.
+
+        Follows the same conventions as model.feed_scale.
+
+        Parameters
+        ----------
+        ref : FBSArray or dict
+            Reference food balance sheet, or its production_totals.
+        elasticity : float, optional
+            Fraction of the difference added to the source element.
+        source : str, optional
+            Element balancing the change in feed, seed and processing.
+
+        Returns
+        -------
+        self : FBSArray
+        """
+
+        if isinstance(ref, FBSArray):
+            ref = ref.production_totals()
+        totals = self.production_totals()
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            feed_scale = np.where(np.isclose(ref["animal"], 0), 1,
+                                  totals["animal"] / ref["animal"])
+            seed_scale = np.where(np.isclose(ref["vegetal"], 0), 1,
+                                  totals["vegetal"] / ref["vegetal"])
+            processing_scale = totals["total"] / ref["total"]
+
+        self.scale_add("feed", source, feed_scale.astype(self.data.dtype, copy=False),
+                       elasticity=elasticity)
+        self.scale_add("seed", source, seed_scale.astype(self.data.dtype, copy=False),
+                       elasticity=elasticity)
+        self.scale_add("processing", source, processing_scale.astype(self.data.dtype, copy=False),
+                       elasticity=elasticity)
+
+        return self
+
+
+class FBSOpChain:
+    """Records a chain of food balance sheet operations and applies them in
+    a single pass over one FBSArray buffer.
+
+    Nodes typically apply several scale_add calls, feed_scale and
+    check_negative_source to a food balance sheet, and then scale the per
+    capita quantities by the ratio between the result and the input. With the
+    `fbs` accessor every step allocates a new Dataset. A chain packs the input
+    once and applies all the element transfers in place.
+
+    Methods return the chain, so operations can be chained:
+
+    >>> chain = FBSOpChain().scale_add("food", "imports", scale) \
+    ...                     .feed_scale() \
+    ...                     .check_negative_source("imports", "exports", add=False)
+    >>> ratio = chain.ratio(food_orig)
+    """
+
+    __slots__ = ("ops",)
+
+    def __init__(self):
+        self.ops = []
+
+    def scale_add(self, element_in, element_out, scale, items=None, add=True,
+                  elasticity=None):
+        """Records an FBSArray.scale_add operation"""
+        self.ops.append(("scale_add", (element_in, element_out, scale),
+                         {"items": items, "add": add, "elasticity": elasticity}))
+        return self
+
+    def feed_scale(self, ref=None, elasticity=None, source="production"):
+        """Records an FBSArray.feed_scale operation. If ref is not provided,
+        the input of the chain is used as reference."""
+        self.ops.append(("feed_scale", (ref,), {"elasticity": elasticity, "source": source}))
+        return self
+
+    def check_negative_source(self, source, fallback=None, add=True):
+        """Records an FBSArray.check_negative_source operation"""
+        self.ops.append(("check_negative_source", (source,),
+                         {"fallback": fallback, "add": add}))
+        return self
+
+    def apply(self, fbs):
+        """Applies the recorded operations to an FBSArray, in place.
+
+        Returns
+        -------
+        fbs : FBSArray
+        """
+
+        input_totals = None
+        if any(op == "feed_scale" and args[0] is None for op, args, _ in self.ops):
+            input_totals = fbs.production_totals()
+
+        for op, args, kwargs in self.ops:
+            if op == "feed_scale":
+                ref = input_totals if args[0] is None else args[0]
+                if isinstance(ref, xr.Dataset):
+                    ref = FBSArray.from_xarray(ref)
+                fbs.feed_scale(ref, **kwargs)
+            else:
+                getattr(fbs, op)(*args, **kwargs)
+
+        return fbs
+
+    def run(self, fbs):
+        """Applies the operations to a copy of a FoodBalanceSheet Dataset and
+        returns the result as a new Dataset"""
+        return self.apply(FBSArray.from_xarray(fbs, copy=True)).to_xarray()
+
+    def ratio(self, fbs):
+        """Applies the operations to a copy of a FoodBalanceSheet Dataset and
+        returns the ratio between the result and the input, with NaN values
+        set to one, as used to rescale the per capita quantities"""
+
+        out = self.apply(FBSArray.from_xarray(fbs, copy=True))
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for i, element in enumerate(out.meta.elements):
+                orig = fbs[element].transpose("Item", "Year").values
+                np.divide(out.data[i], orig, out=out.data[i])
+        out.data[np.isnan(out.data)] = 1
+
+        return out.to_xarray()
+
+
+def _shared_base(arrays):
+    """Returns the (element, Item, Year) buffer the input element arrays are
+    views of, or None if they do not share a single contiguous buffer in
+    element order."""
+
+    base = arrays[0].base
+    if not isinstance(base, np.ndarray) or base.ndim != 3 \
+            or not base.flags.c_contiguous or base.shape[0] != len(arrays):
+        return None
+
+    start = base.__array_interface__["data"][0]
+    for i, arr in enumerate(arrays):
+        if arr.base is not base or arr.shape != base.shape[1:] \
+                or arr.strides != base.strides[1:] \
+                or arr.__array_interface__["data"][0] != start + i*base.strides[0]:
+            return None
+
+    return base
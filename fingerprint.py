@@ -0,0 +1,181 @@
+"""Content fingerprints of datablocks and parameter sets.
+
+A fingerprint is a short blake2b digest of everything that determines a
+calculator evaluation: the array buffers of the datablock, with their dtypes,
+shapes, dimension names, coordinates and attributes, and a canonical form of
+the parameters. Equal contents give equal fingerprints across processes and
+sessions, so they can key persistent and cross-process caches.
+
+Hashing a large datablock reads every buffer once. The digest of a read-only
+array is memoised, since its contents cannot change through it, so
+fingerprinting a read-only datablock again only walks its structure. Use
+freeze_datablock to make the arrays of a datablock read-only. Arrays attached
+from shared memory, see shared_datablock, already are.
+
+Usage
+-----
+key = fingerprint(datablock, params)
+"""
+
+import hashlib
+import weakref
+
+import numpy as np
+import xarray as xr
+
+DIGEST_SIZE = 16
+
+# Digests of read-only arrays, keyed by id, with a weak reference to the
+# array to tell it apart from a later array with the same id
+_array_digests = {}
+
+def _new_hash():
+    return hashlib.blake2b(digest_size=DIGEST_SIZE)
+
+def _is_frozen(arr):
+    """True if neither the array nor any array it is a view of is writable"""
+    while isinstance(arr, np.ndarray):
+        if arr.flags.writeable:
+            return False
+        arr = arr.base
+    return True
+
+def _hash_buffer(arr):
+    h = _new_hash()
+    h.update(f"{arr.dtype.str}{arr.shape}".encode())
+    if arr.dtype.hasobject:
+        h.update(repr(arr.tolist()).encode())
+    else:
+        h.update(memoryview(np.ascontiguousarray(arr)).cast("B"))
+    return h.digest()
+
+def fingerprint_array(arr):
+    """Returns the digest of a numpy array's dtype, shape and contents.
+    Digests of read-only arrays are memoised."""
+
+    if not _is_frozen(arr):
+        return _hash_buffer(arr)
+
+    key = id(arr)
+    cached = _array_digests.get(key)
+    if cached is not None and cached[0]() is arr:
+        return cached[1]
+
+    digest = _hash_buffer(arr)
+    try:
+        ref = weakref.ref(arr, lambda _, key=key: _array_digests.pop(key, None))
+    except TypeError:
+        return digest
+    _array_digests[key] = (ref, digest)
+
+    return digest
+
+def _update_data(h, data):
+    if isinstance(data, np.ndarray):
+        h.update(fingerprint_array(data))
+    elif hasattr(data, "dask"):
+        # Dask array names are deterministic tokens of their graph
+        h.update(f"dask:{data.name}".encode())
+    else:
+        h.update(fingerprint_array(np.asarray(data)))
+
+def _update_variable(h, variable):
+    h.update(repr((variable.dims, sorted(variable.attrs.items(), key=str))).encode())
+    if isinstance(variable, xr.IndexVariable):
+        h.update(fingerprint_array(variable.values))
+    else:
+        _update_data(h, variable.data)
+
+def _update(h, value):
+    """Feeds a datablock entry to a hash, recursing into dictionaries"""
+
+    if isinstance(value, dict):
+        h.update(b"dict")
+        for k in sorted(value, key=repr):
+            h.update(repr(k).encode())
+            _update(h, value[k])
+
+    elif isinstance(value, xr.DataArray):
+        h.update(f"DataArray:{value.name!r}".encode())
+        _update_variable(h, value.variable)
+        for k in sorted(value.coords, key=repr):
+            h.update(repr(k).encode())
+            _update_variable(h, value.coords[k].variable)
+
+    elif isinstance(value, xr.Dataset):
+        h.update(f"Dataset:{sorted(value.attrs.items(), key=str)!r}".encode())
+        for k in sorted(value.variables, key=repr):
+            h.update(f"{k!r}:{k in value.coords}".encode())
+            _update_variable(h, value.variables[k])
+
+    elif isinstance(value, np.ndarray):
+        h.update(b"ndarray")
+        h.update(fingerprint_array(value))
+
+    else:
+        h.update(repr(_canonical(value)).encode())
+
+def fingerprint_datablock(datablock):
+    """Returns the hex fingerprint of a datablock"""
+    h = _new_hash()
+    _update(h, datablock)
+    return h.hexdigest()
+
+def _canonical(value):
+    """Canonical form of a parameter value. Numbers are compared as floats,
+    so that 0, 0.0 and np.float32(0) are the same value."""
+
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(_canonical(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((repr(k), _canonical(v)) for k, v in value.items()))
+    return repr(value)
+
+def fingerprint_params(params):
+    """Returns the hex fingerprint of a canonicalised parameter set"""
+    canonical = sorted((str(k), _canonical(v)) for k, v in params.items())
+    return hashlib.blake2b(repr(canonical).encode(), digest_size=DIGEST_SIZE).hexdigest()
+
+def fingerprint(datablock, params=None):
+    """Returns the hex fingerprint of a datablock and, optionally, the
+    parameters it is evaluated with"""
+
+    if params is None:
+        return fingerprint_datablock(datablock)
+
+    h = _new_hash()
+    h.update(fingerprint_datablock(datablock).encode())
+    h.update(fingerprint_params(params).encode())
+    return h.hexdigest()
+
+def freeze_datablock(datablock):
+    """Makes the numpy arrays of a datablock read-only in place, so their
+    digests are memoised, and returns it. run_calculator deep copies its
+    input, so evaluations are not affected."""
+
+    def freeze(data):
+        if isinstance(data, np.ndarray):
+            data.flags.writeable = False
+
+    def visit(value):
+        if isinstance(value, dict):
+            for v in value.values():
+                visit(v)
+        elif isinstance(value, xr.Dataset):
+            for variable in value.variables.values():
+                freeze(variable.data)
+        elif isinstance(value, xr.DataArray):
+            freeze(value.variable.data)
+            for c in value.coords.values():
+                freeze(c.variable.data)
+        else:
+            freeze(value)
+
+    visit(datablock)
+    return datablock
@@ -0,0 +1,109 @@
+"""Import time benchmark for the calculator modules.
+
+Imports each module in a fresh interpreter with "python -X importtime", and
+checks the cumulative import time against a budget, together with a list of
+heavy modules which must not be loaded at import time. Exits with a non-zero
+status if any check fails, so it can guard the cold start of worker processes.
+
+Usage
+-----
+python import_benchmark.py
+python import_benchmark.py --repeat 5 --budget pipeline_setup=800
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# Module -> cumulative import time budget in milliseconds. Budgets leave room
+# for slow machines, xarray and its dependencies dominate the remaining time
+BUDGETS_MS = {"run_pipeline_scrip": 100,
+              "pipeline_setup": 1000,
+              "FFCObjectWithCache": 1000,
+              "calculator_service": 1000}
+
+# Modules only needed by specific code paths, which must not be imported by
+# the calculator modules themselves
+LAZY_MODULES = ["matplotlib", "scipy", "Crypto", "agrifoodpy", "agrifoodpy_data", "fair"]
+
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def import_profile(module, python=sys.executable):
+    """Imports a module in a fresh interpreter and returns its import profile.
+
+    Returns
+    -------
+    total_ms : float
+        Cumulative time to import the module, in milliseconds.
+    imported : dict
+        Cumulative import time in milliseconds of every module loaded, keyed by
+        module name.
+    """
+
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run([python, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True, cwd=cwd)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr}")
+
+    imported = {}
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            imported[match.group(4)] = int(match.group(2)) / 1000
+
+    return imported[module], imported
+
+def run_benchmark(budgets, lazy_modules=LAZY_MODULES, repeat=3, top=5):
+    """Checks the import time of each module against its budget.
+
+    The best of repeat runs is compared against the budget, to reduce the
+    effect of filesystem caches and machine load.
+
+    Returns
+    -------
+    ok : bool
+        True if all modules are within budget and no lazy module is imported.
+    """
+
+    ok = True
+    for module, budget in budgets.items():
+        profiles = [import_profile(module) for _ in range(repeat)]
+        total_ms, imported = min(profiles, key=lambda p: p[0])
+
+        eager = sorted({name.split(".")[0] for name in imported} & set(lazy_modules))
+        within = total_ms <= budget
+        ok = ok and within and not eager
+
+        status = "OK" if within and not eager else "FAIL"
+        print(f"{module}: {total_ms:.0f} ms (budget {budget:.0f} ms) {status}")
+        if eager:
+            print(f"    eagerly imports: {', '.join(eager)}")
+
+        slowest = sorted(((t, name) for name, t in imported.items()
+                          if "." not in name and name != module), reverse=True)
+        for t, name in slowest[:top]:
+            print(f"    {name}: {t:.0f} ms")
+
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time benchmark")
+    parser.add_argument('--repeat', type=int, help='Number of runs per module', default=3)
+    parser.add_argument('--budget', nargs='*', metavar='MODULE=MS', default=[],
+                        help='Override or add module budgets, in milliseconds')
+    args = parser.parse_args()
+
+    budgets = dict(BUDGETS_MS)
+    for item in args.budget:
+        module, ms = item.split("=")
+        budgets[module] = float(ms)
+
+    ok = run_benchmark(budgets, repeat=args.repeat)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
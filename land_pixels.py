@@ -0,0 +1,105 @@
+import numpy as np
+import xarray as xr
+
+def valid_pixels(da, spatial_dims=("y", "x")):
+    """Returns a boolean (y, x) map which is True where the input map has a
+    finite value along any of its non-spatial dimensions"""
+
+    other_dims = [d for d in da.dims if d not in spatial_dims]
+    valid = np.isfinite(da)
+    if other_dims:
+        valid = valid.any(dim=other_dims)
+
+    return valid.transpose(*spatial_dims)
+
+def pixel_index(valid, spatial_dims=("y", "x")):
+    """Builds the index used to move between (y, x) maps and the 1-D pixel
+    representation.
+
+    Parameters
+    ----------
+    valid : xarray.DataArray
+        Boolean (y, x) map of the pixels to keep.
+    spatial_dims : tuple of str, optional
+        Names of the spatial dimensions.
+
+    Returns
+    -------
+    index : xarray.Dataset
+        Dataset with "y_index" and "x_index" integer positions along a "pixel"
+        dimension, and the full y and x coordinates of the original grid.
+    """
+
+    valid = valid.transpose(*spatial_dims)
+    iy, ix = np.nonzero(np.asarray(valid.values))
+    dim_y, dim_x = spatial_dims
+
+    index = xr.Dataset({"y_index": ("pixel", iy),
+                        "x_index": ("pixel", ix)},
+                       coords={dim_y: valid[dim_y].values,
+                               dim_x: valid[dim_x].values},
+                       attrs={"spatial_dims": [dim_y, dim_x]})
+
+    return index
+
+def to_pixels(da, index):
+    """Converts a (..., y, x) map to a (..., pixel) array holding only the
+    pixels listed in index. Works on both NumPy and dask backed arrays.
+
+    Parameters
+    ----------
+    da : xarray.DataArray
+        Map with the spatial dimensions of index.
+    index : xarray.Dataset
+        Pixel index, as returned by pixel_index.
+
+    Returns
+    -------
+    out : xarray.DataArray
+        Array with the spatial dimensions replaced by a "pixel" dimension.
+    """
+
+    dim_y, dim_x = index.attrs["spatial_dims"]
+    out = da.isel({dim_y: index["y_index"], dim_x: index["x_index"]})
+    out = out.drop_vars([dim_y, dim_x, "y_index", "x_index"], errors="ignore")
+
+    return out
+
+def to_map(da, index):
+    """Rebuilds the full (..., y, x) map from a (..., pixel) array. Pixels not
+    in index are set to NaN, or to zero for non floating point arrays.
+
+    Parameters
+    ----------
+    da : xarray.DataArray
+        Array with a "pixel" dimension.
+    index : xarray.Dataset
+        Pixel index, as returned by pixel_index.
+
+    Returns
+    -------
+    out : xarray.DataArray
+        Map on the original grid.
+    """
+
+    dim_y, dim_x = index.attrs["spatial_dims"]
+    other_dims = [d for d in da.dims if d != "pixel"]
+
+    shape = [da.sizes[d] for d in other_dims] + [index.sizes[dim_y], index.sizes[dim_x]]
+    fill = np.nan if np.issubdtype(da.dtype, np.floating) else 0
+    data = np.full(shape, fill, dtype=da.dtype)
+    data[..., index["y_index"].values, index["x_index"].values] = \
+        da.transpose(*other_dims, "pixel").values
+
+    coords = {name: coord for name, coord in da.coords.items()
+              if "pixel" not in coord.dims}
+    coords[dim_y] = index[dim_y].values
+    coords[dim_x] = index[dim_x].values
+
+    return xr.DataArray(data, dims=other_dims + [dim_y, dim_x], coords=coords,
+                        name=da.name, attrs=da.attrs)
+
+def spatial_dims(da, class_dim="aggregate_class"):
+    """Returns the spatial dimensions of a land array, either ["pixel"] or the
+    map dimensions"""
+    return [d for d in da.dims if d != class_dim]
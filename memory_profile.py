@@ -0,0 +1,241 @@
+"""Memory profiling of calculator evaluations.
+
+A MemoryProfile passed to run_calculator records, for the datablock deep copy
+and for every pipeline node:
+
+- the peak traced allocation while the node runs, above the memory in use
+  when it started,
+- the net bytes retained once the node returns,
+- the size of the arrays in the datablock after the node.
+
+Allocations are traced with tracemalloc, which NumPy reports its buffers to.
+Tracing slows evaluations down, so it can be disabled to only account for the
+datablock array sizes, which is cheap but misses temporaries.
+
+An optional budget on the peak memory of an evaluation either warns or fails
+fast with a MemoryBudgetExceeded error, raised by the node that crosses it.
+
+tracemalloc is process wide, so evaluations profiled at the same time from
+several threads are not told apart.
+
+Usage
+-----
+profile = MemoryProfile(budget=2e9, on_exceed="raise")
+run_calculator(datablock, params, memory=profile)
+print(profile.report())
+"""
+
+import collections
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import xarray as xr
+
+class MemoryBudgetExceeded(MemoryError):
+    """Raised when an evaluation goes over its memory budget"""
+
+
+def datablock_nbytes(value):
+    """Returns the total size in bytes of the arrays in a datablock, or in any
+    nested dict, xarray object or array"""
+
+    if isinstance(value, dict):
+        return sum(datablock_nbytes(v) for v in value.values())
+    if isinstance(value, xr.Dataset):
+        return int(sum(v.nbytes for v in value.variables.values()))
+    if isinstance(value, xr.DataArray):
+        return int(value.variable.nbytes + sum(c.nbytes for c in value.coords.values()))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    return 0
+
+def node_names(pipeline):
+    """Returns the names of the nodes of an agrifoodpy Pipeline to record.
+
+    Nodes added without a name get the generic "Node i" from the pipeline,
+    and are named after their function instead, followed by their position
+    in the pipeline when the function is used by more than one node.
+    """
+
+    names = []
+    for i, (name, node) in enumerate(zip(pipeline.names, pipeline.nodes)):
+        if name == f"Node {i + 1}":
+            name = getattr(node, "__name__", name)
+        names.append(name)
+
+    counts = collections.Counter(names)
+    return [f"{name} ({i + 1})" if counts[name] > 1 else name
+            for i, name in enumerate(names)]
+
+def _format_bytes(n):
+    if n is None:
+        return "-"
+    for unit in ["B", "KB", "MB", "GB"]:
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+class MemoryProfile:
+    """Per node memory usage of calculator evaluations.
+
+    Parameters
+    ----------
+    budget : float, optional
+        Maximum peak memory of an evaluation in bytes, above the memory in
+        use when it started. Without tracing, the datablock size is checked.
+    on_exceed : str, optional
+        "warn" to issue a ResourceWarning, or "raise" to stop the evaluation
+        with a MemoryBudgetExceeded error.
+    trace : bool, optional
+        Trace allocations with tracemalloc. If False, only the datablock
+        sizes are recorded.
+
+    Attributes
+    ----------
+    records : list of dict
+        One record per node and evaluation, with the "evaluation" index, the
+        "node" name, "time_s", and "peak_bytes", "retained_bytes" and
+        "datablock_bytes".
+    evaluation_peaks : list
+        Peak memory of each evaluation in bytes.
+    """
+
+    def __init__(self, budget=None, on_exceed="warn", trace=True):
+
+        if on_exceed not in ("warn", "raise"):
+            raise ValueError("on_exceed must be 'warn' or 'raise'")
+
+        self.budget = budget
+        self.on_exceed = on_exceed
+        self.trace = trace
+        self.records = []
+        self.evaluation_peaks = []
+
+        self._base = None
+        self._started_tracing = False
+
+    def start(self):
+        """Starts a new evaluation"""
+
+        if self.trace:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            self._base = tracemalloc.get_traced_memory()[0]
+
+        self.evaluation_peaks.append(0)
+
+    def stop(self):
+        """Ends the current evaluation"""
+
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self._base = None
+
+    def measure(self, name, func, *args, **kwargs):
+        """Runs func(*args, **kwargs) as a node of the current evaluation and
+        returns its result"""
+
+        if self.trace:
+            tracemalloc.reset_peak()
+            current_start = tracemalloc.get_traced_memory()[0]
+
+        t_start = time.perf_counter()
+        result = func(*args, **kwargs)
+        time_s = time.perf_counter() - t_start
+
+        datablock_bytes = datablock_nbytes(result)
+
+        if self.trace:
+            current_end, peak = tracemalloc.get_traced_memory()
+            peak_bytes = peak - current_start
+            retained_bytes = current_end - current_start
+            evaluation_peak = peak - self._base
+        else:
+            peak_bytes = None
+            retained_bytes = None
+            evaluation_peak = datablock_bytes
+
+        self.records.append({"evaluation": len(self.evaluation_peaks) - 1,
+                             "node": name,
+                             "time_s": time_s,
+                             "peak_bytes": peak_bytes,
+                             "retained_bytes": retained_bytes,
+                             "datablock_bytes": datablock_bytes})
+
+        self.evaluation_peaks[-1] = max(self.evaluation_peaks[-1], evaluation_peak)
+        self._check_budget(name, evaluation_peak)
+
+        return result
+
+    def _check_budget(self, name, evaluation_peak):
+
+        if self.budget is None or evaluation_peak <= self.budget:
+            return
+
+        message = (f"Evaluation {len(self.evaluation_peaks) - 1} reached "
+                   f"{_format_bytes(evaluation_peak)} in node {name}, over the budget of "
+                   f"{_format_bytes(self.budget)}")
+
+        if self.on_exceed == "raise":
+            self.stop()
+            raise MemoryBudgetExceeded(message)
+        warnings.warn(message, ResourceWarning, stacklevel=3)
+
+    def instrument(self, pipeline):
+        """Wraps the nodes of an agrifoodpy Pipeline so they are measured when
+        the pipeline runs"""
+
+        def wrap(name, node):
+            def measured(datablock, **params):
+                return self.measure(name, node, datablock=datablock, **params)
+            return measured
+
+        pipeline.nodes = [wrap(name, node) for name, node
+                          in zip(node_names(pipeline), pipeline.nodes)]
+
+    @property
+    def peak_bytes(self):
+        """Largest peak memory over all evaluations"""
+        return max(self.evaluation_peaks, default=0)
+
+    def to_frame(self):
+        """Returns the records as a pandas DataFrame"""
+        import pandas as pd
+        return pd.DataFrame(self.records)
+
+    def summary(self):
+        """Returns the maximum peak and retained bytes, the mean time, and the
+        final datablock size of each node over all evaluations"""
+
+        records = self.to_frame()
+        summary = records.groupby("node", sort=False).agg(
+            calls=("evaluation", "size"),
+            time_s=("time_s", "mean"),
+            peak_bytes=("peak_bytes", "max"),
+            retained_bytes=("retained_bytes", "max"),
+            datablock_bytes=("datablock_bytes", "max"))
+        return summary
+
+    def report(self):
+        """Returns the per node summary as a formatted table"""
+
+        if not self.records:
+            return "No evaluations profiled"
+
+        summary = self.summary()
+        for column in ["peak_bytes", "retained_bytes", "datablock_bytes"]:
+            summary[column] = [_format_bytes(None if np.isnan(v) else v)
+                               for v in summary[column].astype(float)]
+        summary["time_s"] = summary["time_s"].map("{:.4f}".format)
+
+        lines = [f"Memory profile of {len(self.evaluation_peaks)} evaluations, "
+                 f"peak {_format_bytes(self.peak_bytes)}"
+                 + (f" (budget {_format_bytes(self.budget)})" if self.budget is not None else "")
+                 + ":",
+                 summary.to_string()]
+        return "\n".join(lines)
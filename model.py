@@ -1,11 +1,73 @@
 import xarray as xr
 import numpy as np
-from agrifoodpy.food.food import FoodBalanceSheet
-from agrifoodpy.utils.scaling import logistic_scale, linear_scale
 import warnings
 import copy
+from fbs_array import FBSArray, FBSOpChain
+from land_pixels import spatial_dims
 
-def project_future(datablock, yield_change=None):
+# Per capita daily quantities and the per gram of food factors they are
+# computed from, as (datablock key, factor location). Weight has no factor.
+PER_CAPITA_QUANTITIES = {"weight": ("g/cap/day", None),
+                         "protein": ("g_prot/cap/day", ("food", "g_prot/g_food")),
+                         "fat": ("g_fat/cap/day", ("food", "g_fat/g_food")),
+                         "energy": ("kCal/cap/day", ("food", "kCal/g_food")),
+                         "co2e": ("g_co2e/cap/day", ("impact", "gco2e/gfood"))}
+
+def per_capita_quantities(datablock, quantities=None, food=None):
+    """Computes per capita daily quantities of food as a single Dataset with a
+    Quantity dimension.
+
+    All quantities are proportional to the weight of food, so they are
+    computed at once by broadcasting the food weights against the stacked per
+    gram of food factors.
+
+    Every quantity keeps the items of the food weights. Items without a per
+    gram factor are given a factor of zero, so they add nothing to item sums,
+    as if they were dropped by joining each factor with the food weights.
+
+    Parameters
+    ----------
+    datablock : Dict
+        Dictionary containing the food weights and the per gram factors.
+    quantities : list of str, optional
+        Quantities to compute, from the keys of PER_CAPITA_QUANTITIES. If not
+        provided, all quantities are computed.
+    food : xarray.Dataset, optional
+        Per capita daily weight of food. If not provided,
+        datablock["food"]["g/cap/day"] is used.
+
+    Returns
+    -------
+    per_cap : xarray.Dataset
+        Per capita daily quantities, with a Quantity dimension.
+    """
+
+    if quantities is None:
+        quantities = list(PER_CAPITA_QUANTITIES)
+
+    if food is None:
+        food = datablock["food"]["g/cap/day"]
+
+    items = food.Item.values
+    dtype = food[list(food.data_vars)[0]].dtype
+
+    factors = []
+    for quantity in quantities:
+        location = PER_CAPITA_QUANTITIES[quantity][1]
+        if location is None:
+            factor = xr.DataArray(np.ones(len(items), dtype=dtype),
+                                  dims=["Item"], coords={"Item": items})
+        else:
+            factor = datablock[location[0]][location[1]]
+            factor = factor.reset_coords(drop=True).reindex(Item=items, fill_value=0)
+        factors.append(factor)
+
+    factors = xr.concat(factors, dim="Quantity").assign_coords(Quantity=list(quantities))
+
+    return food * factors
+
+
+def project_future(datablock, yield_change=None, years=None):
     """Project future food consumption based on scale
     
     Parameters
@@ -17,34 +79,38 @@ def project_future(datablock, yield_change=None):
         Scale to apply to food consumption
     yield_change : float
         Percentage change by the end of the projection period.
+    years : list of int, optional
+        Years to project after the baseline year. All the following nodes are
+        evaluated on these years only. If not provided, every year from 2021 to
+        2050 is projected.
 
     Returns
     -------
     datablock : Dict
         New dictionary containinng projected food consumption data
     """
-    years = np.arange(2021,2051)
+    from agrifoodpy.utils.scaling import linear_scale
+
+    years = np.arange(2021,2051) if years is None else np.asarray(years)
 
     pop = datablock["population"]["population"]
 
-    scale = pop.sel(Region=826, Year=np.arange(2021, 2051)) / \
-               pop.sel(Region=826, Year=2020)
-    
     # Per capita per day values remain constant
     g_cap_day = datablock["food"]["g/cap/day"]
-    g_prot_cap_day = datablock["food"]["g_prot/cap/day"]
-    g_fat_cap_day = datablock["food"]["g_fat/cap/day"]
-    kcal_cap_day = datablock["food"]["kCal/cap/day"]
+
+    # The scales are built in the precision of the food sheet, so reduced
+    # precision sheets are not promoted to float64
+    dtype = sheet_dtype(g_cap_day)
+
+    scale = (pop.sel(Region=826, Year=years) / \
+               pop.sel(Region=826, Year=2020)).astype(dtype)
 
     years_past = g_cap_day.Year.values
 
-    g_cap_day = g_cap_day.fbs.add_years(years, "constant")
-    g_prot_cap_day = g_prot_cap_day.fbs.add_years(years, "constant")
-    g_fat_cap_day = g_fat_cap_day.fbs.add_years(years, "constant")
-    kcal_cap_day = kcal_cap_day.fbs.add_years(years, "constant")
+    g_cap_day = keep_precision(g_cap_day.fbs.add_years(years, "constant"), dtype)
 
     # Scale food production
-    scale_past = xr.DataArray(np.ones(len(years_past)), dims=["Year"], coords={"Year": years_past})
+    scale_past = xr.DataArray(np.ones(len(years_past), dtype=dtype), dims=["Year"], coords={"Year": years_past})
     scale_tot = xr.concat([scale_past, scale], dim="Year")
 
     cereal_items = g_cap_day.sel(Item=g_cap_day.Item_group=="Cereals - Excluding Beer").Item.values
@@ -53,29 +119,29 @@ def project_future(datablock, yield_change=None):
     if yield_change is not None:
         scale_tot = scale_tot.expand_dims({"Item": g_cap_day.Item.values})
         scale_yield = xr.ones_like(scale_tot)
-        scale_yield.loc[{"Item": cereal_items}] = linear_scale(2020, 2020, 2050, 2050, c_init=1, c_end=1+yield_change)
+        scale_yield.loc[{"Item": cereal_items}] = linear_scale(2020, 2020, 2050, 2050, c_init=1, c_end=1+yield_change).sel(Year=scale_tot.Year)
         scale_tot = scale_tot / scale_yield
 
     # Scale food production and balance using imports
-    g_cap_day = g_cap_day.fbs.scale_add(element_in="production", element_out="imports", scale=1/scale_tot, add=False)
-    g_prot_cap_day = g_prot_cap_day.fbs.scale_add(element_in="production", element_out="imports", scale=1/scale_tot, add=False)
-    g_fat_cap_day = g_fat_cap_day.fbs.scale_add(element_in="production", element_out="imports", scale=1/scale_tot, add=False)
-    kcal_cap_day = kcal_cap_day.fbs.scale_add(element_in="production", element_out="imports", scale=1/scale_tot, add=False)
+    chain = FBSOpChain().scale_add(element_in="production", element_out="imports", scale=1/scale_tot, add=False)
 
     # Do the same with exports, but this time add the change in exports to imports
-    g_cap_day = g_cap_day.fbs.scale_add(element_in="exports", element_out="imports", scale=1/scale_tot)
-    g_prot_cap_day = g_prot_cap_day.fbs.scale_add(element_in="exports", element_out="imports", scale=1/scale_tot)
-    g_fat_cap_day = g_fat_cap_day.fbs.scale_add(element_in="exports", element_out="imports", scale=1/scale_tot)
-    kcal_cap_day = kcal_cap_day.fbs.scale_add(element_in="exports", element_out="imports", scale=1/scale_tot)
+    chain.scale_add(element_in="exports", element_out="imports", scale=1/scale_tot)
+
+    g_cap_day = chain.run(g_cap_day)
+
+    # Protein, fat and energy are proportional to the weight of food, so they
+    # are derived from the projected weights instead of projected separately
+    nutrients = ["protein", "fat", "energy"]
+    per_cap = per_capita_quantities(datablock, nutrients, food=g_cap_day)
 
     # Emissions per gram of food also remain constant
     g_co2e_g = datablock["impact"]["gco2e/gfood"]
-    g_co2e_g = g_co2e_g.fbs.add_years(years, "constant")
+    g_co2e_g = keep_precision(g_co2e_g.fbs.add_years(years, "constant"), g_co2e_g.dtype)
 
     datablock["food"]["g/cap/day"] = g_cap_day
-    datablock["food"]["g_prot/cap/day"] = g_prot_cap_day
-    datablock["food"]["g_fat/cap/day"] = g_fat_cap_day
-    datablock["food"]["kCal/cap/day"] = kcal_cap_day
+    for quantity in nutrients:
+        datablock["food"][PER_CAPITA_QUANTITIES[quantity][0]] = per_cap.sel(Quantity=quantity, drop=True)
     datablock["impact"]["gco2e/gfood"] = g_co2e_g
     datablock["impact"]["baseline"] = copy.deepcopy(datablock["impact"]["gco2e/gfood"])
 
@@ -89,6 +155,129 @@ def item_scaling_multiple(datablock, scale, source, scaling_nutrient,
     """Reduces per capita intake quantities and replaces them by other items
     keeping the overall consumption constant. Scales land use if production
     changes
+
+    All the levers are applied at once. A single logistic adoption curve is
+    combined with the lever scales into a per item scale matrix over years,
+    and the non selected items are scaled by a single factor compensating the
+    change in the sum of all the selected items. The result is equivalent to
+    applying the levers one at a time with balanced_scaling, as done by
+    item_scaling_multiple_sequential, which is used instead if the item
+    groups overlap.
+
+    Parameters
+    ----------
+    scale : list of float
+        Scaling factor of each item group after full adoption.
+    source : str or list of str
+        Elements supplying the change in food.
+    scaling_nutrient : str
+        Quantity used to scale the items, such as "kCal/cap/day".
+    elasticity : float or list of float, optional
+        Fraction of the change in food supplied by each source element.
+    items : list
+        Item groups, as item lists or (coordinate, values) tuples.
+    constant : bool, optional
+        If set to True, the sum of food is kept constant by scaling the non
+        selected items.
+    non_sel_items : list or tuple, optional
+        Items scaled to keep the sum of food constant.
+    """
+
+    from agrifoodpy.utils.scaling import logistic_scale
+
+    # if no items are specified, do nothing
+    if items is None:
+        return datablock
+
+    timescale = datablock["global_parameters"]["timescale"]
+    # We can use any quantity here, either per cap/day or per year. The ratio
+    # will cancel out the population growth
+    food_orig = datablock["food"][scaling_nutrient]
+
+    if np.isscalar(source):
+        source = [source]
+
+    meta = FBSArray.from_xarray(food_orig).meta
+    scale = np.asarray(scale, dtype=float)[:len(items)]
+    positions = [meta.item_positions(it) for it in items[:len(scale)]]
+
+    selected = np.concatenate(positions) if positions else np.array([], dtype=np.intp)
+    if constant:
+        if non_sel_items is None:
+            return item_scaling_multiple_sequential(datablock, scale, source, scaling_nutrient,
+                                                    elasticity, items, constant, non_sel_items)
+        non_sel_pos = meta.item_positions(non_sel_items)
+        overlap = len(np.intersect1d(selected, non_sel_pos)) > 0
+    else:
+        overlap = False
+
+    if overlap or len(np.unique(selected)) != len(selected):
+        return item_scaling_multiple_sequential(datablock, scale, source, scaling_nutrient,
+                                                elasticity, items, constant, non_sel_items)
+
+    # Logistic adoption curve going from 0 to 1, shared by all levers
+    years = meta.years
+    y2 = np.min([2021 + timescale, years[-1]])
+    adoption = logistic_scale(years[0], 2021, y2, years[-1], c_init=0, c_end=1)
+    adoption = adoption.sel(Year=years).values
+
+    food = food_orig["food"].transpose("Item", "Year").values
+    dtype = food.dtype if np.issubdtype(food.dtype, np.floating) else np.float64
+
+    # Scale of each lever over the years, with shape (lever, Year)
+    lever_scale = 1 + (scale[:, np.newaxis] - 1) * adoption[np.newaxis, :]
+
+    scale_matrix = np.ones(food.shape, dtype=dtype)
+    for pos, sc in zip(positions, lever_scale):
+        scale_matrix[pos] = sc
+
+    if constant:
+        # Change in the sum of each item group, and compensation factor for
+        # the non selected items
+        food0 = np.where(np.isnan(food), 0, food)
+        group_sums = np.array([food0[pos].sum(axis=0) for pos in positions])
+        delta = ((lever_scale - 1) * group_sums).sum(axis=0)
+
+        non_sel_sum = food0[non_sel_pos].sum(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            non_sel_scale = (non_sel_sum - delta) / non_sel_sum
+        non_sel_scale[~np.isfinite(non_sel_scale)] = 1.0
+
+        if np.any(non_sel_scale < 0):
+            warnings.warn("Additional consumption cannot be compensated by \
+                        reduction of non-selected items")
+
+        scale_matrix[non_sel_pos] *= non_sel_scale
+
+    # Scale food and balance with the source elements, then scale feed, seed
+    # and processing
+    chain = FBSOpChain().scale_add(element_in="food",
+                                   element_out=source,
+                                   scale=scale_matrix,
+                                   elasticity=elasticity)
+    chain.feed_scale()
+
+    # out = check_negative_source(out, "production", "imports")
+    chain.check_negative_source("imports", "exports", add=False)
+
+    ratio = chain.ratio(food_orig)
+
+    # Update per cap/day values and per year values using the same ratio, which
+    # is independent of population growth
+    datablock["food"]["g/cap/day"] *= ratio
+
+    return datablock
+
+def item_scaling_multiple_sequential(datablock, scale, source, scaling_nutrient,
+                 elasticity=None, items=None, constant=True,
+                 non_sel_items=None):
+    """Reduces per capita intake quantities and replaces them by other items
+    keeping the overall consumption constant. Scales land use if production
+    changes
+
+    Applies the levers one at a time with balanced_scaling. This is the
+    reference implementation of item_scaling_multiple, which is also used when
+    the item groups overlap.
     
     Parameters
     ----------
@@ -140,7 +329,7 @@ def item_scaling_multiple(datablock, scale, source, scaling_nutrient,
     out = check_negative_source(out, "imports", "exports", add=False)
 
     ratio = out / food_orig
-    ratio = ratio.where(~np.isnan(ratio), 1)
+    ratio = keep_precision(ratio.where(~np.isnan(ratio), 1), sheet_dtype(food_orig))
 
     # Update per cap/day values and per year values using the same ratio, which
     # is independent of population growth
@@ -386,20 +575,19 @@ def food_waste_model(datablock, waste_scale, kcal_rda, source, elasticity=None):
 
     # Set to "imports" or "production" to choose which element of the food system supplies the change in consumption
     # Scale food and subtract difference from production
-    out = food_orig.fbs.scale_add(element_in="food",
-                                  element_out=source,
-                                  scale=scale_waste,
-                                  elasticity=elasticity)
+    chain = FBSOpChain().scale_add(element_in="food",
+                                   element_out=source,
+                                   scale=scale_waste,
+                                   elasticity=elasticity)
     
     # Scale feed, seed and processing
-    out = feed_scale(out, food_orig)
+    chain.feed_scale()
 
     # If supply element is negative, set to zero and add the negative delta to imports
-    out = check_negative_source(out, "imports", "exports", add=False)
+    chain.check_negative_source("imports", "exports", add=False)
 
     # Scale all per capita qantities proportionally
-    ratio = out / food_orig
-    ratio = ratio.where(~np.isnan(ratio), 1)
+    ratio = chain.ratio(food_orig)
 
     datablock["food"]["g/cap/day"] *= ratio
 
@@ -415,6 +603,7 @@ def alternative_food_model(datablock, cultured_scale, labmeat_co2e, baseline_ite
     timescale = datablock["global_parameters"]["timescale"]
     baseline_items = get_items(datablock["food"]["g/cap/day"], baseline_items)
     items_to_replace = get_items(datablock["food"]["g/cap/day"], replaced_items)
+    dtype = sheet_dtype(datablock["food"]["g/cap/day"])
 
     nutrition_keys = ["g_prot/g_food", "g_fat/g_food", "kCal/g_food"]
     # Add new items to the food dataset
@@ -493,6 +682,11 @@ def alternative_food_model(datablock, cultured_scale, labmeat_co2e, baseline_ite
 
     datablock["food"]["g/cap/day"] *= ratio
 
+    # The new items are added in float64 by add_items
+    for key in ["g/cap/day"] + nutrition_keys:
+        datablock["food"][key] = keep_precision(datablock["food"][key], dtype)
+    datablock["impact"]["gco2e/gfood"] = keep_precision(datablock["impact"]["gco2e/gfood"], dtype)
+
     return datablock
 
 def cultured_meat_model(datablock, cultured_scale, labmeat_co2e, items, copy_from,
@@ -506,6 +700,7 @@ def cultured_meat_model(datablock, cultured_scale, labmeat_co2e, items, copy_fro
 
     # Add cultured meat to the dataset
     qty_key = ["g/cap/day", "g_prot/cap/day", "g_fat/cap/day", "kCal/cap/day"]
+    dtype = sheet_dtype(datablock["food"]["g/cap/day"])
     
     for key in qty_key:
         datablock["food"][key] = datablock["food"][key].fbs.add_items(new_items)
@@ -568,6 +763,11 @@ def cultured_meat_model(datablock, cultured_scale, labmeat_co2e, items, copy_fro
     for key in qty_key:
         datablock["food"][key] *= ratio
 
+    # The new items are added in float64 by add_items
+    for key in qty_key + nutrition_keys:
+        datablock["food"][key] = keep_precision(datablock["food"][key], dtype)
+    datablock["impact"]["gco2e/gfood"] = keep_precision(datablock["impact"]["gco2e/gfood"], dtype)
+
     return datablock
 
 def compute_emissions(datablock):
@@ -622,15 +822,15 @@ def forest_land_model_new(datablock, forest_fraction, bdleaf_conif_ratio):
     
     timescale = datablock["global_parameters"]["timescale"]
     pctg = datablock["land"]["percentage_land_use"].copy(deep=True)
+    old_totals = land_totals(pctg)
 
+    old_use_arable = old_totals.sel({"aggregate_class":["Arable"]}).sum()
 
-    old_use_arable = datablock["land"]["percentage_land_use"].sel({"aggregate_class":["Arable"]}).sum()
-
-    total_uk_land = pctg.sum()
+    total_uk_land = old_totals.sum()
 
     # Fraction of forest to achieve area delta
     forest_xy = datablock["land"]["percentage_land_use"].sel({"aggregate_class":["Broadleaf woodland", "Coniferous woodland"]})
-    total_forest = forest_xy.sum()
+    total_forest = old_totals.sel({"aggregate_class":["Broadleaf woodland", "Coniferous woodland"]}).sum()
 
     # Required delta to forest = requested fraction - current fraction
     delta_forest_land_percentage = forest_fraction - float(total_forest / total_uk_land)
@@ -639,7 +839,7 @@ def forest_land_model_new(datablock, forest_fraction, bdleaf_conif_ratio):
     delta_forest_area = total_uk_land * delta_forest_land_percentage
 
     pasture_xy = datablock["land"]["percentage_land_use"].sel({"aggregate_class":["Improved grassland", "Semi-natural grassland"]})
-    old_use_pasture = pasture_xy.sum()
+    old_use_pasture = old_totals.sel({"aggregate_class":["Improved grassland", "Semi-natural grassland"]}).sum()
     
     if delta_forest_land_percentage > 0:
         # We only change pasture to forest
@@ -671,11 +871,13 @@ def forest_land_model_new(datablock, forest_fraction, bdleaf_conif_ratio):
         pctg.loc[{"aggregate_class":["Improved grassland", "Semi-natural grassland", "Arable"]}] -= delta_agriculture_xy
 
     # Add spared class to the land use map
+    pctg = persist_land(pctg)
     datablock["land"]["percentage_land_use"] = pctg
 
     # Scale food production and imports
-    new_use_pasture = pctg.sel({"aggregate_class":["Improved grassland", "Semi-natural grassland"]}).sum()
-    new_use_arable = pctg.sel({"aggregate_class":"Arable"}).sum()
+    new_totals = land_totals(pctg)
+    new_use_pasture = new_totals.sel({"aggregate_class":["Improved grassland", "Semi-natural grassland"]}).sum()
+    new_use_arable = new_totals.sel({"aggregate_class":"Arable"})
     
     scale_use_pasture = (new_use_pasture/old_use_pasture).to_numpy()
     scale_use_arable = (new_use_arable/old_use_arable).to_numpy()
@@ -687,25 +889,22 @@ def forest_land_model_new(datablock, forest_fraction, bdleaf_conif_ratio):
     scaled_items_pasture = food_orig.sel(Item=food_orig.Item_origin=="Animal Products").Item.values
     scaled_items_arable = food_orig.sel(Item=food_orig.Item_origin=="Vegetal Products").Item.values
 
-    out = food_orig.fbs.scale_add(element_in="production",
-                                  element_out="imports",
-                                  scale=scale_forest_pasture,
-                                  items=scaled_items_pasture,
-                                  add=False)
+    chain = FBSOpChain().scale_add(element_in="production",
+                                   element_out="imports",
+                                   scale=scale_forest_pasture,
+                                   items=scaled_items_pasture,
+                                   add=False)
     
-    out = out.fbs.scale_add(element_in="production",
-                                  element_out="imports",
-                                  scale=scale_forest_arable,
-                                  items=scaled_items_arable,
-                                  add=False)
+    chain.scale_add(element_in="production",
+                    element_out="imports",
+                    scale=scale_forest_arable,
+                    items=scaled_items_arable,
+                    add=False)
     
-    out = check_negative_source(out, "production")
-    out = check_negative_source(out, "imports")
+    chain.check_negative_source("production")
+    chain.check_negative_source("imports")
 
-    ratio = out / food_orig
-    ratio = ratio.where(~np.isnan(ratio), 1)
-
-    datablock["food"]["g/cap/day"] = out
+    datablock["food"]["g/cap/day"] = chain.run(food_orig)
 
     return datablock
 
@@ -725,9 +924,9 @@ def forest_land_model(datablock, forest_fraction, bdleaf_conif_ratio,
     # if no alc grade is provided, then use the whole map
     if mask_vals is not None or map_mask is not None:
         alc = datablock["land"][map_mask]
-        alc_mask = np.isin(alc, mask_vals)
+        alc_mask = alc.isin(mask_vals)
     else:
-        alc_mask = np.ones_like(pctg, dtype=bool)
+        alc_mask = xr.ones_like(pctg, dtype=bool)
 
     total_uk_land = pctg.sum()
 
@@ -758,6 +957,7 @@ def forest_land_model(datablock, forest_fraction, bdleaf_conif_ratio,
     pctg.loc[{"aggregate_class":"Coniferous woodland"}] += delta_forest_pasture.sum(dim="aggregate_class")*(1-bdleaf_conif_ratio)
 
     # Add spared class to the land use map
+    pctg = persist_land(pctg)
     datablock["land"]["percentage_land_use"] = pctg
 
     # Scale food production and imports
@@ -774,23 +974,22 @@ def forest_land_model(datablock, forest_fraction, bdleaf_conif_ratio,
     scaled_items_pasture = food_orig.sel(Item=food_orig.Item_origin=="Animal Products").Item.values
     scaled_items_arable = food_orig.sel(Item=food_orig.Item_origin=="Vegetal Products").Item.values
 
-    out = food_orig.fbs.scale_add(element_in="production",
-                                  element_out="imports",
-                                  scale=scale_forest_pasture,
-                                  items=scaled_items_pasture,
-                                  add=False)
+    chain = FBSOpChain().scale_add(element_in="production",
+                                   element_out="imports",
+                                   scale=scale_forest_pasture,
+                                   items=scaled_items_pasture,
+                                   add=False)
     
-    out = out.fbs.scale_add(element_in="production",
-                                  element_out="imports",
-                                  scale=scale_forest_arable,
-                                  items=scaled_items_arable,
-                                  add=False)
+    chain.scale_add(element_in="production",
+                    element_out="imports",
+                    scale=scale_forest_arable,
+                    items=scaled_items_arable,
+                    add=False)
     
-    out = check_negative_source(out, "production")
-    out = check_negative_source(out, "imports")
+    chain.check_negative_source("production")
+    chain.check_negative_source("imports")
 
-    ratio = out / food_orig
-    ratio = ratio.where(~np.isnan(ratio), 1)
+    ratio = chain.ratio(food_orig)
 
     # Update per cap/day values and per year values using the same ratio, which
     # is independent of population growth
@@ -812,17 +1011,17 @@ def peatland_restoration(datablock, restore_fraction, new_land_type, old_land_ty
     timescale = datablock["global_parameters"]["timescale"]
     
     pctg = datablock["land"]["percentage_land_use"].copy(deep=True)
-    old_use = datablock["land"]["percentage_land_use"].sel({"aggregate_class":old_land_type}).sum()
+    old_use = land_totals(pctg).sel({"aggregate_class":old_land_type}).sum()
 
     if peat_map_key is not None:
         peat_map_da = datablock["land"][peat_map_key]
     
         if mask_val is not None:
-            peat_mask = np.isin(peat_map_da, mask_val)
+            peat_mask = peat_map_da.isin(mask_val)
     
     # if no mask is provided, then use the whole map
     else:
-        peat_mask = np.ones_like(pctg, dtype=bool)
+        peat_mask = xr.ones_like(pctg, dtype=bool)
 
     to_spare = pctg.where(peat_mask, other=0).sel({"aggregate_class":old_land_type})
 
@@ -838,10 +1037,11 @@ def peatland_restoration(datablock, restore_fraction, new_land_type, old_land_ty
     pctg.loc[{"aggregate_class":new_land_type}] += delta_spared.sum(dim="aggregate_class")
 
     # Add spared class to the land use map
+    pctg = persist_land(pctg)
     datablock["land"]["percentage_land_use"] = pctg
 
     # Scale food production and imports
-    new_use = pctg.sel({"aggregate_class":old_land_type}).sum()
+    new_use = land_totals(pctg).sel({"aggregate_class":old_land_type}).sum()
     scale_use = (new_use/old_use).to_numpy()
 
     food_orig = datablock["food"]["g/cap/day"]
@@ -849,17 +1049,13 @@ def peatland_restoration(datablock, restore_fraction, new_land_type, old_land_ty
 
     scaled_items = food_orig.sel(Item=food_orig.Item_origin==items).Item.values
 
-    out = food_orig.fbs.scale_add(element_in="production",
-                                  element_out="imports",
-                                  scale=scale_spare,
-                                  items=scaled_items,
-                                  add=False)
-    datablock["food"]["g/cap/day"] = out
-    
-    ratio = out / food_orig
-    ratio = ratio.where(~np.isnan(ratio), 1)
+    chain = FBSOpChain().scale_add(element_in="production",
+                                   element_out="imports",
+                                   scale=scale_spare,
+                                   items=scaled_items,
+                                   add=False)
 
-    datablock["food"]["g/cap/day"] = out
+    datablock["food"]["g/cap/day"] = chain.run(food_orig)
 
     return datablock
 
@@ -878,6 +1074,8 @@ def ccs_model(datablock, waste_BECCS, overseas_BECCS, DACCS, biochar):
     biochar : float
         Total maximum sequestration (in t CO2e / year) from biochar and enhanced weathering
     """
+
+    from agrifoodpy.utils.scaling import linear_scale
     
     timescale = datablock["global_parameters"]["timescale"]
     food_orig = datablock["food"]["g/cap/day"]
@@ -886,7 +1084,7 @@ def ccs_model(datablock, waste_BECCS, overseas_BECCS, DACCS, biochar):
     # Compute the total area of BECCS land used in hectares, and the total
     # sequestration in Mt CO2e / year
 
-    land_BECCS_area = pctg.sel({"aggregate_class":"BECCS"}).sum().to_numpy()
+    land_BECCS_area = land_totals(pctg).sel({"aggregate_class":"BECCS"}).to_numpy()
     land_BECCS = land_BECCS_area * datablock["beccs_crops_seq_ha_yr"]
 
     logistic_0_val = logistic_food_supply(food_orig, timescale, 0, 1)
@@ -929,6 +1127,10 @@ def ccs_model(datablock, waste_BECCS, overseas_BECCS, DACCS, biochar):
                                     c_init=245,
                                     c_end=180)
 
+    # The cost curves are built in float64
+    cost_BECCS_tCO2e = keep_precision(cost_BECCS_tCO2e, logistic_0_val.dtype)
+    cost_DACCS_tCO2e = keep_precision(cost_DACCS_tCO2e, logistic_0_val.dtype)
+
     cost_waste_BECCS = waste_BECCS_seq_array * cost_BECCS_tCO2e
     cost_overseas_BECCS = overseas_BECCS_seq_array * cost_BECCS_tCO2e
     cost_land_BECCS = land_BECCS_seq_array * cost_BECCS_tCO2e
@@ -957,13 +1159,13 @@ def forest_sequestration_model(datablock, land_type, seq):
     food_orig = datablock["food"]["g/cap/day"]
 
     # Load the land use data from the datablock
-    pctg = datablock["land"]["percentage_land_use"].copy(deep=True)
+    totals = land_totals(datablock["land"]["percentage_land_use"])
     logistic_0_val = logistic_food_supply(food_orig, timescale, 0, 1)
 
     for land_type_i, seq_i in zip(land_type, seq):
 
         # Compute forest area in ha, maximum anual sequestration, and growth curve
-        area_land = pctg.loc[{"aggregate_class":land_type_i}].sum().to_numpy()
+        area_land = totals.loc[{"aggregate_class":land_type_i}].sum().to_numpy()
         max_seq = area_land * seq_i
 
     
@@ -1021,20 +1223,19 @@ def scale_production(datablock, scale_factor, items=None):
 
     scale_prod = logistic_food_supply(food_orig, timescale, 1, scale_factor)
 
-    out = food_orig.fbs.scale_add(element_in="production",
-                                element_out="imports",
-                                scale=scale_prod,
-                                items=items,
-                                add=False)
+    chain = FBSOpChain().scale_add(element_in="production",
+                                   element_out="imports",
+                                   scale=scale_prod,
+                                   items=items,
+                                   add=False)
     
     # Reduce feed and seed
-    out = feed_scale(out, food_orig, source = "imports")
+    chain.feed_scale(source = "imports")
 
-    out = check_negative_source(out, "production", "imports")
-    out = check_negative_source(out, "imports", "exports", add=False)
+    chain.check_negative_source("production", "imports")
+    chain.check_negative_source("imports", "exports", add=False)
     
-    ratio = out / food_orig
-    ratio = ratio.where(~np.isnan(ratio), 1)
+    ratio = chain.ratio(food_orig)
 
     # Update per cap/day values and per year values using the same ratio, which
     # is independent of population growth
@@ -1054,17 +1255,17 @@ def BECCS_farm_land(datablock, farm_percentage, items, land_type="Arable",
 
     timescale = datablock["global_parameters"]["timescale"]
     pctg = datablock["land"]["percentage_land_use"].copy(deep=True)
-    old_use = datablock["land"]["percentage_land_use"].sel({"aggregate_class":land_type}).sum()
+    old_use = land_totals(pctg).sel({"aggregate_class":land_type}).sum()
 
     if mask_map is not None:
         mask_map = datablock["land"][mask_map].copy(deep=True)
     
     # if no alc grade is provided, then use the whole map
         if mask_values is not None:
-            peat_mask = np.isin(mask_map, mask_values)
+            peat_mask = mask_map.isin(mask_values)
     
     else:
-        peat_mask = np.ones_like(pctg, dtype=bool)
+        peat_mask = xr.ones_like(pctg, dtype=bool)
 
     to_spare = pctg.where(peat_mask, other=0).sel({"aggregate_class":land_type})
 
@@ -1083,10 +1284,11 @@ def BECCS_farm_land(datablock, farm_percentage, items, land_type="Arable",
         pctg.loc[{"aggregate_class":new_land_type}] += delta_spared
 
     # Add spared class to the land use map
+    pctg = persist_land(pctg)
     datablock["land"]["percentage_land_use"] = pctg
 
     # Scale food production and imports
-    new_use = pctg.sel({"aggregate_class":land_type}).sum()
+    new_use = land_totals(pctg).sel({"aggregate_class":land_type}).sum()
     scale_use = (new_use/old_use).fillna(1).to_numpy()
 
     food_orig = datablock["food"]["g/cap/day"]
@@ -1095,15 +1297,13 @@ def BECCS_farm_land(datablock, farm_percentage, items, land_type="Arable",
     # scaled_items = food_orig.sel(Item=food_orig.Item_origin=="Vegetal Products").Item.values
     scaled_items = get_items(food_orig, items)
 
-    out = food_orig.fbs.scale_add(element_in="production",
-                                  element_out="imports",
-                                  scale=scale_spare,
-                                  items=scaled_items,
-                                  add=False)
-    
-    ratio = out / food_orig
-    ratio = ratio.where(~np.isnan(ratio), 1)
-    datablock["food"]["g/cap/day"] = out
+    chain = FBSOpChain().scale_add(element_in="production",
+                                   element_out="imports",
+                                   scale=scale_spare,
+                                   items=scaled_items,
+                                   add=False)
+
+    datablock["food"]["g/cap/day"] = chain.run(food_orig)
 
     return datablock
 
@@ -1146,7 +1346,7 @@ def agroecology_model(datablock, land_percentage, land_type,
     # Load land use and food data from datablock
     pctg = datablock["land"]["percentage_land_use"].copy(deep=True)
     food_orig = datablock["food"]["g/cap/day"].copy(deep=True)
-    old_use = pctg.sel({"aggregate_class":land_type}).sum()
+    old_use = land_totals(pctg).sel({"aggregate_class":land_type}).sum()
     alc = datablock["land"]["dominant_classification"]
     timescale = datablock["global_parameters"]["timescale"]
 
@@ -1163,25 +1363,28 @@ def agroecology_model(datablock, land_percentage, land_type,
 
     delta_total = delta_agroecology.sum(dim="aggregate_class")
     pctg.loc[{"aggregate_class":agroecology_class}] += delta_total
+    pctg = persist_land(pctg)
 
-    out = food_orig.copy(deep=True)
+    new_totals = land_totals(pctg)
+    new_use = new_totals.sel({"aggregate_class":land_type}).sum()
+
+    chain = FBSOpChain()
 
     # Reduce production of replaced items if they are provided
     if replaced_items is not None:
-        new_use = pctg.sel({"aggregate_class":land_type}).sum()
         scale_use = (new_use/old_use) + (1-tree_coverage) * (1-new_use/old_use)
         scale_use = scale_use.to_numpy()
 
-        scale_arr = logistic_food_supply(out, timescale, 1, scale_use)
+        scale_arr = logistic_food_supply(food_orig, timescale, 1, scale_use)
 
-        out = out.fbs.scale_add(element_in="production",
-                                element_out="imports",
-                                scale=scale_arr,
-                                items=replaced_items,
-                                add=False)
+        chain.scale_add(element_in="production",
+                        element_out="imports",
+                        scale=scale_arr,
+                        items=replaced_items,
+                        add=False)
         
-        out = check_negative_source(out, "production", "imports")
-        out = check_negative_source(out, "imports", "production")
+        chain.check_negative_source("production", "imports")
+        chain.check_negative_source("imports", "production")
 
     # Add new items by scaling production from current values to future values
     if new_items is not None:
@@ -1194,18 +1397,18 @@ def agroecology_model(datablock, land_percentage, land_type,
 
         for item, yld in zip(new_items, item_yield):
             old_production = food_orig["production"].sel({"Item":item}).isel(Year=-1)
-            new_production = old_production + yld * delta_agroecology.sum()/pop
+            new_production = old_production + yld * (old_use - new_use)/pop
             production_scale = (new_production / old_production).to_numpy()
             production_scale_array = logistic_food_supply(food_orig, timescale, 1, production_scale)
 
-            out = out.fbs.scale_add(element_in="production",
-                                element_out="imports",
-                                scale=production_scale_array,
-                                items=item,
-                                add=False)
+            chain.scale_add(element_in="production",
+                            element_out="imports",
+                            scale=production_scale_array,
+                            items=item,
+                            add=False)
         
     # Compute forest area in ha, maximum anual sequestration, and growth curve
-    area_agroecology = pctg.loc[{"aggregate_class":agroecology_class}].sum().to_numpy()
+    area_agroecology = new_totals.loc[{"aggregate_class":agroecology_class}].to_numpy()
     max_seq_agroecology = area_agroecology * seq_ha_yr
 
     agroecology_seq = logistic_food_supply(food_orig, timescale, 1, c_end=max_seq_agroecology)
@@ -1226,8 +1429,7 @@ def agroecology_model(datablock, land_percentage, land_type,
     # Rewrite land use data to datablock
     datablock["land"]["percentage_land_use"] = pctg
 
-    ratio = out / food_orig
-    ratio = ratio.where(~np.isnan(ratio), 1)
+    ratio = chain.ratio(food_orig)
 
     # Update per cap/day values and per year values using the same ratio, which
     # is independent of population growth
@@ -1306,6 +1508,8 @@ def logistic_food_supply(fbs, timescale, c_init, c_end):
     """Creates a logistic curve using the year range of the input food balance
     supply"""
 
+    from agrifoodpy.utils.scaling import logistic_scale
+
     y0 = fbs.Year.values[0]
     y1 = 2021
     y2 = 2021 + timescale
@@ -1313,7 +1517,66 @@ def logistic_food_supply(fbs, timescale, c_init, c_end):
 
     scale = logistic_scale(y0, y1, y2, y3, c_init=c_init, c_end=c_end)
 
-    return scale
+    # Only keep the years being evaluated
+    scale = scale.sel(Year=fbs.Year.values)
+
+    # Keep the curve in the working precision of the food balance sheet
+    return keep_precision(scale, sheet_dtype(fbs))
+
+def sheet_dtype(fbs):
+    """Returns the working precision of a food balance sheet or array"""
+
+    return next(iter(fbs.data_vars.values())).dtype if isinstance(fbs, xr.Dataset) else fbs.dtype
+
+def keep_precision(fbs, dtype):
+    """Casts the floating point values of a food balance sheet or array to
+    dtype, if it is a floating point type. agrifoodpy accessor methods such as
+    add_years and add_items create new values in float64, which would promote
+    reduced precision sheets."""
+
+    if not np.issubdtype(dtype, np.floating):
+        return fbs
+
+    if isinstance(fbs, xr.Dataset):
+        fbs = fbs.copy()
+        for name, var in fbs.data_vars.items():
+            if np.issubdtype(var.dtype, np.floating):
+                fbs[name] = var.astype(dtype, copy=False)
+        return fbs
+
+    if np.issubdtype(fbs.dtype, np.floating):
+        return fbs.astype(dtype, copy=False)
+
+    return fbs
+
+def precise_sum(da, dim=None):
+    """Sums an array accumulating in float64 and returns the result in the
+    precision of the input. Used for totals over the land use maps, which can
+    be stored in reduced precision."""
+
+    total = da.sum(dim=dim, dtype=np.float64)
+    if np.issubdtype(da.dtype, np.floating):
+        total = total.astype(da.dtype, copy=False)
+
+    return total
+
+def land_totals(pctg):
+    """Returns the total of each class of a land use map over its spatial
+    dimensions, accumulated in float64. Dask backed maps are reduced here, in
+    a single computation for all the classes."""
+
+    return precise_sum(pctg, dim=spatial_dims(pctg)).compute()
+
+def persist_land(pctg):
+    """Returns a dask backed land use map with its pending computations
+    carried out and held in memory. Nodes store their updated maps through
+    it, so the totals taken downstream do not recompute the chain of land
+    nodes before them. Maps held in memory are returned unchanged."""
+
+    if pctg.chunks is None:
+        return pctg
+
+    return pctg.persist()
 
 def scale_kcal_feed(obs, ref, items):
     """Scales the feed quantities according to the difference in production of 
@@ -1389,7 +1652,7 @@ def production_land_scale(datablock, bdleaf_conif_ratio):
     else:
         land.loc[{"aggregate_class":"Coniferous woodland"}] = delta*(1-bdleaf_conif_ratio)
     
-    datablock["land"]["percentage_land_use"] = land
+    datablock["land"]["percentage_land_use"] = persist_land(land)
 
     return datablock
 
@@ -1426,7 +1689,7 @@ def managed_agricultural_land_carbon_model(datablock, fraction, managed_class,
     pctg.loc[{"aggregate_class":managed_class}] += delta_arable.sum(dim="aggregate_class")
 
     # Rewrite land use data to datablock
-    datablock["land"]["percentage_land_use"] = pctg
+    datablock["land"]["percentage_land_use"] = persist_land(pctg)
     return datablock
 
 def zero_land_farming_model(datablock, fraction, items, land_type="Arable",
@@ -1469,7 +1732,7 @@ def zero_land_farming_model(datablock, fraction, items, land_type="Arable",
     pctg.loc[{"aggregate_class":"Broadleaf woodland"}] += delta_arable * bdleaf_conif_ratio
     pctg.loc[{"aggregate_class":"Coniferous woodland"}] += delta_arable * (1-bdleaf_conif_ratio)
 
-    datablock["land"]["percentage_land_use"] = pctg
+    datablock["land"]["percentage_land_use"] = persist_land(pctg)
 
     return datablock
 
@@ -1539,9 +1802,14 @@ def mixed_farming_model(datablock, fraction, prod_scale_factor, items,
     delta_arable = pctg.loc[{"aggregate_class":land_type}] * fraction
     pctg.loc[{"aggregate_class":land_type}] -= delta_arable
     pctg.loc[{"aggregate_class":new_land_type}] += delta_arable.sum(dim="aggregate_class")
+    pctg = persist_land(pctg)
 
     # Compute relative change in arable land
-    mixed_farm_frac = delta_arable.sum() / old_land.loc[{"aggregate_class":land_type}].sum()
+    old_totals = land_totals(old_land)
+    new_totals = land_totals(pctg)
+    old_use = old_totals.loc[{"aggregate_class":land_type}].sum()
+    delta_use = old_use - new_totals.loc[{"aggregate_class":land_type}].sum()
+    mixed_farm_frac = delta_use / old_use
     arable_scale = 1 - mixed_farm_frac + mixed_farm_frac * prod_scale_factor
     arable_scale = arable_scale.values
 
@@ -1551,33 +1819,32 @@ def mixed_farming_model(datablock, fraction, prod_scale_factor, items,
 
     scale = logistic_food_supply(food_orig, timescale, 1, arable_scale)
 
-    out = food_orig.fbs.scale_add(element_in="production",
-                                  element_out="imports",
-                                  scale=scale,
-                                  items=items,
-                                  add=False)
+    chain = FBSOpChain().scale_add(element_in="production",
+                                   element_out="imports",
+                                   scale=scale,
+                                   items=items,
+                                   add=False)
     
     # Compute relative change in secondary items
     # Get relative new area of mixed farming to secondary producing area
-    total_area_secondary = pctg.loc[{"aggregate_class":secondary_land_type}].sum()
-    mixed_farm_to_secondary_ratio = delta_arable.sum() / total_area_secondary
+    total_area_secondary = new_totals.loc[{"aggregate_class":secondary_land_type}].sum()
+    mixed_farm_to_secondary_ratio = delta_use / total_area_secondary
     secondary_ratio = 1 + mixed_farm_to_secondary_ratio * secondary_prod_scale_factor
     secondary_ratio = secondary_ratio.values
 
     secondary_scale = logistic_food_supply(food_orig, timescale, 1, secondary_ratio)
 
-    out = out.fbs.scale_add(element_in="production",
-                                  element_out="exports",
-                                  scale=secondary_scale,
-                                  items=secondary_items,
-                                  add=True)
-    
+    chain.scale_add(element_in="production",
+                    element_out="exports",
+                    scale=secondary_scale,
+                    items=secondary_items,
+                    add=True)
 
     # Update land use data to datablock
     datablock["land"]["percentage_land_use"] = pctg
 
     # Rewrite food data datablock
-    datablock["food"]["g/cap/day"] = out
+    datablock["food"]["g/cap/day"] = chain.run(food_orig)
 
     return datablock
 
@@ -1613,12 +1880,10 @@ def shift_production(datablock, scale, items, items_target, land_area_ratio):
         items being scaled.
     """
 
-    # Load food data from datablock
-    food_orig = datablock["food"]["g/cap/day"].copy(deep=True)
+    # Load food data from datablock into a compact array container
+    food_orig = datablock["food"]["g/cap/day"]
     timescale = datablock["global_parameters"]["timescale"]
-
-    items = get_items(food_orig, items)
-    items_target = get_items(food_orig, items_target)
+    out = FBSArray.from_xarray(food_orig, copy=True)
 
     # Create scaling array
     scale_items = logistic_food_supply(food_orig, timescale, 1, 1 + scale)
@@ -1626,25 +1891,24 @@ def shift_production(datablock, scale, items, items_target, land_area_ratio):
     scale_target = 1 - land_area_ratio * scale
     scale_target = logistic_food_supply(food_orig, timescale, 1, scale_target)
 
-    # Scale production quantities
+    # Scale production quantities in place
+    out.scale_add(element_in="production",
+                  element_out="imports",
+                  scale=scale_items,
+                  items=items,
+                  add=False)
 
-    out = food_orig.fbs.scale_add(element_in="production",
-                                element_out="imports",
-                                scale=scale_items,
-                                items=items,
-                                add=False)
-    
-    out = out.fbs.scale_add(element_in="production",
-                            element_out="imports",
-                            scale=scale_target,
-                            items=items_target,
-                            add=False)
+    out.scale_add(element_in="production",
+                  element_out="imports",
+                  scale=scale_target,
+                  items=items_target,
+                  add=False)
 
     # Check for negative sources and correct
-    out = check_negative_source(out, "imports", "exports", add=False)
+    out.check_negative_source("imports", "exports", add=False)
 
     # Rewrite food data to datablock and return
-    datablock["food"]["g/cap/day"] = out
+    datablock["food"]["g/cap/day"] = out.to_xarray()
 
     return datablock
 
@@ -1654,11 +1918,10 @@ def compute_metrics(datablock, sector_emissions_dict):
     datablock["metrics"] = {}
 
     # nutritional_values
-    qty_keys = ["g_prot/cap/day", "g_fat/cap/day", "kCal/cap/day"]
-    nutrition_keys = ["g_prot/g_food", "g_fat/g_food", "kCal/g_food"]
+    per_cap = per_capita_quantities(datablock)
 
-    for qk, nk in zip(qty_keys, nutrition_keys):
-        datablock["food"][qk] = datablock["food"][nk] * datablock["food"]["g/cap/day"]
+    for quantity in ["protein", "fat", "energy"]:
+        datablock["food"][PER_CAPITA_QUANTITIES[quantity][0]] = per_cap.sel(Quantity=quantity, drop=True)
 
     # Emissions balance
     metric_yr = 2050
@@ -1712,19 +1975,18 @@ def compute_metrics(datablock, sector_emissions_dict):
 
     # SSR
     # ssr_metric = st.session_state["ssr_metric"]
-    ssr_metric_str = ["g/cap/day", "g_prot/cap/day", "g_fat/cap/day", "g_co2e/cap/day", "kCal/cap/day"]
-
-    for ssr_metric in ssr_metric_str:
-        gcapday = datablock["food"][ssr_metric].sel(Year=metric_yr).fillna(0)
-        gcapday = gcapday.fbs.group_sum(coordinate="Item_origin", new_name="Item")
-        gcapday_ref = datablock["food"][ssr_metric].sel(Year=2020).fillna(0)
-        gcapday_ref = gcapday_ref.fbs.group_sum(coordinate="Item_origin", new_name="Item")
-
-        SSR_ref = gcapday_ref.fbs.SSR()
-        SSR_metric_yr = gcapday.fbs.SSR()
-
-        datablock["metrics"][ssr_metric + "SSR_ref"] = SSR_ref
-        datablock["metrics"][ssr_metric + "SSR_metric_yr"] = SSR_metric_yr
+    # All quantities are grouped by origin and reduced at once, along the
+    # Quantity dimension
+    gcapday_all = per_cap.sel(Year=[2020, metric_yr]).fillna(0)
+    gcapday_all = gcapday_all.fbs.group_sum(coordinate="Item_origin", new_name="Item")
+    SSR_all = gcapday_all.fbs.SSR()
+
+    for quantity, (ssr_metric, _) in PER_CAPITA_QUANTITIES.items():
+        gcapday = gcapday_all.sel(Quantity=quantity, Year=metric_yr).drop_vars("Quantity")
+        gcapday_ref = gcapday_all.sel(Quantity=quantity, Year=2020).drop_vars("Quantity")
+
+        datablock["metrics"][ssr_metric + "SSR_ref"] = SSR_all.sel(Quantity=quantity, Year=2020).drop_vars("Quantity")
+        datablock["metrics"][ssr_metric + "SSR_metric_yr"] = SSR_all.sel(Quantity=quantity, Year=metric_yr).drop_vars("Quantity")
         datablock["metrics"][ssr_metric + "gcapday_item_origin"] = gcapday
         datablock["metrics"][ssr_metric + "gcapday_ref_item_origin"] = gcapday_ref
 
@@ -1813,33 +2075,36 @@ def compute_metrics(datablock, sector_emissions_dict):
             datablock["metrics"]["livestock"] = xr.concat([datablock["metrics"]["livestock"], da], dim="Item")
 
     # Land use
+    # Reduce the land use maps once. If they are dask backed, this is where the
+    # chunked computation of all the land nodes is carried out.
     pctg = datablock["land"]["percentage_land_use"]
-    totals = pctg.sum(dim=["x", "y"])
+    totals = land_totals(pctg)
+    baseline_totals = land_totals(datablock["land"]["baseline"])
 
     total_pasture = totals.sel(aggregate_class=["Improved grassland",
                                                 "Semi-natural grassland",
                                                 "Managed pasture",
                                                 "Silvopasture"]).sum().values
     
-    baseline_pasture = datablock["land"]["baseline"].sel(aggregate_class=["Improved grassland",
-                                                                          "Semi-natural grassland"]).sum().values
+    baseline_pasture = baseline_totals.sel(aggregate_class=["Improved grassland",
+                                                            "Semi-natural grassland"]).sum().values
 
     total_forest = totals.sel(aggregate_class=["Broadleaf woodland",
                                                "Coniferous woodland",
                                                "New Broadleaf woodland",
                                                "New Coniferous woodland"]).sum().values
     
-    new_forest_land = (total_forest - datablock["land"]["baseline"].sel(aggregate_class=["Broadleaf woodland", "Coniferous woodland"]).sum().values)
+    new_forest_land = (total_forest - baseline_totals.sel(aggregate_class=["Broadleaf woodland", "Coniferous woodland"]).sum().values)
     
-    baseline_forest = datablock["land"]["baseline"].sel(aggregate_class=["Broadleaf woodland",
-                                                                         "Coniferous woodland"]).sum().values
+    baseline_forest = baseline_totals.sel(aggregate_class=["Broadleaf woodland",
+                                                           "Coniferous woodland"]).sum().values
 
     total_arable = totals.sel(aggregate_class=["Arable",
                                                "Managed arable",
                                                "Mixed farming",
                                                "Agroforestry"]).sum().values
     
-    baseline_arable = datablock["land"]["baseline"].sel(aggregate_class=["Arable"]).sum().values
+    baseline_arable = baseline_totals.sel(aggregate_class=["Arable"]).sum().values
 
     new_arable_land_pctg = (total_arable - baseline_arable) / baseline_arable * 100
     new_pasture_land_pctg = (total_pasture - baseline_pasture) / baseline_pasture * 100
@@ -1922,6 +2187,6 @@ def label_new_forest(datablock):
         # Limit "Broadleaf woodland" to the baseline model
         land.loc[{"aggregate_class": w_type}] = land_baseline.sel(aggregate_class=w_type).where(new_w_mask, land.sel(aggregate_class=w_type))
 
-    datablock["land"]["percentage_land_use"] = land
+    datablock["land"]["percentage_land_use"] = persist_land(land)
 
     return datablock
\ No newline at end of file
@@ -0,0 +1,277 @@
+"""Multi-objective optimisation of the calculator outputs with NSGA-II.
+
+A population of scenarios evolves within the parameter bounds towards the
+trade-off front of several outputs at once, such as herd size, emissions and
+SSR, under the same constraints as the single objective runs. Each generation
+of offspring is evaluated as one batch through
+FFCObjectiveWithCache.calculate_many, so it runs in parallel with a
+parallel_batch.BatchPool.
+
+Constraints are handled with constrained domination: a feasible scenario
+dominates an infeasible one, and of two infeasible scenarios the one with
+the smaller total violation dominates. The result is the non-dominated set of
+every scenario evaluated during the run.
+
+Each objective is maximised, except those in MINIMIZED, which can be
+overridden with a "max:" or "min:" prefix, e.g. "min:herd size".
+"""
+
+import numpy as np
+
+from parallel_optimizer import constraint_violation
+
+# Outputs minimised by default, all other outputs are maximised
+MINIMIZED = ["emissions"]
+
+def parse_objectives(objectives):
+    """Returns a dictionary of output name -> sense, 1 to maximise and -1 to
+    minimise, from names with optional "max:" or "min:" prefixes"""
+
+    senses = {}
+    for objective in objectives:
+        prefix, sep, name = objective.partition(":")
+        if sep and prefix in ("max", "min"):
+            senses[name] = 1 if prefix == "max" else -1
+        else:
+            senses[objective] = -1 if objective in MINIMIZED else 1
+    return senses
+
+def dominance_matrix(F, violation):
+    """Returns a boolean matrix whose (i, j) element is True if candidate i
+    dominates candidate j under constrained domination. F holds the
+    objectives to minimise, with one row per candidate."""
+
+    feasible = violation <= 0
+
+    no_worse = np.all(F[:, None, :] <= F[None, :, :], axis=2)
+    better = np.any(F[:, None, :] < F[None, :, :], axis=2)
+    pareto = no_worse & better
+
+    both_feasible = feasible[:, None] & feasible[None, :]
+    both_infeasible = ~feasible[:, None] & ~feasible[None, :]
+
+    return (both_feasible & pareto) \
+        | (feasible[:, None] & ~feasible[None, :]) \
+        | (both_infeasible & (violation[:, None] < violation[None, :]))
+
+def non_dominated_fronts(F, violation):
+    """Sorts candidates into fronts. Returns the list of index arrays of
+    each front, the first being the non-dominated candidates."""
+
+    dominates = dominance_matrix(F, violation)
+    n_dominators = dominates.sum(axis=0)
+
+    fronts = []
+    remaining = np.ones(len(F), dtype=bool)
+    while remaining.any():
+        front = np.flatnonzero(remaining & (n_dominators == 0))
+        fronts.append(front)
+        remaining[front] = False
+        n_dominators = n_dominators - dominates[front].sum(axis=0)
+
+    return fronts
+
+def crowding_distance(F):
+    """Crowding distance of the candidates of a front"""
+
+    n, m = F.shape
+    distance = np.zeros(n)
+    if n <= 2:
+        distance[:] = np.inf
+        return distance
+
+    for k in range(m):
+        order = np.argsort(F[:, k], kind="stable")
+        span = F[order[-1], k] - F[order[0], k]
+        distance[order[[0, -1]]] = np.inf
+        if span > 0:
+            distance[order[1:-1]] += (F[order[2:], k] - F[order[:-2], k]) / span
+
+    return distance
+
+def _rank_and_crowding(F, violation):
+    rank = np.empty(len(F), dtype=int)
+    crowding = np.empty(len(F))
+    fronts = non_dominated_fronts(F, violation)
+    for i, front in enumerate(fronts):
+        rank[front] = i
+        crowding[front] = crowding_distance(F[front])
+    return rank, crowding, fronts
+
+def _tournament(rng, rank, crowding, n):
+    """Binary tournament selection of n parents"""
+    a, b = rng.integers(len(rank), size=(2, n))
+    a_wins = (rank[a] < rank[b]) | ((rank[a] == rank[b]) & (crowding[a] > crowding[b]))
+    return np.where(a_wins, a, b)
+
+def _sbx(rng, p1, p2, eta, probability):
+    """Simulated binary crossover in the unit box"""
+
+    u = rng.random(p1.shape)
+    beta = np.where(u <= 0.5, (2 * u)**(1 / (eta + 1)), (1 / (2 * (1 - u)))**(1 / (eta + 1)))
+
+    cross = (rng.random((len(p1), 1)) < probability) & (rng.random(p1.shape) < 0.5)
+    beta = np.where(cross, beta, 1.)
+
+    c1 = 0.5 * ((1 + beta) * p1 + (1 - beta) * p2)
+    c2 = 0.5 * ((1 - beta) * p1 + (1 + beta) * p2)
+    return np.clip(np.concatenate([c1, c2]), 0, 1)
+
+def _polynomial_mutation(rng, u, eta, probability):
+    """Polynomial mutation in the unit box"""
+
+    r = rng.random(u.shape)
+    delta = np.where(r < 0.5,
+                     (2 * r + (1 - 2 * r) * (1 - u)**(eta + 1))**(1 / (eta + 1)) - 1,
+                     1 - (2 * (1 - r) + 2 * (r - 0.5) * u**(eta + 1))**(1 / (eta + 1)))
+
+    mutate = rng.random(u.shape) < probability
+    return np.clip(np.where(mutate, u + delta, u), 0, 1)
+
+def nsga2(ffc_wrapper, objectives, x_bounds, constraints, x0=None, popsize=40,
+          generations=50, seed=0, eta_crossover=15, eta_mutation=20,
+          crossover_probability=0.9, calculator=None, verbosity=0):
+    """Evolves a population of scenarios towards the trade-off front of
+    several calculator outputs.
+
+    Parameters
+    ----------
+    ffc_wrapper : FFCObjectWithCache.FFCObjectiveWithCache
+        Objective wrapper. Each generation is evaluated with calculate_many.
+    objectives : list of str or dict
+        Outputs to optimise, parsed with parse_objectives, or a dictionary of
+        output name -> sense, 1 to maximise and -1 to minimise.
+    x_bounds : list of tuple
+        (min, max) bounds of each varied parameter.
+    constraints : dict
+        Output name -> (sign, threshold), as run_pipeline_scrip.CONSTRAINTS.
+    x0 : array_like, optional
+        Scenario included in the initial population, such as the baseline.
+    popsize : int, optional
+        Population size. Rounded up to an even number.
+    generations : int, optional
+        Number of generations.
+    seed : int, optional
+        Random seed. Runs with the same seed evaluate the same scenarios, so
+        resumed runs are replayed from the cache.
+    eta_crossover, eta_mutation : float, optional
+        Distribution indices of the SBX crossover and polynomial mutation.
+    crossover_probability : float, optional
+        Probability of crossover for each pair of parents.
+    calculator : callable, optional
+        Batch calculator passed to calculate_many, such as a BatchPool.
+    verbosity : int, optional
+        If larger than zero, prints the size of the front every generation.
+
+    Returns
+    -------
+    pareto : pandas.DataFrame
+        Non-dominated scenarios of all those evaluated, with one column per
+        varied parameter and per calculator output, and a "violation" column,
+        zero for feasible scenarios. Sorted by the first objective.
+    """
+
+    import pandas as pd
+
+    if not isinstance(objectives, dict):
+        objectives = parse_objectives(objectives)
+
+    unknown = set(objectives) - set(ffc_wrapper.z_names)
+    if unknown:
+        raise ValueError(f"Unknown objectives {sorted(unknown)}, choose from {ffc_wrapper.z_names}")
+
+    rng = np.random.default_rng(seed)
+
+    lower, upper = np.array(x_bounds, dtype=float).T
+    span = upper - lower
+    n = len(lower)
+    popsize += popsize % 2
+    mutation_probability = 1 / n
+
+    names = list(objectives)
+    senses = np.array([objectives[zn] for zn in names], dtype=float)
+
+    archive_x, archive_z = [], []
+
+    def evaluate(u):
+        x = lower + u * span
+        zs = ffc_wrapper.calculate_many(x.tolist(), calculator=calculator)
+        archive_x.extend(x.tolist())
+        archive_z.extend(zs)
+        F = np.array([[-s * float(z[zn]) for zn, s in zip(names, senses)] for z in zs])
+        violation = np.array([constraint_violation(z, constraints) for z in zs])
+        return F, violation
+
+    u = rng.random((popsize, n))
+    if x0 is not None:
+        u[0] = np.clip((np.asarray(x0, dtype=float) - lower) / np.where(span > 0, span, 1.), 0, 1)
+    F, violation = evaluate(u)
+    rank, crowding, fronts = _rank_and_crowding(F, violation)
+
+    for generation in range(1, generations + 1):
+
+        # Offspring of parents chosen by tournament
+        parents = _tournament(rng, rank, crowding, popsize)
+        children = _sbx(rng, u[parents[::2]], u[parents[1::2]], eta_crossover, crossover_probability)
+        children = _polynomial_mutation(rng, children, eta_mutation, mutation_probability)
+        F_children, violation_children = evaluate(children)
+
+        # Keep the best popsize of parents and offspring, filling the last
+        # front by crowding distance
+        u = np.concatenate([u, children])
+        F = np.concatenate([F, F_children])
+        violation = np.concatenate([violation, violation_children])
+        rank, crowding, fronts = _rank_and_crowding(F, violation)
+        survivors = np.lexsort((-crowding, rank))[:popsize]
+
+        u, F, violation = u[survivors], F[survivors], violation[survivors]
+        rank, crowding = rank[survivors], crowding[survivors]
+
+        if verbosity > 0:
+            n_feasible = int(np.sum(violation <= 0))
+            print(f"Generation {generation}: {int(np.sum(rank == 0))} scenarios in the front, "
+                  f"{n_feasible} of {popsize} feasible")
+
+    # Non-dominated set of every scenario evaluated
+    x_all, unique = np.unique(np.array(archive_x), axis=0, return_index=True)
+    z_all = [archive_z[i] for i in unique]
+    F_all = np.array([[-s * float(z[zn]) for zn, s in zip(names, senses)] for z in z_all])
+    violation_all = np.array([constraint_violation(z, constraints) for z in z_all])
+    front = non_dominated_fronts(F_all, violation_all)[0]
+
+    pareto = pd.DataFrame(x_all[front], columns=ffc_wrapper.names_x)
+    for zn in ffc_wrapper.z_names:
+        pareto[zn] = [float(z_all[i][zn]) for i in front]
+    pareto["violation"] = violation_all[front]
+
+    return pareto.sort_values(names[0], ascending=objectives[names[0]] < 0).reset_index(drop=True)
+
+def write_pareto(store, run_name, pareto, params_baseline, names_x, x_bounds, objectives,
+                 constraints, args=None, adv_set=None, elapsed_s=None):
+    """Adds every scenario of a Pareto set to the results store, as runs named
+    <run_name>_pareto<i> with source "nsga2". Returns their ids."""
+
+    from pipeline_setup import Z_NAMES
+
+    zreq = ", ".join(objectives)
+    ids = []
+    for i, row in pareto.iterrows():
+        ids.append(store.add_run(f"{run_name}_pareto{i:03d}", params_baseline,
+                                 bounds=dict(zip(names_x, x_bounds)),
+                                 x_opt={n: float(row[n]) for n in names_x},
+                                 z={zn: float(row[zn]) for zn in Z_NAMES},
+                                 zreq=zreq,
+                                 thresholds=constraints,
+                                 args=args,
+                                 adv_set=adv_set,
+                                 result={"success": row["violation"] <= 0,
+                                         "message": f"Pareto set of {len(pareto)} scenarios"},
+                                 elapsed_s=elapsed_s,
+                                 source="nsga2",
+                                 optimizer="NSGA2"))
+    return ids
+
+def load_pareto(store, run_name):
+    """Returns the Pareto set of a run from the results store as a DataFrame"""
+    return store.to_dataframe(where="run_name GLOB ? AND source = ?",
+                              params=(f"{run_name}_pareto[0-9]*", "nsga2"))
@@ -0,0 +1,106 @@
+"""Parallel evaluation of batches of parameter sets.
+
+BatchPool runs the calculator on a pool of worker processes. The datablock
+is published once in shared memory, see shared_datablock, and every worker
+attaches to it when it starts, so only the parameter sets and the outputs are
+sent for each evaluation. A pool is a batch calculator, which can be passed
+to FFCObjectiveWithCache.calculate_many, so a whole generation or poll set of
+an optimiser is evaluated at once, with one evaluation per worker at a time.
+
+Usage
+-----
+with BatchPool(datablock, workers=8) as pool:
+    zs = ffc_wrapper.calculate_many(xs, calculator=pool)
+"""
+
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from pipeline_setup import run_calculator, run_calculator_batch
+
+# Datablock attached by each worker process
+_worker = {}
+
+def _init_worker(manifest):
+    from shared_datablock import attach_datablock
+    _worker["datablock"] = attach_datablock(manifest)
+
+def _evaluate(params, endpoint_years=None, outputs=None):
+    result = run_calculator(_worker["datablock"], params, endpoint_years=endpoint_years,
+                            outputs=outputs)
+    if outputs is None:
+        return tuple(float(z) for z in result)
+    z_values, extra = result
+    return tuple(float(z) for z in z_values), extra
+
+
+class BatchPool:
+    """Batch calculator evaluating parameter sets on worker processes.
+
+    Parameters
+    ----------
+    datablock : dict
+        Datablock, as returned by datablock_setup, shared with the workers.
+    workers : int, optional
+        Number of worker processes. Defaults to the number of CPUs. With a
+        single worker, batches are evaluated in this process.
+    """
+
+    def __init__(self, datablock, workers=None):
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        self.datablock = datablock
+        self.workers = workers
+        self._shared = None
+        self._executor = None
+
+        if workers > 1:
+            from shared_datablock import SharedDatablock
+
+            self._shared = SharedDatablock(datablock)
+            self._executor = ProcessPoolExecutor(max_workers=workers,
+                                                 initializer=_init_worker,
+                                                 initargs=(self._shared.manifest,))
+
+    def __call__(self, datablock, params_list, endpoint_years=None, outputs=None):
+        """Evaluates a list of parameter sets and returns their outputs in the
+        same order. Identical parameter sets are only evaluated once.
+        endpoint_years and outputs are passed to run_calculator."""
+
+        if datablock is not self.datablock:
+            raise ValueError("BatchPool can only evaluate the datablock it was created with")
+
+        if self._executor is None:
+            return run_calculator_batch(datablock, params_list, endpoint_years=endpoint_years,
+                                        outputs=outputs)
+
+        from pipeline_setup import params_key
+
+        unique = {}
+        for params in params_list:
+            unique.setdefault(params_key(params), params)
+
+        chunksize = max(1, len(unique) // (4 * self.workers))
+        evaluate = functools.partial(_evaluate, endpoint_years=endpoint_years, outputs=outputs)
+        results = dict(zip(unique, self._executor.map(evaluate, unique.values(),
+                                                      chunksize=chunksize)))
+
+        return [results[params_key(params)] for params in params_list]
+
+    def close(self):
+        """Stops the workers and releases the shared datablock"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._shared is not None:
+            self._shared.close()
+            self._shared = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
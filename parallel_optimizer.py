@@ -0,0 +1,170 @@
+"""Batch parallel CMA-ES optimiser for the calculator.
+
+COBYLA evaluates one point per step. CMA-ES samples a whole generation of
+candidates from a multivariate normal distribution, evaluates them as a
+single batch, and adapts the mean, step size and covariance of the
+distribution from the best ranked candidates. With a BatchPool as the batch
+calculator, each generation runs in parallel, so the wall time per
+generation scales with the number of cores.
+
+The search runs in coordinates normalised to the unit box of x_bounds.
+Candidates outside the box are projected onto it before they are evaluated,
+and the projected points are used to update the distribution, so the search
+can converge on a bound.
+
+Constraints are handled by feasibility ranking: feasible candidates rank
+before infeasible ones, feasible candidates by objective, and infeasible ones
+by their total constraint violation, relative to each threshold.
+"""
+
+import numpy as np
+
+def constraint_violation(z, constraints):
+    """Total relative violation of the constraints by a dictionary of
+    calculator outputs. Constraints map an output name to (sign, threshold),
+    with sign 1 for z >= threshold and -1 for z <= threshold."""
+
+    violation = 0.
+    for z_name, (sign, threshold) in constraints.items():
+        excess = max(0., sign * (threshold - float(z[z_name])))
+        violation += excess / max(abs(threshold), 1.)
+    return violation
+
+def feasibility_order(f, violation):
+    """Indices that sort candidates by feasibility, then by objective f for
+    feasible candidates and by violation for infeasible ones"""
+
+    feasible = violation <= 0
+    return np.lexsort((np.where(feasible, f, violation), ~feasible))
+
+def cmaes(ffc_wrapper, z_name, x0, x_bounds, constraints, maxiter=100, popsize=None,
+          sigma0=0.25, tol=1e-6, seed=0, maximize=True, calculator=None, verbosity=0):
+    """Optimises an output of the calculator with CMA-ES.
+
+    Parameters
+    ----------
+    ffc_wrapper : FFCObjectWithCache.FFCObjectiveWithCache
+        Objective wrapper. Each generation is evaluated with calculate_many.
+    z_name : str
+        Name of the output to optimise.
+    x0 : array_like
+        Initial mean of the search distribution.
+    x_bounds : list of tuple
+        (min, max) bounds of each varied parameter.
+    constraints : dict
+        Output name -> (sign, threshold), as run_pipeline_scrip.CONSTRAINTS.
+    maxiter : int, optional
+        Maximum number of generations.
+    popsize : int, optional
+        Candidates per generation. Defaults to 4 + 3 ln(n) for n parameters.
+    sigma0 : float, optional
+        Initial step size, as a fraction of the bound ranges.
+    tol : float, optional
+        Stops when the standard deviation of the distribution along every
+        axis is below tol, as a fraction of the bound ranges.
+    seed : int, optional
+        Random seed. Runs with the same seed evaluate the same candidates, so
+        resumed runs are replayed from the cache.
+    maximize : bool, optional
+        Maximise the output instead of minimising it.
+    calculator : callable, optional
+        Batch calculator passed to calculate_many, such as a BatchPool.
+    verbosity : int, optional
+        If larger than zero, prints the best candidate of each generation.
+
+    Returns
+    -------
+    result : scipy.optimize.OptimizeResult
+        Best feasible point "x", or the least infeasible one if none is
+        feasible, with "fun" the value minimised (the negative output when
+        maximising), "success" True if it is feasible, "nfev" the number of
+        candidates evaluated and "nit" the number of generations.
+    """
+
+    from scipy.optimize import OptimizeResult
+
+    rng = np.random.default_rng(seed)
+
+    lower, upper = np.array(x_bounds, dtype=float).T
+    span = np.where(upper > lower, upper - lower, 1.)
+    sign = -1. if maximize else 1.
+
+    n = len(lower)
+    lam = popsize or 4 + int(3 * np.log(n))
+    mu = lam // 2
+
+    # Recombination weights and strategy parameters
+    weights = np.log(mu + 0.5) - np.log(np.arange(1, mu + 1))
+    weights /= weights.sum()
+    mueff = 1 / np.sum(weights**2)
+
+    cc = (4 + mueff / n) / (n + 4 + 2 * mueff / n)
+    cs = (mueff + 2) / (n + mueff + 5)
+    c1 = 2 / ((n + 1.3)**2 + mueff)
+    cmu = min(1 - c1, 2 * (mueff - 2 + 1 / mueff) / ((n + 2)**2 + mueff))
+    damps = 1 + 2 * max(0, np.sqrt((mueff - 1) / (n + 1)) - 1) + cs
+    chi_n = np.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n**2))
+
+    mean = np.clip((np.asarray(x0, dtype=float) - lower) / span, 0, 1)
+    sigma = sigma0
+    C = np.eye(n)
+    pc = np.zeros(n)
+    ps = np.zeros(n)
+
+    best = None
+    nfev = 0
+    message = f"Maximum number of generations ({maxiter}) reached"
+
+    for generation in range(1, maxiter + 1):
+
+        eigenvalues, B = np.linalg.eigh(C)
+        D = np.sqrt(np.maximum(eigenvalues, 1e-20))
+
+        u = mean + sigma * (rng.standard_normal((lam, n)) * D) @ B.T
+        u = np.clip(u, 0, 1)
+        x = lower + u * span
+
+        zs = ffc_wrapper.calculate_many(x.tolist(), calculator=calculator)
+        nfev += lam
+
+        f = np.array([sign * float(z[z_name]) for z in zs])
+        violation = np.array([constraint_violation(z, constraints) for z in zs])
+        order = feasibility_order(f, violation)
+
+        i_best = order[0]
+        candidate = (violation[i_best] > 0, violation[i_best] if violation[i_best] > 0 else f[i_best])
+        if best is None or candidate < best[0]:
+            best = (candidate, x[i_best], f[i_best], violation[i_best])
+
+        if verbosity > 0:
+            print(f"Generation {generation}: best {z_name} = {sign * f[i_best]:.8g}, "
+                  f"violation = {violation[i_best]:.3g}, sigma = {sigma:.3g}")
+
+        # Update the mean from the best candidates, as projected on the box
+        y = (u[order[:mu]] - mean) / sigma
+        y_w = weights @ y
+        mean = mean + sigma * y_w
+
+        # Cumulate the evolution paths
+        C_inv_sqrt = B @ np.diag(1 / D) @ B.T
+        ps = (1 - cs) * ps + np.sqrt(cs * (2 - cs) * mueff) * C_inv_sqrt @ y_w
+        h_sigma = np.linalg.norm(ps) / np.sqrt(1 - (1 - cs)**(2 * generation)) < (1.4 + 2 / (n + 1)) * chi_n
+        pc = (1 - cc) * pc + h_sigma * np.sqrt(cc * (2 - cc) * mueff) * y_w
+
+        # Adapt the covariance matrix and the step size
+        C = (1 - c1 - cmu) * C \
+            + c1 * (np.outer(pc, pc) + (1 - h_sigma) * cc * (2 - cc) * C) \
+            + cmu * (y.T * weights) @ y
+        C = (C + C.T) / 2
+        sigma *= np.exp((cs / damps) * (np.linalg.norm(ps) / chi_n - 1))
+
+        if sigma * np.sqrt(np.max(np.diag(C))) < tol:
+            message = f"Step size below tolerance ({tol}) after {generation} generations"
+            break
+
+    _, x_best, f_best, violation_best = best
+
+    return OptimizeResult(x=x_best, fun=f_best, success=bool(violation_best <= 0),
+                          message=message if violation_best <= 0 else
+                                  f"{message}, no feasible point found",
+                          nfev=nfev, nit=generation, maxcv=violation_best)
@@ -1,30 +1,80 @@
-from agrifoodpy.pipeline import Pipeline
 from datablock_setup import *
 from model import *
 
-#from datablock_setup import datablock_setup
-#from pipeline_setup import pipeline_setup
-import matplotlib.pyplot as plt
+# agrifoodpy and pandas are imported where they are used, to keep the import
+# of this module, and of the worker processes that use it, fast
 import xarray as xr
 import copy
 import numpy as np
-import pandas as pd
+
+# Published Google sheets with the advanced settings and parameter ranges
+ADVANCED_SETTINGS_URL = "https://docs.google.com/spreadsheets/d/e/2PACX-1vTanjc08kc5vIN-icUMzMEGA9bJuDesLX8V_u2Ab6zSC4MOhLZ8Jrr18DL9o4ofKIrSq6FsJXhPWu3F/pub?gid=0&single=true&output=csv"
+RANGES_WORKSHEET_URL = "https://docs.google.com/spreadsheets/d/e/2PACX-1vRXLuSuuxfTx1tUilnO1KojbaGiO-o-rtf1OtsQ0YHetV-OozWH1BXc7N-1Y9jG9Ue2ys7mcf-SzPc3/pub?gid=1034155472&single=true&output=csv"
 
 def read_advanced_settings(advanced_settings_url):
-    """Reads the advanced settings from the spreadsheet URL"""
+    """Reads the advanced settings from the spreadsheet URL, or from a local
+    CSV file or file-like object with the same contents"""
+    import pandas as pd
+
     advanced_settings  = pd.read_csv(advanced_settings_url, dtype='string')
-    advanced_settings_dict = {}
-
-    for index, row in advanced_settings.iterrows():
-        if row["type"] == "float": 
-            advanced_settings_dict[row["key"]] = float(row["value"])
-        elif row["type"] == "string":
-            advanced_settings_dict[row["key"]] = str(row["value"])
-        elif row["type"] == "bool":
-            advanced_settings_dict[row["key"]] = row["value"] == "TRUE"
+    setting_type = advanced_settings["type"]
+    value = advanced_settings["value"]
+
+    # Convert each type of setting at once, keeping the spreadsheet order
+    parsed = pd.Series(None, index=advanced_settings.index, dtype=object)
+    is_float = (setting_type == "float").fillna(False).to_numpy(dtype=bool)
+    is_string = (setting_type == "string").fillna(False).to_numpy(dtype=bool)
+    is_bool = (setting_type == "bool").fillna(False).to_numpy(dtype=bool)
+    parsed[is_float] = value[is_float].astype(float).tolist()
+    parsed[is_string] = value[is_string].fillna("nan").tolist()
+    parsed[is_bool] = (value[is_bool] == "TRUE").fillna(False).tolist()
+
+    known = is_float | is_string | is_bool
+    advanced_settings_dict = dict(zip(advanced_settings["key"][known].tolist(),
+                                      parsed[known].tolist()))
     
     return advanced_settings_dict
 
+def read_ranges(ranges_worksheet_url):
+    """Reads the parameter ranges from the ranges spreadsheet URL, or from a
+    local CSV file or file-like object with the same contents.
+
+    Returns a dictionary with a (min, max) tuple for each parameter, for each
+    range name in the sheet. Parameters with a missing minimum or maximum are
+    left out.
+    """
+    import pandas as pd
+
+    # Read parameter ranges from scenarios spreadsheet
+    ranges = pd.read_csv(ranges_worksheet_url, dtype='string', skiprows=2)
+    param_cols = ranges.columns[3:]  # Skip the "Name" columns
+
+    # Split "Max " and "Min " prefixes from the range names
+    names = ranges["Name"].dropna()
+    kind = names.str.extract(r"^(Max|Min) ", expand=False)
+    unique_names = names.str.replace(r"^(Max |Min )", "", regex=True).unique()
+
+    # First "Min" and "Max" row of each range
+    def bound_rows(prefix):
+        rows = ranges.loc[names.index[kind == prefix]]
+        rows = rows.set_index(rows["Name"].str.slice(len(prefix) + 1))
+        rows = rows[~rows.index.duplicated(keep="first")]
+        missing = set(unique_names) - set(rows.index)
+        if missing:
+            raise KeyError(f"No '{prefix}' row for ranges {sorted(missing)}")
+        return rows.loc[unique_names, param_cols].astype(float).to_numpy()
+
+    min_rows = bound_rows("Min")
+    max_rows = bound_rows("Max")
+    valid = ~(pd.isna(min_rows) | pd.isna(max_rows))
+
+    ranges_dict = {}
+    for i, name in enumerate(unique_names):
+        ranges_dict[name] = {col: (float(min_rows[i, j]), float(max_rows[i, j]))
+                             for j, col in enumerate(param_cols) if valid[i, j]}
+
+    return ranges_dict
+
 def set_sector_emissions_dict():
 
     sector_emissions_dict = {
@@ -44,14 +94,60 @@ def set_sector_emissions_dict():
     }
     return sector_emissions_dict
 
+# Names of the outputs returned by run_calculator, in order
+Z_NAMES = ["SSR weight",
+           "SSR prot",
+           "SSR fat",
+           "SSR kcal",
+           "emissions",
+           "herd size",
+           "animals",
+           "woodland"]
+
+# Years evaluated after the 2020 baseline in endpoint years mode. The outputs
+# only use 2020 and 2050, and 2021 is the pivot year of the adoption curves.
+ENDPOINT_YEARS = [2021, 2050]
+
+def emissions_series(datablock):
+    """Returns the yearly production emissions of a calculator run in Gt CO2e,
+    the input of the FaIR temperature response"""
+
+    g_co2e_year = datablock["impact"]["g_co2e/year"]["production"].sum(dim="Item")
+    return g_co2e_year * 1e-15
+
+# Additional outputs that run_calculator can return on request
+OPTIONAL_OUTPUTS = {"emissions_series": emissions_series}
+
 # Set the pipeline
-def run_calculator(input_datablock, params, timing=False):
+def run_calculator(input_datablock, params, timing=False, endpoint_years=None,
+                   outputs=None, memory=None):
 
-    datablock_copy = copy.deepcopy(input_datablock)
-    food_system = Pipeline(datablock_copy)
+    from agrifoodpy.pipeline import Pipeline
+
+    # Override the evaluation mode set in the parameters
+    if endpoint_years is not None:
+        params = dict(params, endpoint_years=endpoint_years)
+
+    if memory is None:
+        datablock_copy = copy.deepcopy(input_datablock)
+        food_system = Pipeline(datablock_copy)
+
+        food_system = pipeline_setup(food_system, params)
+        food_system.run(timing=timing)
+
+    else:
+        # Measure the memory used by the copy and by each node
+        memory.start()
+        try:
+            datablock_copy = memory.measure("deepcopy", copy.deepcopy, input_datablock)
+            food_system = Pipeline(datablock_copy)
+
+            food_system = pipeline_setup(food_system, params)
+            memory.instrument(food_system)
+            food_system.run(timing=timing)
+        finally:
+            memory.stop()
 
-    food_system = pipeline_setup(food_system, params)
-    food_system.run(timing=timing)
     datablock_result = food_system.datablock
 
     SSR_gram = datablock_result["metrics"]["g/cap/daySSR_metric_yr"]
@@ -63,15 +159,85 @@ def run_calculator(input_datablock, params, timing=False):
     animals_counts = datablock_result["metrics"]["all_animals"].isel(Year=-1)
     woodland = datablock_result["metrics"]["total_forest"]
 
-    return SSR_gram.to_numpy(), \
-           SSR_prot.to_numpy(), \
-           SSR_fat.to_numpy(), \
-           SSR_kcal.to_numpy(), \
-           total_emissions, \
-           herd_size.to_numpy(), \
-           animals_counts.to_numpy(), \
-           woodland
+    z_values = SSR_gram.to_numpy(), \
+               SSR_prot.to_numpy(), \
+               SSR_fat.to_numpy(), \
+               SSR_kcal.to_numpy(), \
+               total_emissions, \
+               herd_size.to_numpy(), \
+               animals_counts.to_numpy(), \
+               woodland
+
+    # With requested optional outputs, also return them in a dictionary
+    if outputs is None:
+        return z_values
+
+    return z_values, {name: OPTIONAL_OUTPUTS[name](datablock_result) for name in outputs}
+
+
+def params_key(params):
+    """Returns a hashable key identifying a parameter set, its content
+    fingerprint. Numeric values are compared as floats, so that 0 and 0.0
+    give the same key."""
+
+    from fingerprint import fingerprint_params
+
+    return fingerprint_params(params)
+
+def check_endpoint_years(input_datablock, params, rtol=1e-12):
+    """Checks that the endpoint years mode gives the same outputs as the full
+    trajectory for a parameter set.
+
+    Returns
+    -------
+    differences : dict
+        Maximum relative difference of each output, keyed by z name.
+
+    Raises
+    ------
+    AssertionError
+        If any difference is larger than rtol.
+    """
+
+    full = run_calculator(input_datablock, params, endpoint_years=False)
+    endpoint = run_calculator(input_datablock, params, endpoint_years=True)
+
+    differences = {}
+    for zn, z_full, z_endpoint in zip(Z_NAMES, full, endpoint):
+        z_full = np.asarray(z_full, dtype=float)
+        z_endpoint = np.asarray(z_endpoint, dtype=float)
+        scale = np.maximum(np.abs(z_full), np.finfo(float).tiny)
+        differences[zn] = float(np.max(np.abs(z_endpoint - z_full) / scale))
+
+    failed = {zn: d for zn, d in differences.items() if not d <= rtol}
+    if failed:
+        raise AssertionError(f"Endpoint years outputs differ from the full trajectory: {failed}")
+
+    return differences
+
+def run_calculator_batch(input_datablock, params_list, timing=False,
+                         endpoint_years=None, outputs=None, memory=None):
+    """Runs the calculator for a list of parameter sets.
+
+    Identical parameter sets are only evaluated once. endpoint_years, outputs
+    and memory are passed to run_calculator.
+
+    Returns
+    -------
+    results : list
+        run_calculator outputs, in the same order as params_list.
+    """
+
+    unique = {}
+    for params in params_list:
+        unique.setdefault(params_key(params), params)
+
+    results = {key: run_calculator(input_datablock, params, timing=timing,
+                                   endpoint_years=endpoint_years, outputs=outputs,
+                                   memory=memory)
+               for key, params in unique.items()}
 
+    return [results[params_key(params)] for params in params_list]
 
 # Set the scenario parameters - ideally switch to using spreadsheet instead of this
 def set_baseline_scenario(params):
@@ -134,7 +300,8 @@ def pipeline_setup(food_system, params):
 
     # Consumer demand
     food_system.add_node(project_future,
-                            {"yield_change":params["yield_proj"]})
+                            {"yield_change":params["yield_proj"],
+                             "years":ENDPOINT_YEARS if params.get("endpoint_years", False) else None})
     
     food_system.add_node(item_scaling_multiple,
                          {"scale":[1+params["ruminant"]/100,
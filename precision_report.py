@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+from datablock_setup import cast_datablock
+from pipeline_setup import run_calculator, Z_NAMES
+
+def sample_scenarios(params_baseline, names_x, x_bounds, n_samples, seed=0):
+    """Draws scenarios uniformly within the parameter bounds.
+
+    Parameters
+    ----------
+    params_baseline : dict
+        Baseline parameters. Parameters not in names_x keep their value.
+    names_x : list
+        Names of the varied parameters.
+    x_bounds : list of tuple
+        (min, max) bounds for each varied parameter.
+    n_samples : int
+        Number of scenarios to draw. The baseline is always included as the
+        first scenario.
+    seed : int, optional
+        Random seed.
+
+    Returns
+    -------
+    scenarios : list of dict
+    """
+
+    rng = np.random.default_rng(seed)
+    lower, upper = np.array(x_bounds, dtype=float).T
+
+    scenarios = [params_baseline.copy()]
+    for x in rng.uniform(lower, upper, size=(n_samples - 1, len(names_x))):
+        params = params_baseline.copy()
+        params.update(zip(names_x, x.tolist()))
+        scenarios.append(params)
+
+    return scenarios
+
+def precision_report(datablock, scenarios, dtype=np.float32, verbosity=0):
+    """Compares the calculator outputs in reduced precision against float64.
+
+    Parameters
+    ----------
+    datablock : dict
+        Full precision datablock, as returned by datablock_setup.
+    scenarios : list of dict
+        Parameter sets to evaluate.
+    dtype : numpy dtype, optional
+        Reduced precision to evaluate.
+    verbosity : int, optional
+        If larger than zero, prints progress for every scenario.
+
+    Returns
+    -------
+    report : pandas.DataFrame
+        Maximum absolute and relative errors, and mean relative error, for each
+        of the calculator outputs over the scenario sample.
+    """
+
+    datablock_low = cast_datablock(datablock, dtype)
+
+    z_ref = np.zeros((len(scenarios), len(Z_NAMES)))
+    z_low = np.zeros((len(scenarios), len(Z_NAMES)))
+
+    for i, params in enumerate(scenarios):
+        z_ref[i] = [float(z) for z in run_calculator(datablock, params)]
+        z_low[i] = [float(z) for z in run_calculator(datablock_low, params)]
+        if verbosity > 0:
+            print(f"Scenario {i+1}/{len(scenarios)} evaluated")
+
+    abs_err = np.abs(z_low - z_ref)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rel_err = np.where(z_ref != 0, abs_err / np.abs(z_ref), 0)
+
+    report = pd.DataFrame({"max abs error": abs_err.max(axis=0),
+                           "max rel error": rel_err.max(axis=0),
+                           "mean rel error": rel_err.mean(axis=0)},
+                          index=pd.Index(Z_NAMES, name="output"))
+
+    return report
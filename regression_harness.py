@@ -0,0 +1,244 @@
+"""Regression harness for the calculator outputs and performance.
+
+A fixed set of reference scenarios is run through run_calculator on a cached
+snapshot of the datablock. Their eight outputs are compared against golden
+values, and their runtime and peak memory against the golden measurements,
+so a change to the model is checked for correctness and speed together.
+
+The golden file stores the baseline parameters and the full parameter set of
+every scenario, so checks do not need the settings and ranges sheets. Golden
+times depend on the machine, so they should be recorded on the machine that
+runs the checks, with --update-golden, whenever a change to the outputs or
+the performance is intended.
+
+Usage
+-----
+# Record the golden values
+python regression_harness.py --update-golden --settings-snapshot snapshots/settings --ranges-snapshot snapshots/ranges
+
+# Check the current model against them
+python regression_harness.py
+"""
+
+import argparse
+import json
+import os
+import pickle
+import sys
+import time
+import warnings
+from datetime import datetime
+
+import numpy as np
+
+from fingerprint import fingerprint_datablock
+from pipeline_setup import run_calculator, Z_NAMES
+
+DEFAULT_GOLDEN = "regression_golden.json"
+DEFAULT_SNAPSHOT = "regression_datablock.pkl"
+
+# Default tolerances of the checks
+RTOL = 1e-9
+ATOL = 1e-12
+TIME_FACTOR = 1.5
+TIME_SLACK_S = 0.05
+MEMORY_FACTOR = 1.2
+
+def load_datablock_snapshot(path=DEFAULT_SNAPSHOT, rebuild=False, **datablock_kwargs):
+    """Returns the datablock stored in a snapshot file, building it with
+    datablock_setup and saving it first if the file is missing or rebuild is
+    set"""
+
+    if os.path.exists(path) and not rebuild:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    from datablock_setup import datablock_setup
+
+    datablock = datablock_setup(**datablock_kwargs)
+    with open(path, "wb") as f:
+        pickle.dump(datablock, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    return datablock
+
+def reference_scenarios(params_baseline, names_x, x_bounds, n_samples=6, seed=0):
+    """Returns the reference scenarios as a list of (name, params) pairs: the
+    baseline, every lever at its lower and at its upper bound, and n_samples
+    - 1 scenarios drawn uniformly within the bounds"""
+
+    from precision_report import sample_scenarios
+
+    lower, upper = np.array(x_bounds, dtype=float).T
+
+    sampled = sample_scenarios(params_baseline, names_x, x_bounds, n_samples, seed=seed)
+
+    scenarios = [("baseline", sampled[0]),
+                 ("lower", dict(params_baseline, **dict(zip(names_x, lower.tolist())))),
+                 ("upper", dict(params_baseline, **dict(zip(names_x, upper.tolist()))))]
+    scenarios += [(f"sample_{i}", params) for i, params in enumerate(sampled[1:], start=1)]
+
+    return scenarios
+
+def measure_scenario(datablock, params, repeats=3):
+    """Runs a scenario and returns its outputs, its best time over repeats,
+    and its peak traced memory, measured in a separate run"""
+
+    from memory_profile import MemoryProfile
+
+    times = []
+    for _ in range(repeats):
+        t_start = time.perf_counter()
+        z_values = run_calculator(datablock, params)
+        times.append(time.perf_counter() - t_start)
+
+    profile = MemoryProfile()
+    run_calculator(datablock, params, memory=profile)
+
+    return {"z": {zn: float(z) for zn, z in zip(Z_NAMES, z_values)},
+            "time_s": min(times),
+            "peak_bytes": int(profile.peak_bytes)}
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def write_golden(path, datablock, params_baseline, scenarios, repeats=3, verbosity=0):
+    """Measures the reference scenarios and writes them to a golden file"""
+
+    datablock = dict(datablock, **params_baseline)
+
+    golden = {"created": datetime.now().isoformat(timespec="seconds"),
+              "datablock": fingerprint_datablock(datablock),
+              "z_names": list(Z_NAMES),
+              "params_baseline": params_baseline,
+              "scenarios": []}
+
+    for name, params in scenarios:
+        measured = measure_scenario(datablock, params, repeats=repeats)
+        golden["scenarios"].append({"name": name, "params": params, **measured})
+        if verbosity > 0:
+            print(f"{name}: {measured['time_s']:.3f} s, {measured['peak_bytes'] / 2**20:.1f} MB")
+
+    with open(path, "w") as f:
+        json.dump(golden, f, indent=1, default=_json_default)
+
+    return golden
+
+def check_golden(datablock, golden, rtol=RTOL, atol=ATOL, time_factor=TIME_FACTOR,
+                 time_slack_s=TIME_SLACK_S, memory_factor=MEMORY_FACTOR, repeats=3,
+                 verbosity=0):
+    """Checks the reference scenarios against their golden values.
+
+    A scenario fails if any output differs from its golden value by more
+    than atol + rtol * |golden|, if its time is over time_factor times the
+    golden time plus time_slack_s, or if its peak memory is over
+    memory_factor times the golden peak.
+
+    Returns
+    -------
+    report : pandas.DataFrame
+        One row per scenario with the largest output error relative to the
+        tolerance, the time and peak memory ratios to the golden values, and
+        the list of failed checks.
+    """
+
+    import pandas as pd
+
+    if list(golden["z_names"]) != list(Z_NAMES):
+        raise ValueError(f"Golden outputs {golden['z_names']} do not match {Z_NAMES}")
+
+    datablock = dict(datablock, **golden["params_baseline"])
+
+    # Output differences may come from a different datablock snapshot rather
+    # than from the model
+    if "datablock" in golden and fingerprint_datablock(datablock) != golden["datablock"]:
+        warnings.warn("The datablock snapshot differs from the one the golden values were recorded with")
+
+    rows = []
+    for scenario in golden["scenarios"]:
+        measured = measure_scenario(datablock, scenario["params"], repeats=repeats)
+
+        z_golden = np.array([scenario["z"][zn] for zn in Z_NAMES])
+        z_new = np.array([measured["z"][zn] for zn in Z_NAMES])
+        error = np.abs(z_new - z_golden) / (atol + rtol * np.abs(z_golden))
+        error[np.isnan(z_new) & np.isnan(z_golden)] = 0
+
+        time_ratio = measured["time_s"] / scenario["time_s"]
+        memory_ratio = measured["peak_bytes"] / max(scenario["peak_bytes"], 1)
+
+        failed = [zn for zn, e in zip(Z_NAMES, error) if not e <= 1]
+        if measured["time_s"] > time_factor * scenario["time_s"] + time_slack_s:
+            failed.append("time")
+        if measured["peak_bytes"] > memory_factor * scenario["peak_bytes"]:
+            failed.append("memory")
+
+        rows.append({"scenario": scenario["name"],
+                     "output error / tol": float(np.nanmax(error)),
+                     "time_s": measured["time_s"],
+                     "time ratio": time_ratio,
+                     "peak MB": measured["peak_bytes"] / 2**20,
+                     "memory ratio": memory_ratio,
+                     "failed": ", ".join(failed)})
+
+        if verbosity > 0:
+            print(f"{scenario['name']}: {'FAILED ' + rows[-1]['failed'] if failed else 'ok'}")
+
+    return pd.DataFrame(rows).set_index("scenario")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the calculator outputs, runtime and memory against golden values")
+    parser.add_argument('--golden', type=str, help='Golden values file', default=DEFAULT_GOLDEN)
+    parser.add_argument('--snapshot', type=str, help='Datablock snapshot file, built with datablock_setup if missing', default=DEFAULT_SNAPSHOT)
+    parser.add_argument('--rebuild_snapshot', action='store_true', help='Rebuild the datablock snapshot')
+    parser.add_argument('--update-golden', action='store_true', help='Record new golden values instead of checking them')
+    parser.add_argument('--ranges', type=str, help='Name of parameter ranges on range spreadsheet, with --update-golden', default="JPSarah1618 Thu19Jun25")
+    parser.add_argument('--settings-snapshot', type=str, help='Advanced settings CSV snapshot or snapshot directory, with --update-golden', default=None)
+    parser.add_argument('--ranges-snapshot', type=str, help='Parameter ranges CSV snapshot or snapshot directory, with --update-golden', default=None)
+    parser.add_argument('--n_samples', type=int, help='Number of sampled reference scenarios, with --update-golden', default=6)
+    parser.add_argument('--repeats', type=int, help='Timed runs of each scenario, the best time is used', default=3)
+    parser.add_argument('--rtol', type=float, help='Relative tolerance of the outputs', default=RTOL)
+    parser.add_argument('--atol', type=float, help='Absolute tolerance of the outputs', default=ATOL)
+    parser.add_argument('--time_factor', type=float, help='Allowed slowdown factor', default=TIME_FACTOR)
+    parser.add_argument('--time_slack', type=float, help='Allowed slowdown in seconds, on top of the factor', default=TIME_SLACK_S)
+    parser.add_argument('--memory_factor', type=float, help='Allowed peak memory growth factor', default=MEMORY_FACTOR)
+    args = parser.parse_args(argv)
+
+    datablock = load_datablock_snapshot(args.snapshot, rebuild=args.rebuild_snapshot)
+
+    if args.update_golden:
+        from sheet_snapshots import load_sheet
+        from run_pipeline_scrip import names_bounds
+        from pipeline_setup import set_baseline_scenario
+
+        adv_set_dict = load_sheet("settings", args.settings_snapshot)
+        ranges_dict = load_sheet("ranges", args.ranges_snapshot)
+        names_x, x_bounds, names_fixed, values_fixed = names_bounds(ranges_dict[args.ranges])
+
+        params_baseline = set_baseline_scenario(adv_set_dict)
+        params_baseline.update(zip(names_fixed, values_fixed))
+
+        scenarios = reference_scenarios(params_baseline, names_x, x_bounds, args.n_samples)
+        write_golden(args.golden, datablock, params_baseline, scenarios,
+                     repeats=args.repeats, verbosity=1)
+        print(f"Golden values for {len(scenarios)} scenarios written to {args.golden}")
+        return
+
+    with open(args.golden) as f:
+        golden = json.load(f)
+
+    report = check_golden(datablock, golden, rtol=args.rtol, atol=args.atol,
+                          time_factor=args.time_factor, time_slack_s=args.time_slack,
+                          memory_factor=args.memory_factor, repeats=args.repeats)
+    print(report.to_string())
+
+    failed = report[report["failed"] != ""]
+    if len(failed):
+        print(f"{len(failed)} of {len(report)} scenarios failed")
+        sys.exit(1)
+
+    print(f"All {len(report)} scenarios match {args.golden}")
+
+
+if __name__ == "__main__":
+    main()
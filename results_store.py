@@ -0,0 +1,386 @@
+"""SQLite store of optimisation results.
+
+Every optimisation run is stored as one row of the "runs" table, with the run
+configuration, the optimum and all the calculator outputs at the optimum. The
+nested parts of the configuration (arguments, baseline parameters, advanced
+settings overrides, bounds, optimum and thresholds) are stored as JSON.
+Scalar fields and outputs get their own indexed columns, so queries over
+hundreds of runs stay fast.
+
+The importer back-fills the free-text .log files written by earlier versions
+of run_pipeline_scrip.py.
+
+Usage
+-----
+python results_store.py import results/*.log *.log
+python results_store.py list --zreq "herd size"
+python results_store.py show mixed25_forest19
+"""
+
+import ast
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from pipeline_setup import Z_NAMES
+
+RESULTS_DB = "results.sqlite"
+
+def z_column(z_name):
+    """Returns the column name of a calculator output, e.g. "SSR weight" ->
+    "z_ssr_weight" """
+    return "z_" + z_name.lower().replace(" ", "_")
+
+Z_COLUMNS = [z_column(zn) for zn in Z_NAMES]
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    run_name TEXT NOT NULL,
+    source TEXT,
+    created REAL,
+    config_hash TEXT,
+    ranges TEXT,
+    zreq TEXT,
+    optimizer TEXT,
+    niter INTEGER,
+    ffc_tol REAL,
+    success INTEGER,
+    message TEXT,
+    nfev INTEGER,
+    fun REAL,
+    elapsed_s REAL,
+    {", ".join(f"{c} REAL" for c in Z_COLUMNS)},
+    args_json TEXT,
+    params_json TEXT,
+    adv_set_json TEXT,
+    bounds_json TEXT,
+    x_opt_json TEXT,
+    thresholds_json TEXT,
+    url TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_run_name ON runs (run_name);
+CREATE INDEX IF NOT EXISTS runs_config_hash ON runs (config_hash);
+CREATE INDEX IF NOT EXISTS runs_zreq_fun ON runs (zreq, fun);
+CREATE INDEX IF NOT EXISTS runs_source ON runs (source);
+"""
+
+_JSON_FIELDS = ["args", "params", "adv_set", "bounds", "x_opt", "thresholds"]
+
+def _jsonable(value):
+    """Converts numpy scalars and arrays to plain Python types"""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    return value
+
+def config_hash(params, bounds, zreq=None, thresholds=None):
+    """Returns a hash identifying an optimisation problem, from its baseline
+    parameters, varied parameter bounds, optimised output and thresholds"""
+    config = {"params": _jsonable(params),
+              "bounds": _jsonable(bounds),
+              "zreq": zreq,
+              "thresholds": _jsonable(thresholds)}
+    text = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+class ResultsStore:
+    """Optimisation results stored in an SQLite database.
+
+    Parameters
+    ----------
+    path : str, optional
+        Database file. It is created if it does not exist.
+    """
+
+    def __init__(self, path=RESULTS_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_run(self, run_name, params, bounds, x_opt, z=None, zreq=None,
+                thresholds=None, args=None, adv_set=None, result=None,
+                elapsed_s=None, url=None, source=None, optimizer=None):
+        """Adds a run to the store and returns its id.
+
+        Parameters
+        ----------
+        run_name : str
+            Name of the run.
+        params : dict
+            Baseline parameters.
+        bounds : dict
+            Varied parameter name -> (min, max).
+        x_opt : dict
+            Varied parameter name -> optimal value.
+        z : dict, optional
+            Calculator outputs at the optimum, keyed by z name.
+        zreq : str, optional
+            Name of the optimised output.
+        thresholds : dict, optional
+            Constraint thresholds, as in run_pipeline_scrip.CONSTRAINTS.
+        args : dict, optional
+            Command line arguments of the run.
+        adv_set : dict, optional
+            Advanced settings overridden for the run.
+        result : dict or scipy.optimize.OptimizeResult, optional
+            Optimiser result, with "success", "message", "nfev" and "fun".
+        elapsed_s : float, optional
+            Wall time of the run in seconds.
+        url : str, optional
+            Slider URL of the optimum.
+        source : str, optional
+            Where the run comes from, such as the imported log file path.
+        optimizer : str, optional
+            Name of the optimiser.
+        """
+
+        args = args or {}
+        result = result or {}
+        z = z or {}
+
+        row = {"run_name": run_name,
+               "source": source,
+               "created": time.time(),
+               "config_hash": config_hash(params, bounds, zreq, thresholds),
+               "ranges": args.get("ranges"),
+               "zreq": zreq,
+               "optimizer": optimizer,
+               "niter": args.get("niter"),
+               "ffc_tol": args.get("ffc_tol"),
+               "success": None if result.get("success") is None else int(bool(result.get("success"))),
+               "message": None if result.get("message") is None else str(result.get("message")),
+               "nfev": None if result.get("nfev") is None else int(result.get("nfev")),
+               "fun": None if result.get("fun") is None else float(result.get("fun")),
+               "elapsed_s": elapsed_s,
+               "url": url}
+        for zn, column in zip(Z_NAMES, Z_COLUMNS):
+            row[column] = float(z[zn]) if zn in z else None
+
+        for field, value in zip(_JSON_FIELDS, [args, params, adv_set or {}, bounds, x_opt, thresholds]):
+            row[f"{field}_json"] = json.dumps(_jsonable(value), default=str)
+
+        columns = ", ".join(row)
+        placeholders = ", ".join("?" * len(row))
+        with self.conn:
+            cursor = self.conn.execute(f"INSERT INTO runs ({columns}) VALUES ({placeholders})",
+                                       list(row.values()))
+        return cursor.lastrowid
+
+    def query(self, where=None, params=(), order_by=None, limit=None):
+        """Returns runs as a list of dictionaries, with the JSON fields decoded.
+
+        Parameters
+        ----------
+        where : str, optional
+            SQL condition, such as "zreq = ? AND success = 1".
+        params : tuple, optional
+            Values for the placeholders in where.
+        order_by : str, optional
+            SQL ordering, such as "fun ASC".
+        limit : int, optional
+            Maximum number of runs returned.
+        """
+
+        sql = "SELECT * FROM runs"
+        if where:
+            sql += f" WHERE {where}"
+        if order_by:
+            sql += f" ORDER BY {order_by}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+
+        runs = []
+        for row in self.conn.execute(sql, params):
+            run = dict(row)
+            for field in _JSON_FIELDS:
+                text = run.pop(f"{field}_json")
+                run[field] = json.loads(text) if text is not None else None
+            runs.append(run)
+        return runs
+
+    def to_dataframe(self, where=None, params=()):
+        """Returns the scalar columns of the runs as a pandas DataFrame"""
+        import pandas as pd
+
+        sql = "SELECT * FROM runs"
+        if where:
+            sql += f" WHERE {where}"
+        return pd.read_sql_query(sql, self.conn, params=params, index_col="id")
+
+    def has_source(self, source):
+        return self.conn.execute("SELECT 1 FROM runs WHERE source = ? LIMIT 1",
+                                 (source,)).fetchone() is not None
+
+    def import_log(self, path, replace=False):
+        """Imports a .log file written by run_pipeline_scrip.py. Returns the
+        new run id, or None if the file was already imported.
+
+        The optimised output, constraints and outputs at the optimum are only
+        in logs written since they were added to write_log. Runs imported from
+        older logs have no zreq, thresholds or outputs, so they are never
+        warm start candidates, see warm_start.find_warm_start.
+        """
+
+        source = os.path.abspath(path)
+        if self.has_source(source):
+            if not replace:
+                return None
+            with self.conn:
+                self.conn.execute("DELETE FROM runs WHERE source = ?", (source,))
+
+        log = parse_log(path)
+        run_name = os.path.splitext(os.path.basename(path))[0]
+
+        zreq = log["header"].get("Optimized output")
+
+        return self.add_run(run_name, log["params"], log["bounds"], log["x_opt"],
+                            z=log["z"], zreq=zreq, thresholds=log["thresholds"] or None,
+                            args={"ffc_tol": log["header"].get("Minimiser tolerance"),
+                                  "zreq": zreq},
+                            result={"success": log["header"].get("Optimization success"),
+                                    "message": log["header"].get("Message"),
+                                    "nfev": log["header"].get("Number of iterations"),
+                                    "fun": log["header"].get("Minimum value of function")},
+                            url=log["url"], source=source, optimizer="COBYLA")
+
+
+def _parse_value(text):
+    """Parses a logged parameter value back to a float, bool or string"""
+    if text in ("True", "False"):
+        return text == "True"
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+_HEADER_KEYS = {"Minimum value of function": float,
+                "Optimization success": lambda v: v == "True",
+                "Message": str,
+                "Number of iterations": int,
+                "Minimiser tolerance": float,
+                "Optimized output": str}
+
+def parse_log(path):
+    """Parses a run log written by run_pipeline_scrip.py.
+
+    Sections may appear in any order, and older logs have the summary lines
+    at the end instead of the start.
+
+    Returns
+    -------
+    log : dict
+        Dictionary with "params", "bounds" and "x_opt" dictionaries, the
+        constraint "thresholds" and the outputs at the optimum "z", empty in
+        older logs, a "header" dictionary with the optimiser summary and the
+        optimised output, and the slider "url", or None if missing.
+    """
+
+    sections = {"Baseline Parameters:": "params",
+                "Varied Parameters and Bounds:": "bounds",
+                "Optimization Results:": "x_opt",
+                "Constraints:": "thresholds",
+                "Outputs at Optimum:": "z"}
+
+    log = {"params": {}, "bounds": {}, "x_opt": {}, "thresholds": {}, "z": {},
+           "header": {}, "url": None}
+    current = None
+
+    with open(path) as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line.strip():
+                current = None
+                continue
+            if line in sections:
+                current = sections[line]
+                continue
+            if line.startswith("http"):
+                log["url"] = line.strip()
+                current = None
+                continue
+
+            key, sep, value = line.partition(": ")
+            if not sep:
+                continue
+
+            if current is None and key in _HEADER_KEYS:
+                log["header"][key] = _HEADER_KEYS[key](value)
+            elif current in ("bounds", "thresholds"):
+                log[current][key] = tuple(ast.literal_eval(value))
+            elif current in ("x_opt", "z"):
+                log[current][key] = float(value)
+            elif current == "params":
+                log["params"][key] = _parse_value(value)
+
+    return log
+
+def main():
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(description="Optimisation results store")
+    parser.add_argument('--db', type=str, help='Results database', default=RESULTS_DB)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="Import run .log files")
+    import_parser.add_argument('paths', nargs='+')
+    import_parser.add_argument('--replace', action='store_true', help='Re-import files already in the store')
+
+    list_parser = subparsers.add_parser("list", help="List runs")
+    list_parser.add_argument('--zreq', type=str, default=None)
+    list_parser.add_argument('--name', type=str, help='SQL LIKE pattern on the run name', default=None)
+
+    show_parser = subparsers.add_parser("show", help="Show the runs with a given name")
+    show_parser.add_argument('run_name')
+
+    args = parser.parse_args()
+
+    with ResultsStore(args.db) as store:
+
+        if args.command == "import":
+            paths = [p for pattern in args.paths for p in sorted(glob.glob(pattern))]
+            imported = 0
+            for path in paths:
+                if store.import_log(path, replace=args.replace) is not None:
+                    imported += 1
+            print(f"Imported {imported} of {len(paths)} logs into {args.db}")
+
+        elif args.command == "list":
+            conditions, params = [], []
+            if args.zreq is not None:
+                conditions.append("zreq = ?")
+                params.append(args.zreq)
+            if args.name is not None:
+                conditions.append("run_name LIKE ?")
+                params.append(args.name)
+            runs = store.query(" AND ".join(conditions) or None, tuple(params), order_by="created")
+            for run in runs:
+                print(f"{run['id']:5d}  {run['run_name']:50s}  fun={run['fun']}  "
+                      f"success={run['success']}  nfev={run['nfev']}")
+
+        elif args.command == "show":
+            for run in store.query("run_name = ?", (args.run_name,)):
+                for key, value in run.items():
+                    print(f"{key}: {value}")
+                print()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,86 +1,89 @@
-import matplotlib.pyplot as plt
-import xarray as xr
-import numpy as np
-from scipy.ndimage import zoom
-import pandas as pd
-from pipeline_setup import *
-import time
-from scipy.optimize import minimize
-from FFCObjectWithCache import FFCObjectiveWithCache
 import argparse
+import contextlib
+import time
 from datetime import datetime
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--ranges', type=str, help='Name of parameter ranges on range spreadsheet', default="JPSarah1618 Thu19Jun25")
-parser.add_argument('--zreq', type=str, help='Name of parameter to optimize', default="herd size")
-parser.add_argument('--niter', type=int, help='Number of iterations', default=10)
-parser.add_argument('--test', type=bool, help='Run test with baseline scenario', default=False)
-parser.add_argument('--ffc_tol', type=float, help='Tolerance for FFC objective', default=1e-6)
-
-parser.add_argument('--base_param', nargs=2, action='append', metavar=('KEY', 'VALUE'), default=[])
-parser.add_argument('--adv_set', nargs=2, action='append', metavar=('KEY', 'VALUE'), default=[])
-
-default_run_name = f"run_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-parser.add_argument('--run_name', type=str, help='Name of run to save results', default=default_run_name)
-
-args = parser.parse_args()
+# Heavy modules (pandas, scipy, the calculator modules) are imported inside the
+# functions that need them, so that "--help" and argument errors return
+# immediately
+
+# Constraints on the calculator outputs, as (sign, threshold) pairs. A positive
+# sign requires the output to be at least the threshold, a negative sign at
+# most the threshold
+CONSTRAINTS = {"SSR weight": (1, 0.6736643225),
+               "SSR prot": (1, 0.7331495528),
+               "SSR fat": (1, 0.6333747730),
+               "SSR kcal": (1, 0.6854386315),
+               "emissions": (-1, 0.0)}
+
+def parse_args(argv=None):
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ranges', type=str, help='Name of parameter ranges on range spreadsheet', default="JPSarah1618 Thu19Jun25")
+    parser.add_argument('--zreq', type=str, help='Name of parameter to optimize', default="herd size")
+    parser.add_argument('--niter', type=int, help='Number of iterations, or of generations with cmaes and --objectives (default 10, or the value of the resumed run)', default=None)
+    parser.add_argument('--optimizer', type=str, choices=['cobyla', 'cmaes'], help='Optimiser: sequential COBYLA, or CMA-ES evaluating each generation as a parallel batch', default='cobyla')
+    parser.add_argument('--objectives', nargs='+', metavar='Z_NAME', help='Multi-objective mode: find the Pareto set of these outputs with NSGA-II, instead of optimising --zreq. Emissions are minimised and other outputs maximised, unless prefixed with "min:" or "max:"', default=None)
+    parser.add_argument('--workers', type=int, help='Worker processes evaluating each CMA-ES or NSGA-II generation, the attribution scenarios and the temperature sweep', default=1)
+    parser.add_argument('--popsize', type=int, help='Candidates per generation (default 4 + 3 ln(n) for CMA-ES, 40 for NSGA-II)', default=None)
+    parser.add_argument('--cma_sigma', type=float, help='Initial CMA-ES step size, as a fraction of the parameter ranges', default=0.25)
+    parser.add_argument('--seed', type=int, help='Random seed of the CMA-ES and NSGA-II searches', default=0)
+    parser.add_argument('--test', type=bool, help='Run test with baseline scenario', default=False)
+    parser.add_argument('--ffc_tol', type=float, help='Tolerance for FFC objective', default=1e-6)
+    parser.add_argument('--float32', action='store_true', help='Evaluate the calculator in single precision')
+    parser.add_argument('--land_chunks', type=int, help='Evaluate the land maps lazily with dask, in chunks of this many grid cells per side', default=None)
+    parser.add_argument('--sparse_land', action='store_true', help='Only store the land pixels of the land use maps')
+    parser.add_argument('--endpoint_years', action='store_true', help='Only evaluate the years used by the outputs (2020, 2021 and 2050)')
+    parser.add_argument('--precision_report', type=int, help='Compare float32 against float64 outputs over this many sampled scenarios and exit', default=0)
+    parser.add_argument('--temperature_sweep', type=int, help='Compute the temperature response of this many sampled scenarios with a batched FaIR run and exit', default=0)
+    parser.add_argument('--attribution', action='store_true', help='Attribute the change in the outputs of the optimum to each varied lever')
+    parser.add_argument('--shapley', action='store_true', help='With --attribution, also compute Shapley contributions')
+    parser.add_argument('--memory_profile', action='store_true', help='Record the memory used by each pipeline node and report it at the end of the run')
+    parser.add_argument('--memory_budget', type=float, help='Peak memory budget of a single evaluation in MB, implies --memory_profile', default=None)
+    parser.add_argument('--memory_budget_action', type=str, choices=['warn', 'raise'], help='Warn or stop when an evaluation goes over the memory budget', default='warn')
+    parser.add_argument('--settings-snapshot', type=str, help='Advanced settings CSV snapshot or snapshot directory, instead of the online sheet', default=None)
+    parser.add_argument('--ranges-snapshot', type=str, help='Parameter ranges CSV snapshot or snapshot directory, instead of the online sheet', default=None)
+
+    parser.add_argument('--base_param', nargs=2, action='append', metavar=('KEY', 'VALUE'), default=[])
+    parser.add_argument('--adv_set', nargs=2, action='append', metavar=('KEY', 'VALUE'), default=[])
+
+    default_run_name = f"run_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    parser.add_argument('--run_name', type=str, help='Name of run to save results', default=default_run_name)
+    parser.add_argument('--resume', type=str, metavar='RUN_NAME', help='Resume an interrupted run from its checkpoint', default=None)
+    parser.add_argument('--checkpoint_every', type=int, help='Save a checkpoint every this many new evaluations, 0 disables checkpoints', default=10)
+    parser.add_argument('--results_db', type=str, help='SQLite results store the run is added to, empty to disable', default="results.sqlite")
+    parser.add_argument('--warm_start', action='store_true', help='Start from the optimum of the closest run in the results store')
+    parser.add_argument('--compare_cold', action='store_true', help='With --warm_start, also run from the baseline to count the evaluations saved')
+
+    return parser.parse_args(argv)
 
 # ---------------------------------------------------
 # Advanced settings
 # ---------------------------------------------------
 
-print("Reading advanced settings...")
+def load_advanced_settings(args):
 
-# Set file locations
-advanced_settings_url = "https://docs.google.com/spreadsheets/d/e/2PACX-1vTanjc08kc5vIN-icUMzMEGA9bJuDesLX8V_u2Ab6zSC4MOhLZ8Jrr18DL9o4ofKIrSq6FsJXhPWu3F/pub?gid=0&single=true&output=csv"
+    from sheet_snapshots import load_sheet
 
-# Read in emissions from other sectors
-sector_emissions_dict = set_sector_emissions_dict()
-# Read in the advanced settings from the google sheet
+    print("Reading advanced settings...")
 
-adv_set_dict = read_advanced_settings(advanced_settings_url)
+    # Read in the advanced settings from the google sheet, or a local snapshot
+    adv_set_dict = load_sheet("settings", args.settings_snapshot)
 
-# Update the advanced settings with the passed arguments
-passed_adv_set = {k: float(v) for k, v in args.adv_set}
-adv_set_dict.update(passed_adv_set)
+    # Update the advanced settings with the passed arguments
+    passed_adv_set = {k: float(v) for k, v in args.adv_set}
+    adv_set_dict.update(passed_adv_set)
 
-print("Advanced settings:")
-for k, v in adv_set_dict.items():
-    print(k, v)
-print()
+    print("Advanced settings:")
+    for k, v in adv_set_dict.items():
+        print(k, v)
+    print()
 
+    return adv_set_dict
 
 # ---------------------------------------------------
 # Parameter ranges
 # ---------------------------------------------------
-print("Reading parameter ranges...")
-
-# Read parameter ranges from scenarios spreadsheet
-ranges_worksheet_url = "https://docs.google.com/spreadsheets/d/e/2PACX-1vRXLuSuuxfTx1tUilnO1KojbaGiO-o-rtf1OtsQ0YHetV-OozWH1BXc7N-1Y9jG9Ue2ys7mcf-SzPc3/pub?gid=1034155472&single=true&output=csv"
-ranges = pd.read_csv(ranges_worksheet_url, dtype='string', skiprows=2)
-ranges.head()
-
-# Remove "Max " and "Min " prefixes and extract unique names
-unique_names = ranges["Name"].dropna().str.replace(r"^(Max |Min )", "", regex=True).unique()
-unique_names
-# Create a dictionary to store the ranges
-ranges_dict = {}
-
-# Iterate over unique range names
-for name in unique_names:
-    # Filter rows corresponding to the current range name
-    min_row = ranges[ranges["Name"] == f"Min {name}"].iloc[0]
-    max_row = ranges[ranges["Name"] == f"Max {name}"].iloc[0]
-    
-    # Extract parameter ranges as tuples
-    param_ranges = {
-        col: (float(min_row[col]), float(max_row[col]))
-        for col in ranges.columns[3:]  # Skip the "Name" column
-        if pd.notna(min_row[col]) and pd.notna(max_row[col])  # Ensure values are not NaN
-    }
-    
-    # Add to the dictionary
-    ranges_dict[name] = param_ranges
 
 # List of parameter names and ranges
 def names_bounds(param_range_dict):
@@ -95,162 +98,517 @@ def names_bounds(param_range_dict):
 
     return names_x, x_bounds, names_fixed, values_fixed
 
-# names_x, x_bounds = names_bounds(param_range_dict)
-names_x, x_bounds, names_fixed, values_fixed = names_bounds(ranges_dict[args.ranges])
+def baseline_parameters(args, adv_set_dict, names_fixed, values_fixed):
 
-print("Parameter ranges:")
-for n, b in zip(names_x, x_bounds):
-    print(n, b)
-print()
+    from pipeline_setup import set_baseline_scenario
 
-# Set the scenario parameters
-params_baseline = set_baseline_scenario(adv_set_dict)
+    # Set the scenario parameters
+    params_baseline = set_baseline_scenario(adv_set_dict)
 
-# Update baseline parameters
-for k, v in zip(names_fixed, values_fixed):
-    params_baseline[k] = v
+    # Update baseline parameters
+    for k, v in zip(names_fixed, values_fixed):
+        params_baseline[k] = v
 
-passed_base_params = {k: float(v) for k, v in args.base_param}
-params_baseline.update(passed_base_params)
+    passed_base_params = {k: float(v) for k, v in args.base_param}
+    params_baseline.update(passed_base_params)
 
-print("Baseline scenario:")
-for k, v in params_baseline.items():
-    print(k, v)
-print()
+    if args.endpoint_years:
+        params_baseline["endpoint_years"] = True
 
-# ---------------------------------------------------
-# Set up the datablock
-# ---------------------------------------------------
+    print("Baseline scenario:")
+    for k, v in params_baseline.items():
+        print(k, v)
+    print()
 
-# Set the datablock
-datablock_init = datablock_setup()
+    return params_baseline
 
-# Also add the baseline parameters to the datablock
-datablock_init.update(params_baseline)
+# ---------------------------------------------------
+# Configure and run the optimization
+# ---------------------------------------------------
 
-ffc_wrapper = FFCObjectiveWithCache(names_x, datablock_init, params_baseline, verbosity=2)
+def optimize(args, ffc_wrapper, x0, x_bounds, constraints=CONSTRAINTS):
+
+    if getattr(args, "optimizer", "cobyla") == "cmaes":
+        result = optimize_cmaes(args, ffc_wrapper, x0, x_bounds, constraints)
+    else:
+        result = optimize_cobyla(args, ffc_wrapper, x0, x_bounds, constraints)
+
+    # The result is an OptimizeResult object
+    print("Optimization success:", result.success)
+    print("Message:", result.message)
+    print("Number of iterations:", result.nfev)
+    print("Optimal value of x:", result.x)
+    print("Minimum value of function:", result.fun)
+
+    print("Optimized parameters: ", result['x'])      # Optimal parameters
+    print("Optimized value: ", result['fun'])    # Minimum value of the objective
+    print("Was the minimization succesfull? ", result['success'])  # Boolean indicating if it was successful
+
+    # Display the results
+    z1_val = ffc_wrapper.objective(result.x, "SSR weight")
+    z2_val = ffc_wrapper.objective(result.x, "emissions")
+    print(f"SSR weight = {z1_val:.8f}; emissions = {z2_val:.8f}")
+
+    return result
+
+def optimize_cmaes(args, ffc_wrapper, x0, x_bounds, constraints=CONSTRAINTS):
+    """Maximises args.zreq with CMA-ES, evaluating each generation as a batch
+    on args.workers processes"""
+
+    from parallel_batch import BatchPool
+    from parallel_optimizer import cmaes
+
+    with BatchPool(ffc_wrapper.datablock_init, workers=getattr(args, "workers", 1)) as pool:
+        result = cmaes(ffc_wrapper, args.zreq, x0, x_bounds, constraints,
+                       maxiter=args.niter,
+                       popsize=getattr(args, "popsize", None),
+                       sigma0=getattr(args, "cma_sigma", 0.25),
+                       tol=args.ffc_tol,
+                       seed=getattr(args, "seed", 0),
+                       calculator=pool,
+                       verbosity=1)
+
+    return result
+
+def optimize_pareto(args, ffc_wrapper, x0, x_bounds, constraints=CONSTRAINTS):
+    """Finds the Pareto set of args.objectives with NSGA-II, evaluating each
+    generation as a batch on args.workers processes"""
+
+    from parallel_batch import BatchPool
+    from nsga2 import nsga2
+
+    with BatchPool(ffc_wrapper.datablock_init, workers=args.workers) as pool:
+        pareto = nsga2(ffc_wrapper, args.objectives, x_bounds, constraints, x0=x0,
+                       popsize=args.popsize or 40,
+                       generations=args.niter,
+                       seed=args.seed,
+                       calculator=pool,
+                       verbosity=1)
+
+    print(f"Pareto set of {len(pareto)} scenarios:")
+    print(pareto.to_string())
+
+    return pareto
+
+@contextlib.contextmanager
+def save_on_interrupt(checkpoint, run_name):
+    """Saves the checkpoint if the block is interrupted or fails, keeping the
+    evaluations done so far"""
+    try:
+        yield
+    except BaseException:
+        if checkpoint is not None:
+            checkpoint.save()
+            print(f"Checkpoint saved to {checkpoint.path}, resume with --resume {run_name}")
+        raise
+
+def optimize_cobyla(args, ffc_wrapper, x0, x_bounds, constraints=CONSTRAINTS):
+
+    from scipy.optimize import minimize
+
+    z_name_requested = args.zreq
+
+    ffc_constraints = []
+    for z_name, (sign, threshold) in constraints.items():
+        if sign > 0:
+            fun = lambda x, z_name=z_name, threshold=threshold: ffc_wrapper.positive_constraint(x, z_name, threshold=threshold, verbosity=0)
+        else:
+            fun = lambda x, z_name=z_name, threshold=threshold: ffc_wrapper.negative_constraint(x, z_name, threshold=threshold, verbosity=0)
+        ffc_constraints.append({'type': 'ineq', 'fun': fun})
+
+    # Set tolerances, verbosity, and options for the minimizer
+    options = {
+        'disp': True,      # Show convergence messages
+        'maxiter': args.niter,     # Max number of iterations
+        'rhobeg' : 10 # Reasonable step size (mostly they are percentages, so change by 10%)
+    }
 
-z_name_requested = args.zreq
+    result = minimize(
+        lambda x: ffc_wrapper.negative_objective(x, z_name_requested),
+        # lambda x: ffc_wrapper.objective(x, z_name_requested),
+        x0,
+        method='COBYLA',
+        bounds=x_bounds,
+        constraints=ffc_constraints,
+        tol=args.ffc_tol,
+        options=options
+    )
 
-x0 = [params_baseline[n] for n in names_x]
-ffc_constraints = [{'type': 'ineq', 'fun': lambda x: ffc_wrapper.positive_constraint(x, "SSR weight", threshold=0.6736643225, verbosity=0)},
-                   {'type': 'ineq', 'fun': lambda x: ffc_wrapper.positive_constraint(x, "SSR prot", threshold=0.7331495528, verbosity=0)},
-                   {'type': 'ineq', 'fun': lambda x: ffc_wrapper.positive_constraint(x, "SSR fat", threshold=0.6333747730, verbosity=0)},
-                   {'type': 'ineq', 'fun': lambda x: ffc_wrapper.positive_constraint(x, "SSR kcal", threshold=0.6854386315, verbosity=0)},
-                   {'type': 'ineq', 'fun': lambda x: ffc_wrapper.negative_constraint(x, "emissions", threshold=0.0, verbosity=0)}
-                   ]
+    return result
 
 # ---------------------------------------------------
-# Configure and run the optimization
+# Save results to log file
 # ---------------------------------------------------
 
-if args.test:
+def slider_url(params_baseline, names_x, x_opt):
+    """Returns a URL with the slider parameters"""
 
-    z1_name = "SSR weight"
-    z2_name = "SSR prot"
-    z3_name = "SSR fat"
-    z4_name = "SSR kcal"
-    z5_name = "emissions"
-    z6_name = "herd size"
-    z7_name = "animals"
-    z8_name = "woodland"
+    from pipeline_setup import set_baseline_scenario
 
-    z_names = [z1_name, z2_name, z3_name, z4_name, z5_name, z6_name, z7_name, z8_name]
+    URL_BASE = "https://agrifood-consultation.streamlit.app/?embedding=True"
 
-    z_val_baseline = run_calculator(datablock_init, params_baseline)
-    for zn, zval in zip(z_names, z_val_baseline):
-        print(f"{zn} = {zval:.8f}; ", end="")
+    slider_params = set_baseline_scenario({})
+
+    for k, v in params_baseline.items():
+        if k in slider_params.keys():
+            slider_params[k] = v
+
+    for n, val in zip(names_x, x_opt):
+        slider_params[n] = val
+
+    for k, val in slider_params.items():
+        URL_BASE += f"&{k}={val}"
+
+    return URL_BASE
+
+def write_log(log_file_path, result, ffc_tol, params_baseline, names_x, x_bounds, url,
+              zreq=None, constraints=None, z=None):
+    """Writes the run log. The optimised output, the constraints and the
+    outputs at the optimum are written when given, so that runs imported from
+    the log into the results store can be used as warm starts."""
+
+    with open(log_file_path, "w") as log_file:
+
+        # Write optimization results
+        log_file.write(f"Minimum value of function: {result.fun}\n")
+        log_file.write(f"Optimization success: {result.success}\n")
+        log_file.write(f"Message: {result.message}\n")
+        log_file.write(f"Number of iterations: {result.nfev}\n")
+        log_file.write(f"Minimiser tolerance: {ffc_tol}\n")
+        if zreq is not None:
+            log_file.write(f"Optimized output: {zreq}\n")
+        log_file.write("\n")
+
+        # Write constraints on the outputs, as (sign, threshold)
+        if constraints is not None:
+            log_file.write("Constraints:\n")
+            for zn, (sign, threshold) in constraints.items():
+                log_file.write(f"{zn}: {(sign, threshold)}\n")
+            log_file.write("\n")
+
+        # Write baseline parameters
+        log_file.write("Baseline Parameters:\n")
+        for k, v in params_baseline.items():
+            log_file.write(f"{k}: {v}\n")
+        log_file.write("\n")
+
+        # Write varied parameters and their bounds
+        log_file.write("Varied Parameters and Bounds:\n")
+        for n, b in zip(names_x, x_bounds):
+            log_file.write(f"{n}: {b}\n")
+        log_file.write("\n")
+
+        # Write optimization results
+        log_file.write("Optimization Results:\n")
+        for n, val in zip(names_x, result.x):
+            log_file.write(f"{n}: {val}\n")
+        log_file.write("\n")
+
+        # Write calculator outputs at the optimum
+        if z is not None:
+            log_file.write("Outputs at Optimum:\n")
+            for zn, val in z.items():
+                log_file.write(f"{zn}: {float(val)}\n")
+            log_file.write("\n")
+
+        log_file.write(url)
+
+def report_attribution(log_file_path, ffc_wrapper, x, shapley=False, workers=1):
+    """Prints the contribution of each varied lever to the change in the
+    outputs of the optimum, and appends it to the log. The scenarios are
+    evaluated as a batch on workers processes."""
+
+    import pandas as pd
+    from attribution import attribute
+    from parallel_batch import BatchPool
+
+    with BatchPool(ffc_wrapper.datablock_init, workers=workers) as pool:
+        attribution = attribute(ffc_wrapper, x, shapley=shapley, calculator=pool)
+
+    tables = [("One at a time", attribution["one_at_a_time"]),
+              ("Leave one out", attribution["leave_one_out"])]
+    if shapley:
+        tables.append(("Shapley", attribution["shapley"]))
+
+    lines = [f"Attribution ({attribution['evaluations']} new evaluations):",
+             pd.DataFrame({"baseline": attribution["baseline"],
+                           "scenario": attribution["scenario"]}).T.to_string()]
+    for title, table in tables:
+        lines += ["", f"{title} contributions:", table.to_string()]
+    text = "\n".join(lines)
+
+    print(text)
     print()
-    exit()
-
-# Set tolerances, verbosity, and options for the minimizer
-ffc_tol = args.ffc_tol
-options = {
-    'disp': True,      # Show convergence messages
-    'maxiter': args.niter,     # Max number of iterations
-    'rhobeg' : 10 # Reasonable step size (mostly they are percentages, so change by 10%)
-}
-
-result = minimize(
-    lambda x: ffc_wrapper.negative_objective(x, z_name_requested),
-    # lambda x: ffc_wrapper.objective(x, z_name_requested),
-    x0,
-    method='COBYLA',
-    bounds=x_bounds,
-    constraints=ffc_constraints,
-    tol=ffc_tol,
-    options=options
-)
-
-# The result is an OptimizeResult object
-print("Optimization success:", result.success)
-print("Message:", result.message)
-print("Number of iterations:", result.nfev)
-print("Optimal value of x:", result.x)
-print("Minimum value of function:", result.fun)
-
-print("Optimized parameters: ", result['x'])      # Optimal parameters
-print("Optimized value: ", result['fun'])    # Minimum value of the objective
-print("Was the minimization succesfull? ", result['success'])  # Boolean indicating if it was successful
-
-# Display the results
-#z1_val, z2_val = list(ffc_results.values())[:2]
-z1_val = ffc_wrapper.objective(result.x, "SSR weight")
-z2_val = ffc_wrapper.objective(result.x, "emissions")
-print(f"SSR weight = {z1_val:.8f}; emissions = {z2_val:.8f}")
 
-# ---------------------------------------------------
-# Save results to log file
-# ---------------------------------------------------
+    with open(log_file_path, "a") as log_file:
+        log_file.write("\n\n" + text + "\n")
 
-log_file_path = f"{args.run_name}.log"
+def choose_warm_start(args, params_baseline, names_x, x_bounds):
+    """Returns the warm start from the closest run in the results store, or
+    None if there is no compatible run"""
 
-# Write a URL with the slider parameters
+    from results_store import ResultsStore
+    from warm_start import find_warm_start
 
-URL_BASE = "https://agrifood-consultation.streamlit.app/?embedding=True"
+    with ResultsStore(args.results_db) as store:
+        warm_start = find_warm_start(store, params_baseline, dict(zip(names_x, x_bounds)),
+                                     args.zreq, CONSTRAINTS)
 
-slider_params = set_baseline_scenario({})
+    if warm_start is None:
+        print("No compatible run found for a warm start, starting from the baseline")
+    else:
+        run = warm_start["run"]
+        print(f"Warm start from {run['run_name']} (scaled distance {warm_start['distance']:.4g}, "
+              f"{args.zreq} = {-run['fun']})")
+    print()
 
-for k, v in params_baseline.items():
-    if k in slider_params.keys():
-        slider_params[k] = v
+    return warm_start
+
+def report_warm_start(args, warm_start, result, ffc_wrapper_cold=None, x0_cold=None, x_bounds=None):
+    """Prints the evaluations saved by a warm start. With a cold wrapper the
+    cold start is run, otherwise the neighbour's own evaluations are used as
+    an estimate of the cold start cost"""
+
+    if ffc_wrapper_cold is not None:
+        result_cold = optimize(args, ffc_wrapper_cold, x0_cold, x_bounds)
+        nfev_cold = result_cold.nfev
+        print(f"Cold start: {args.zreq} = {-result_cold.fun} in {nfev_cold} evaluations")
+    else:
+        run = warm_start["run"]
+        if run["args"].get("warm_start_from") or run["nfev"] is None:
+            print(f"Warm start: {result.nfev} evaluations")
+            return
+        nfev_cold = run["nfev"]
+        print(f"Cold start estimate from {run['run_name']}: {nfev_cold} evaluations")
+
+    print(f"Warm start: {args.zreq} = {-result.fun} in {result.nfev} evaluations, "
+          f"{nfev_cold - result.nfev} evaluations saved")
+
+def resume_run(args):
+    """Restores the arguments and configuration of an interrupted run from
+    its checkpoint"""
+
+    from checkpoint import RunCheckpoint, checkpoint_path
+
+    checkpoint = RunCheckpoint.load(checkpoint_path(args.resume), every=args.checkpoint_every)
+    config = checkpoint.config
+
+    # Keep the saved arguments, except for the iteration budget if given again
+    niter = args.niter
+    vars(args).update(config["args"])
+    args.run_name = args.resume
+    if niter is not None:
+        args.niter = niter
+
+    print(f"Resuming {args.run_name}: {len(checkpoint.cache)} cached evaluations, "
+          f"{checkpoint.nfev} evaluations so far")
+    if checkpoint.best_x is not None:
+        print(f"Best feasible {checkpoint.z_name} so far: {checkpoint.best_z[checkpoint.z_name]}")
+    print()
 
-for n, val in zip(names_x, result.x):
-    slider_params[n] = val
+    return checkpoint, config
 
-for k, val in slider_params.items():
-    URL_BASE += f"&{k}={val}"
+def main(argv=None):
 
-with open(log_file_path, "w") as log_file:
+    args = parse_args(argv)
 
-    # Write optimization results
-    log_file.write(f"Minimum value of function: {result.fun}\n")
-    log_file.write(f"Optimization success: {result.success}\n")
-    log_file.write(f"Message: {result.message}\n")
-    log_file.write(f"Number of iterations: {result.nfev}\n")
-    log_file.write(f"Minimiser tolerance: {ffc_tol}\n")
-    log_file.write("\n")
+    import numpy as np
+    from pipeline_setup import datablock_setup, run_calculator, Z_NAMES
+    from FFCObjectWithCache import FFCObjectiveWithCache
+    from checkpoint import RunCheckpoint, checkpoint_path
 
-    # Write baseline parameters
-    log_file.write("Baseline Parameters:\n")
-    for k, v in params_baseline.items():
-        log_file.write(f"{k}: {v}\n")
-    log_file.write("\n")
-
-    # Write varied parameters and their bounds
-    log_file.write("Varied Parameters and Bounds:\n")
-    for n, b in zip(names_x, x_bounds):
-        log_file.write(f"{n}: {b}\n")
-    log_file.write("\n")
-
-    # Write optimization results
-    log_file.write("Optimization Results:\n")
-    for n, val in zip(names_x, result.x):
-        log_file.write(f"{n}: {val}\n")
-    log_file.write("\n")
-
-    log_file.write(URL_BASE)
-
-print(f"Results saved to {log_file_path}")
-print(f"See results here: {URL_BASE}")
- 
\ No newline at end of file
+    if args.resume is not None:
+        # The checkpoint holds everything read from the sheets
+        checkpoint, config = resume_run(args)
+        names_x = config["names_x"]
+        x_bounds = config["x_bounds"]
+        x0 = config["x0"]
+        params_baseline = config["params_baseline"]
+
+    else:
+        from sheet_snapshots import load_sheet
+
+        adv_set_dict = load_advanced_settings(args)
+
+        print("Reading parameter ranges...")
+        ranges_dict = load_sheet("ranges", args.ranges_snapshot)
+        names_x, x_bounds, names_fixed, values_fixed = names_bounds(ranges_dict[args.ranges])
+
+        print("Parameter ranges:")
+        for n, b in zip(names_x, x_bounds):
+            print(n, b)
+        print()
+
+        params_baseline = baseline_parameters(args, adv_set_dict, names_fixed, values_fixed)
+        x0 = [params_baseline[n] for n in names_x]
+        checkpoint = None
+
+    if args.niter is None:
+        args.niter = 10
+
+    # ---------------------------------------------------
+    # Set up the datablock
+    # ---------------------------------------------------
+
+    # The precision report needs a float64 reference datablock
+    use_float32 = args.float32 and args.precision_report == 0
+    datablock_init = datablock_setup(dtype=np.float32 if use_float32 else np.float64,
+                                     sparse_land=args.sparse_land,
+                                     land_chunks=args.land_chunks)
+
+    # Also add the baseline parameters to the datablock
+    datablock_init.update(params_baseline)
+
+    if args.precision_report > 0:
+
+        from precision_report import sample_scenarios, precision_report
+
+        scenarios = sample_scenarios(params_baseline, names_x, x_bounds, args.precision_report)
+        report = precision_report(datablock_init, scenarios, verbosity=1)
+        print(report.to_string())
+        return
+
+    if args.temperature_sweep > 0:
+
+        from precision_report import sample_scenarios
+        from fair_batch import temperature_sweep
+        from parallel_batch import BatchPool
+
+        scenarios = sample_scenarios(params_baseline, names_x, x_bounds, args.temperature_sweep)
+        with BatchPool(datablock_init, workers=args.workers) as pool:
+            sweep = temperature_sweep(datablock_init, scenarios, calculator=pool)
+
+        table = sweep[Z_NAMES].to_dataframe()
+        for n in names_x:
+            table[n] = [params[n] for params in scenarios]
+        table["T end"] = sweep["T"].isel(timebounds=-1).values
+        print(table[names_x + Z_NAMES + ["T end"]].to_string())
+        return
+
+    memory_profile = None
+    if args.memory_profile or args.memory_budget is not None:
+        from memory_profile import MemoryProfile
+
+        budget = None if args.memory_budget is None else args.memory_budget * 2**20
+        memory_profile = MemoryProfile(budget=budget, on_exceed=args.memory_budget_action)
+
+    if args.test:
+
+        z_val_baseline = run_calculator(datablock_init, params_baseline, memory=memory_profile)
+        for zn, zval in zip(Z_NAMES, z_val_baseline):
+            print(f"{zn} = {zval:.8f}; ", end="")
+        print()
+
+        if args.endpoint_years:
+            from pipeline_setup import check_endpoint_years
+
+            differences = check_endpoint_years(datablock_init, params_baseline)
+            print("Endpoint years match the full trajectory, maximum relative differences:")
+            for zn, d in differences.items():
+                print(f"{zn} = {d:.3g}")
+
+        if memory_profile is not None:
+            print(memory_profile.report())
+        return
+
+    ffc_wrapper = FFCObjectiveWithCache(names_x, datablock_init, params_baseline, verbosity=2)
+    ffc_wrapper.memory_profile = memory_profile
+
+    warm_start = None
+    if args.warm_start and args.resume is None and args.results_db:
+        warm_start = choose_warm_start(args, params_baseline, names_x, x_bounds)
+        if warm_start is not None:
+            x0_cold = x0
+            x0 = warm_start["x0"]
+            args.warm_start_from = warm_start["run"]["run_name"]
+
+    if checkpoint is None and args.checkpoint_every > 0:
+        config = {"args": {k: v for k, v in vars(args).items()
+                           if k not in ("resume", "checkpoint_every")},
+                  "names_x": names_x,
+                  "x_bounds": x_bounds,
+                  "x0": x0,
+                  "params_baseline": params_baseline}
+        checkpoint = RunCheckpoint(checkpoint_path(args.run_name), config, args.zreq,
+                                   CONSTRAINTS, maximize=True, every=args.checkpoint_every)
+
+    if checkpoint is not None:
+        checkpoint.attach(ffc_wrapper)
+
+    if args.objectives:
+        t_start = time.perf_counter()
+        with save_on_interrupt(checkpoint, args.run_name):
+            pareto = optimize_pareto(args, ffc_wrapper, x0, x_bounds)
+        elapsed_s = time.perf_counter() - t_start
+
+        if checkpoint is not None:
+            checkpoint.save(finished=True)
+
+        if args.results_db:
+            from results_store import ResultsStore
+            from nsga2 import parse_objectives, write_pareto
+
+            with ResultsStore(args.results_db) as store:
+                write_pareto(store, args.run_name, pareto, params_baseline, names_x, x_bounds,
+                             parse_objectives(args.objectives), CONSTRAINTS,
+                             args={k: v for k, v in vars(args).items() if k != "resume"},
+                             adv_set={k: float(v) for k, v in args.adv_set},
+                             elapsed_s=elapsed_s)
+            print(f"Pareto set saved to {args.results_db} as {args.run_name}_pareto*")
+        return
+
+    t_start = time.perf_counter()
+    with save_on_interrupt(checkpoint, args.run_name):
+        result = optimize(args, ffc_wrapper, x0, x_bounds)
+    elapsed_s = time.perf_counter() - t_start
+
+    if warm_start is not None:
+        ffc_wrapper_cold = None
+        if args.compare_cold:
+            ffc_wrapper_cold = FFCObjectiveWithCache(names_x, datablock_init, params_baseline, verbosity=0)
+        report_warm_start(args, warm_start, result, ffc_wrapper_cold, x0_cold, x_bounds)
+
+    if checkpoint is not None:
+        checkpoint.save(finished=True)
+        if checkpoint.best_x is not None:
+            print(f"Best feasible {args.zreq} found: {checkpoint.best_z[args.zreq]}")
+
+    log_file_path = f"{args.run_name}.log"
+    url = slider_url(params_baseline, names_x, result.x)
+    z_opt = ffc_wrapper.objective_values(result.x)
+    write_log(log_file_path, result, args.ffc_tol, params_baseline, names_x, x_bounds, url,
+              zreq=args.zreq, constraints=CONSTRAINTS, z=z_opt)
+
+    if args.attribution:
+        report_attribution(log_file_path, ffc_wrapper, result.x, args.shapley, workers=args.workers)
+
+    if memory_profile is not None:
+        report = memory_profile.report()
+        print(report)
+        print()
+        with open(log_file_path, "a") as log_file:
+            log_file.write("\n\n" + report + "\n")
+
+    if args.results_db:
+        from results_store import ResultsStore
+
+        with ResultsStore(args.results_db) as store:
+            store.add_run(args.run_name, params_baseline,
+                          bounds=dict(zip(names_x, x_bounds)),
+                          x_opt=dict(zip(names_x, result.x)),
+                          z=z_opt,
+                          zreq=args.zreq,
+                          thresholds=CONSTRAINTS,
+                          args={k: v for k, v in vars(args).items() if k != "resume"},
+                          adv_set={k: float(v) for k, v in args.adv_set},
+                          result=result,
+                          elapsed_s=elapsed_s,
+                          url=url,
+                          optimizer=args.optimizer.upper())
+
+    print(f"Results saved to {log_file_path}")
+    print(f"See results here: {url}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+"""Batch scheduler for matrices of optimisation runs.
+
+A scenario matrix is a JSON file with the settings shared by all runs, and a
+set of axes whose variants are combined as a Cartesian product:
+
+    {
+        "name": "mixed25",
+        "common": {"ranges": "JPSarah1618 Thu19Jun25", "zreq": "herd size",
+                   "niter": 200, "base_param": {"mixed_farming": 25}},
+        "axes": {
+            "forest": [{"label": "", "base_param": {}},
+                       {"label": "forest19", "base_param": {"foresting_pasture": 19}}],
+            "secondary": [{"label": ""},
+                          {"label": "secondary015",
+                           "adv_set": {"mixed_farming_secondary_production_scale": 0.15}},
+                          {"label": "secondary020",
+                           "adv_set": {"mixed_farming_secondary_production_scale": 0.20}}]
+        }
+    }
+
+Each variant may set "ranges", "zreq", "niter", "ffc_tol",
+"population_projection", and update the "base_param", "adv_set" and
+"thresholds" dictionaries. A threshold is either a value, which overrides the
+threshold of a constraint in run_pipeline_scrip.CONSTRAINTS, or a
+[sign, threshold] pair, which can also constrain other outputs. A null
+threshold drops that constraint. Run names join the matrix name and the
+non-empty variant labels.
+
+Configurations that turn out identical are run once. Configurations are
+compared by the baseline parameters, bounds and constraints they resolve to,
+so an override equal to the sheet default is the same as no override. Runs
+execute on a pool of worker processes, each of which builds the datablock
+once and reuses it for all its runs. With --shared_datablock, the parent
+process builds it instead and publishes it in shared memory, and the workers
+attach to it without copying. Datablocks for other population projections
+share all the projection invariant data with it. The settings and ranges
+sheets are read once, by the parent process. All results are written to the
+results store.
+
+Usage
+-----
+python scenario_matrix.py matrix.json --workers 4 \
+    --settings-snapshot snapshots/settings --ranges-snapshot snapshots/ranges
+"""
+
+import argparse
+import copy
+import itertools
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+_DICT_FIELDS = ("base_param", "adv_set", "thresholds")
+_DEFAULTS = {"ranges": "JPSarah1618 Thu19Jun25",
+             "zreq": "herd size",
+             "niter": 10,
+             "ffc_tol": 1e-6,
+             "population_projection": "Medium"}
+
+def _merge(config, variant):
+    """Merges a variant into a configuration, updating the dictionary fields"""
+    merged = copy.deepcopy(config)
+    for key, value in variant.items():
+        if key == "label":
+            continue
+        if key in _DICT_FIELDS:
+            merged.setdefault(key, {}).update(value)
+        else:
+            merged[key] = value
+    return merged
+
+def _config_key(config, adv_set_dict=None, ranges_dict=None):
+    """Returns a key identifying the run a configuration resolves to. Without
+    the sheets, only the constraints are resolved, and the overrides are
+    compared as given."""
+    from fingerprint import fingerprint_params
+
+    resolved = {k: v for k, v in config.items() if k != "run_name"}
+    resolved["thresholds"] = run_thresholds(config)
+
+    if adv_set_dict is not None and ranges_dict is not None:
+        params_baseline, names_x, x_bounds = run_parameters(config, adv_set_dict, ranges_dict)
+        for key in ("ranges", "base_param", "adv_set", "population_projection"):
+            del resolved[key]
+        resolved["params"] = params_baseline
+        resolved["bounds"] = dict(zip(names_x, x_bounds))
+
+    return fingerprint_params(resolved)
+
+def expand_matrix(matrix, adv_set_dict=None, ranges_dict=None):
+    """Expands a scenario matrix into a list of run configurations, removing
+    duplicate configurations.
+
+    Parameters
+    ----------
+    matrix : dict
+        Scenario matrix, with optional "name", "common" and "axes" entries.
+    adv_set_dict : dict, optional
+        Advanced settings. With ranges_dict, configurations are compared by
+        the baseline parameters and bounds they resolve to, so overrides
+        equal to the sheet defaults are detected as duplicates.
+    ranges_dict : dict, optional
+        Parameter ranges, as returned by read_ranges.
+
+    Returns
+    -------
+    configs : list of dict
+        Run configurations, each with a "run_name".
+    duplicates : dict
+        Run name of each dropped configuration -> run name of the identical
+        configuration that is kept.
+    """
+
+    base = dict(_DEFAULTS)
+    base.update({field: {} for field in _DICT_FIELDS})
+    base = _merge(base, matrix.get("common", {}))
+
+    axes = matrix.get("axes", {})
+    name = matrix.get("name", "matrix")
+
+    configs = []
+    duplicates = {}
+    seen = {}
+    for variants in itertools.product(*axes.values()):
+        config = base
+        for variant in variants:
+            config = _merge(config, variant)
+
+        labels = [v.get("label", "") for v in variants]
+        config["run_name"] = "_".join([name] + [l for l in labels if l])
+
+        key = _config_key(config, adv_set_dict, ranges_dict)
+        if key in seen:
+            duplicates[config["run_name"]] = seen[key]
+            continue
+        seen[key] = config["run_name"]
+        configs.append(config)
+
+    return configs, duplicates
+
+def run_thresholds(config):
+    """Returns the constraints of a run configuration, as (sign, threshold)
+    pairs keyed by output name"""
+    from pipeline_setup import Z_NAMES
+    from run_pipeline_scrip import CONSTRAINTS
+
+    constraints = dict(CONSTRAINTS)
+    for z_name, threshold in config.get("thresholds", {}).items():
+        if threshold is None:
+            constraints.pop(z_name, None)
+            continue
+
+        if z_name not in Z_NAMES:
+            raise ValueError(f"Threshold on unknown output '{z_name}', choose from {Z_NAMES}")
+
+        if isinstance(threshold, (list, tuple)):
+            if len(threshold) != 2 or threshold[0] not in (1, -1):
+                raise ValueError(f"Threshold of '{z_name}' must be a value or a [sign, threshold] "
+                                 f"pair with sign 1 or -1, got {threshold}")
+            constraints[z_name] = (int(threshold[0]), float(threshold[1]))
+        elif z_name in CONSTRAINTS:
+            constraints[z_name] = (CONSTRAINTS[z_name][0], float(threshold))
+        else:
+            raise ValueError(f"'{z_name}' has no default constraint, so its threshold must be "
+                             f"a [sign, threshold] pair, got {threshold}")
+    return constraints
+
+def run_parameters(config, adv_set_dict, ranges_dict):
+    """Returns the baseline parameters, varied parameter names and bounds of a
+    run configuration"""
+    from pipeline_setup import set_baseline_scenario
+    from run_pipeline_scrip import names_bounds
+
+    adv_set_dict = dict(adv_set_dict)
+    adv_set_dict.update(config["adv_set"])
+
+    names_x, x_bounds, names_fixed, values_fixed = names_bounds(ranges_dict[config["ranges"]])
+
+    params_baseline = set_baseline_scenario(adv_set_dict)
+    params_baseline.update(zip(names_fixed, values_fixed))
+    params_baseline.update(config["base_param"])
+
+    # Recorded with the parameters, as the baseline and the optimum depend on
+    # it. The pipeline ignores it.
+    population_projection = config.get("population_projection", "Medium")
+    if population_projection != "Medium":
+        params_baseline["population_projection"] = population_projection
+
+    return params_baseline, names_x, x_bounds
+
+# Warm state of each worker process
+_worker = {}
+
+def _setup_datablock(datablock_kwargs):
+    import numpy as np
+    from pipeline_setup import datablock_setup
+
+    datablock_kwargs = dict(datablock_kwargs)
+    datablock_kwargs["dtype"] = np.dtype(datablock_kwargs.get("dtype", "float64"))
+    return datablock_setup(**datablock_kwargs)
+
+def _init_worker(adv_set_dict, ranges_dict, datablock_kwargs, manifest=None):
+
+    _worker["adv_set_dict"] = adv_set_dict
+    _worker["ranges_dict"] = ranges_dict
+
+    if manifest is not None:
+        from shared_datablock import attach_datablock
+        _worker["datablock"] = attach_datablock(manifest)
+    else:
+        _worker["datablock"] = _setup_datablock(datablock_kwargs)
+    _worker["population_projection"] = datablock_kwargs.get("population_projection", "Medium")
+    _worker["variants"] = {}
+
+def _worker_datablock(population_projection):
+    """Returns the warm datablock of a worker for a population projection"""
+    from datablock_setup import with_population
+
+    if population_projection == _worker["population_projection"]:
+        return _worker["datablock"]
+
+    if population_projection not in _worker["variants"]:
+        _worker["variants"][population_projection] = with_population(_worker["datablock"],
+                                                                     population_projection)
+    return _worker["variants"][population_projection]
+
+def _run_config(config):
+    """Runs one optimisation in a worker process and returns its record"""
+    import contextlib
+    import io
+    from FFCObjectWithCache import FFCObjectiveWithCache
+    from run_pipeline_scrip import optimize, slider_url
+
+    t_start = time.perf_counter()
+
+    params_baseline, names_x, x_bounds = run_parameters(config, _worker["adv_set_dict"],
+                                                        _worker["ranges_dict"])
+    population_projection = config.get("population_projection", "Medium")
+
+    # Shallow copy, so the warm datablock is not modified by this run
+    datablock = dict(_worker_datablock(population_projection))
+    datablock.update(params_baseline)
+
+    ffc_wrapper = FFCObjectiveWithCache(names_x, datablock, params_baseline, verbosity=0)
+    x0 = [params_baseline[n] for n in names_x]
+    constraints = run_thresholds(config)
+
+    args = argparse.Namespace(zreq=config["zreq"], niter=config["niter"], ffc_tol=config["ffc_tol"],
+                              population_projection=population_projection)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        result = optimize(args, ffc_wrapper, x0, x_bounds, constraints=constraints)
+
+    return {"run_name": config["run_name"],
+            "params": params_baseline,
+            "bounds": dict(zip(names_x, x_bounds)),
+            "x_opt": dict(zip(names_x, result.x.tolist())),
+            "z": {k: float(v) for k, v in ffc_wrapper.objective_values(result.x).items()},
+            "zreq": config["zreq"],
+            "thresholds": constraints,
+            "args": dict(config, population_projection=population_projection),
+            "adv_set": config["adv_set"],
+            "result": {"success": bool(result.success), "message": str(result.message),
+                       "nfev": int(result.nfev), "fun": float(result.fun)},
+            "elapsed_s": time.perf_counter() - t_start,
+            "url": slider_url(params_baseline, names_x, result.x)}
+
+def run_matrix(configs, adv_set_dict, ranges_dict, results_db, workers=1,
+               datablock_kwargs=None, skip_existing=False, shared_datablock=False):
+    """Runs a list of configurations on a pool of warm worker processes.
+
+    Parameters
+    ----------
+    configs : list of dict
+        Run configurations, as returned by expand_matrix.
+    adv_set_dict : dict
+        Advanced settings, before the per-run overrides.
+    ranges_dict : dict
+        Parameter ranges, as returned by read_ranges.
+    results_db : str
+        Results store the runs are written to.
+    workers : int, optional
+        Number of worker processes, which is the maximum number of runs
+        executing at the same time.
+    datablock_kwargs : dict, optional
+        Arguments passed to datablock_setup in each worker.
+    skip_existing : bool, optional
+        Skip configurations whose run name is already in the results store.
+    shared_datablock : bool, optional
+        Build the datablock once in this process and share it with the
+        workers through shared memory, instead of building it in each worker.
+
+    Returns
+    -------
+    failed : dict
+        Run name -> error message of the runs that failed.
+    """
+    import contextlib
+    from results_store import ResultsStore
+
+    datablock_kwargs = datablock_kwargs or {}
+
+    failed = {}
+    with ResultsStore(results_db) as store, contextlib.ExitStack() as stack:
+
+        if skip_existing:
+            done = {run["run_name"] for run in store.query()}
+            configs = [c for c in configs if c["run_name"] not in done]
+
+        manifest = None
+        if shared_datablock:
+            from shared_datablock import SharedDatablock
+            shared = stack.enter_context(SharedDatablock(_setup_datablock(datablock_kwargs)))
+            manifest = shared.manifest
+            print(f"Datablock published in shared memory ({shared.nbytes/1e6:.1f} MB)")
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(adv_set_dict, ranges_dict, datablock_kwargs, manifest)) as pool:
+            futures = {pool.submit(_run_config, config): config["run_name"] for config in configs}
+
+            for i, future in enumerate(as_completed(futures)):
+                run_name = futures[future]
+                try:
+                    record = future.result()
+                except Exception as exc:
+                    failed[run_name] = f"{type(exc).__name__}: {exc}"
+                    print(f"[{i+1}/{len(configs)}] {run_name} failed: {failed[run_name]}")
+                    continue
+
+                store.add_run(source="scenario_matrix", optimizer="COBYLA", **record)
+                print(f"[{i+1}/{len(configs)}] {run_name}: {record['zreq']} = "
+                      f"{record['z'][record['zreq']]:.6g} in {record['elapsed_s']:.1f} s")
+
+    return failed
+
+def main():
+    from sheet_snapshots import load_sheet
+
+    parser = argparse.ArgumentParser(description="Run a matrix of optimisation scenarios")
+    parser.add_argument('matrix', type=str, help='Scenario matrix JSON file')
+    parser.add_argument('--workers', type=int, help='Number of worker processes', default=1)
+    parser.add_argument('--results_db', type=str, help='Results store', default="results.sqlite")
+    parser.add_argument('--settings-snapshot', type=str, help='Advanced settings CSV snapshot or snapshot directory', default=None)
+    parser.add_argument('--ranges-snapshot', type=str, help='Parameter ranges CSV snapshot or snapshot directory', default=None)
+    parser.add_argument('--float32', action='store_true', help='Evaluate the calculator in single precision')
+    parser.add_argument('--land_chunks', type=int, help='Evaluate the land maps lazily with dask', default=None)
+    parser.add_argument('--sparse_land', action='store_true', help='Only store the land pixels of the land use maps')
+    parser.add_argument('--skip_existing', action='store_true', help='Skip runs already in the results store')
+    parser.add_argument('--shared_datablock', action='store_true', help='Build the datablock once and share it with the workers through shared memory')
+    parser.add_argument('--dry_run', action='store_true', help='Only list the expanded runs')
+    args = parser.parse_args()
+
+    with open(args.matrix) as f:
+        matrix = json.load(f)
+
+    adv_set_dict = load_sheet("settings", args.settings_snapshot)
+    ranges_dict = load_sheet("ranges", args.ranges_snapshot)
+
+    configs, duplicates = expand_matrix(matrix, adv_set_dict, ranges_dict)
+    print(f"{len(configs)} runs, {len(duplicates)} duplicate configurations removed")
+    for dropped, kept in duplicates.items():
+        print(f"    {dropped} is identical to {kept}")
+
+    if args.dry_run:
+        for config in configs:
+            print(config["run_name"])
+        return
+
+    datablock_kwargs = {"dtype": "float32" if args.float32 else "float64",
+                        "sparse_land": args.sparse_land,
+                        "land_chunks": args.land_chunks}
+
+    failed = run_matrix(configs, adv_set_dict, ranges_dict, args.results_db,
+                        workers=args.workers, datablock_kwargs=datablock_kwargs,
+                        skip_existing=args.skip_existing,
+                        shared_datablock=args.shared_datablock)
+
+    if failed:
+        print(f"{len(failed)} runs failed")
+
+
+if __name__ == "__main__":
+    main()
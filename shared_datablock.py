@@ -0,0 +1,198 @@
+"""Datablocks shared between processes through shared memory.
+
+The publisher copies the NumPy buffers of every xarray object in a datablock
+into a single multiprocessing.shared_memory segment, and describes the
+datablock structure in a small picklable manifest. Worker processes attach to
+the segment with the manifest and rebuild the datablock as read-only xarray
+objects backed by the shared buffers, without copying them.
+
+Index coordinates, object and string arrays, dask arrays and any other values
+are small or cannot be shared, and are stored in the manifest instead.
+
+Usage
+-----
+with SharedDatablock(datablock) as shared:
+    pool = ProcessPoolExecutor(initializer=init, initargs=(shared.manifest,))
+    ...
+
+# In the worker
+datablock = attach_datablock(manifest)
+"""
+
+import sys
+from multiprocessing import shared_memory
+
+import numpy as np
+import xarray as xr
+
+# Alignment of each array in the shared segment, in bytes
+_ALIGN = 64
+
+# Segments published and attached by this process, kept open while their
+# arrays are in use
+_published = {}
+_attached = {}
+
+def _is_shareable(data):
+    return isinstance(data, np.ndarray) and \
+           data.dtype.kind in "biufcmM" and data.nbytes > 0
+
+def _describe_variable(variable, arrays):
+    if not isinstance(variable, xr.IndexVariable) and _is_shareable(variable.data):
+        arrays.append(variable.data)
+        return {"dims": variable.dims, "attrs": variable.attrs, "ref": len(arrays) - 1}
+    return {"inline": variable}
+
+def _describe(value, arrays):
+    """Describes a datablock entry, collecting the shareable arrays"""
+
+    if _is_shareable(value):
+        arrays.append(value)
+        return {"kind": "ndarray", "ref": len(arrays) - 1}
+
+    if isinstance(value, dict):
+        return {"kind": "dict",
+                "items": {k: _describe(v, arrays) for k, v in value.items()}}
+
+    if isinstance(value, xr.DataArray):
+        return {"kind": "DataArray",
+                "name": value.name,
+                "variable": _describe_variable(value.variable, arrays),
+                "coords": {k: _describe_variable(c.variable, arrays) for k, c in value.coords.items()}}
+
+    if isinstance(value, xr.Dataset):
+        return {"kind": "Dataset",
+                "attrs": value.attrs,
+                "data_vars": {k: _describe_variable(v.variable, arrays) for k, v in value.data_vars.items()},
+                "coords": {k: _describe_variable(c.variable, arrays) for k, c in value.coords.items()}}
+
+    return {"kind": "value", "value": value}
+
+def _set_refs(desc, layout):
+    """Replaces array indices in a description with (offset, shape, dtype)"""
+
+    if isinstance(desc, dict):
+        if "ref" in desc and isinstance(desc["ref"], int):
+            desc["ref"] = layout[desc["ref"]]
+        for value in desc.values():
+            _set_refs(value, layout)
+
+
+class SharedDatablock:
+    """Publishes a datablock in a shared memory segment.
+
+    Parameters
+    ----------
+    datablock : dict
+        Datablock, as returned by datablock_setup.
+
+    Attributes
+    ----------
+    manifest : dict
+        Picklable description of the datablock, passed to attach_datablock.
+    nbytes : int
+        Size of the shared segment.
+    """
+
+    def __init__(self, datablock):
+
+        arrays = []
+        structure = _describe(datablock, arrays)
+
+        layout = []
+        offset = 0
+        for arr in arrays:
+            offset = -(-offset // _ALIGN) * _ALIGN
+            layout.append((offset, arr.shape, arr.dtype.str))
+            offset += arr.nbytes
+
+        self.nbytes = max(offset, 1)
+        self._shm = shared_memory.SharedMemory(create=True, size=self.nbytes)
+        _published[self._shm.name] = self._shm
+
+        for arr, (start, shape, dtype) in zip(arrays, layout):
+            view = np.ndarray(shape, dtype=dtype, buffer=self._shm.buf, offset=start)
+            view[...] = arr
+            del view
+
+        _set_refs(structure, layout)
+        self.manifest = {"segment": self._shm.name,
+                         "nbytes": self.nbytes,
+                         "structure": structure}
+
+    def close(self):
+        """Releases and removes the shared segment. Workers must have stopped
+        using it."""
+        if self._shm is not None:
+            _published.pop(self._shm.name, None)
+            _attached.pop(self._shm.name, None)
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _open_segment(name):
+    if name in _published:
+        return _published[name]
+
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+
+    # Older versions register attached segments with the resource tracker,
+    # which would remove them when the worker exits
+    from multiprocessing import resource_tracker
+
+    shm = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+def _shared_array(ref, buf):
+    offset, shape, dtype = ref
+    arr = np.ndarray(shape, dtype=dtype, buffer=buf, offset=offset)
+    arr.flags.writeable = False
+    return arr
+
+def _rebuild_variable(desc, buf):
+    if "inline" in desc:
+        return desc["inline"]
+    return xr.Variable(desc["dims"], _shared_array(desc["ref"], buf), attrs=desc["attrs"])
+
+def _rebuild(desc, buf):
+    kind = desc["kind"]
+
+    if kind == "ndarray":
+        return _shared_array(desc["ref"], buf)
+
+    if kind == "dict":
+        return {k: _rebuild(v, buf) for k, v in desc["items"].items()}
+
+    if kind == "DataArray":
+        coords = {k: _rebuild_variable(c, buf) for k, c in desc["coords"].items()}
+        return xr.DataArray(_rebuild_variable(desc["variable"], buf), coords=coords,
+                            name=desc["name"])
+
+    if kind == "Dataset":
+        data_vars = {k: _rebuild_variable(v, buf) for k, v in desc["data_vars"].items()}
+        coords = {k: _rebuild_variable(c, buf) for k, c in desc["coords"].items()}
+        return xr.Dataset(data_vars, coords=coords, attrs=desc["attrs"])
+
+    return desc["value"]
+
+def attach_datablock(manifest):
+    """Rebuilds a published datablock from its manifest.
+
+    The arrays are read-only views of the shared segment. run_calculator deep
+    copies its input datablock, so the copies it modifies are writable.
+    """
+
+    name = manifest["segment"]
+    if name not in _attached:
+        _attached[name] = _open_segment(name)
+
+    return _rebuild(manifest["structure"], _attached[name].buf)
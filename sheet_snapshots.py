@@ -0,0 +1,211 @@
+"""Local snapshot store for the advanced settings and parameter ranges sheets.
+
+Snapshots are the raw CSV exports of the published Google sheets, stored under
+a directory per sheet and named by fetch time and content hash:
+
+    snapshots/
+        settings/
+            20250619T101500_3f2a9c1b7d4e.csv
+            20250619T101500_3f2a9c1b7d4e.json   <- parsed form
+            LATEST
+        ranges/
+            ...
+
+A new version is only written when the sheet contents change. The parsed
+JSON is written next to each CSV, so later runs skip the CSV parsing.
+
+Usage
+-----
+python sheet_snapshots.py fetch
+python sheet_snapshots.py fetch --settings_url http://127.0.0.1:8000/settings.csv
+python sheet_snapshots.py list
+
+Then run the optimisation offline with
+python run_pipeline_scrip.py --settings-snapshot snapshots/settings --ranges-snapshot snapshots/ranges
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from io import StringIO
+
+from pipeline_setup import (read_advanced_settings, read_ranges,
+                            ADVANCED_SETTINGS_URL, RANGES_WORKSHEET_URL)
+
+SNAPSHOT_DIR = "snapshots"
+
+# Sheet kind -> (default URL, parser)
+SHEETS = {"settings": (ADVANCED_SETTINGS_URL, read_advanced_settings),
+          "ranges": (RANGES_WORKSHEET_URL, read_ranges)}
+
+def _content_hash(text):
+    return hashlib.sha256(text.encode()).hexdigest()[:12]
+
+def _to_json(kind, parsed):
+    if kind == "ranges":
+        return {name: {k: list(v) for k, v in r.items()} for name, r in parsed.items()}
+    return parsed
+
+def _from_json(kind, data):
+    if kind == "ranges":
+        return {name: {k: tuple(v) for k, v in r.items()} for name, r in data.items()}
+    return data
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def fetch_snapshot(kind, url=None, snapshot_dir=SNAPSHOT_DIR, timeout=30):
+    """Downloads a sheet and stores it as a new snapshot version, if its
+    contents changed since the latest snapshot.
+
+    Parameters
+    ----------
+    kind : str
+        Either "settings" or "ranges".
+    url : str, optional
+        URL to fetch. Defaults to the published sheet URL.
+    snapshot_dir : str, optional
+        Root directory of the snapshot store.
+    timeout : float, optional
+        Network timeout in seconds.
+
+    Returns
+    -------
+    path : str
+        Path to the CSV file of the latest snapshot.
+    """
+    from urllib.request import urlopen
+
+    default_url, parser = SHEETS[kind]
+    if url is None:
+        url = default_url
+
+    with urlopen(url, timeout=timeout) as response:
+        text = response.read().decode("utf-8")
+
+    digest = _content_hash(text)
+    kind_dir = os.path.join(snapshot_dir, kind)
+    os.makedirs(kind_dir, exist_ok=True)
+
+    latest = latest_snapshot(kind_dir)
+    if latest is not None and latest.endswith(f"_{digest}.csv"):
+        return latest
+
+    # Parse before storing, so a broken sheet never becomes the latest version
+    parsed = parser(StringIO(text))
+
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    base = os.path.join(kind_dir, f"{stamp}_{digest}")
+    _write_atomic(f"{base}.csv", text)
+    _write_atomic(f"{base}.json", json.dumps({"sha256": digest,
+                                              "source": url,
+                                              "data": _to_json(kind, parsed)}))
+    _write_atomic(os.path.join(kind_dir, "LATEST"), os.path.basename(base) + ".csv")
+
+    return f"{base}.csv"
+
+def list_snapshots(kind_dir):
+    """Returns the CSV snapshot paths in a snapshot directory, oldest first"""
+    if not os.path.isdir(kind_dir):
+        return []
+    return [os.path.join(kind_dir, f) for f in sorted(os.listdir(kind_dir))
+            if f.endswith(".csv")]
+
+def latest_snapshot(kind_dir):
+    """Returns the path to the latest CSV snapshot in a snapshot directory, or
+    None if it has no snapshots"""
+    pointer = os.path.join(kind_dir, "LATEST")
+    if os.path.exists(pointer):
+        with open(pointer) as f:
+            return os.path.join(kind_dir, f.read().strip())
+    snapshots = list_snapshots(kind_dir)
+    return snapshots[-1] if snapshots else None
+
+def load_sheet(kind, source=None):
+    """Reads the advanced settings or parameter ranges from a URL, a CSV
+    snapshot, or a snapshot directory.
+
+    For local CSV files the parsed form is cached in a JSON file next to the
+    CSV, and reused as long as the CSV contents do not change.
+
+    Parameters
+    ----------
+    kind : str
+        Either "settings" or "ranges".
+    source : str, optional
+        URL, path to a CSV file, or snapshot directory, in which case its
+        latest snapshot is used. Defaults to the published sheet URL.
+
+    Returns
+    -------
+    parsed : dict
+        Output of read_advanced_settings or read_ranges.
+    """
+
+    default_url, parser = SHEETS[kind]
+    if source is None:
+        source = default_url
+
+    if source.startswith(("http://", "https://")):
+        return parser(source)
+
+    if os.path.isdir(source):
+        path = latest_snapshot(source)
+        if path is None:
+            raise FileNotFoundError(f"No {kind} snapshots found in {source}")
+    else:
+        path = source
+
+    with open(path) as f:
+        text = f.read()
+    digest = _content_hash(text)
+
+    cache_path = os.path.splitext(path)[0] + ".json"
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            cached = json.load(f)
+        if cached.get("sha256") == digest:
+            return _from_json(kind, cached["data"])
+
+    parsed = parser(StringIO(text))
+    try:
+        _write_atomic(cache_path, json.dumps({"sha256": digest,
+                                              "source": path,
+                                              "data": _to_json(kind, parsed)}))
+    except OSError:
+        pass
+
+    return parsed
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage local snapshots of the settings and ranges sheets")
+    parser.add_argument('command', choices=["fetch", "list"])
+    parser.add_argument('--dir', type=str, help='Snapshot store directory', default=SNAPSHOT_DIR)
+    parser.add_argument('--settings_url', type=str, help='Advanced settings URL', default=None)
+    parser.add_argument('--ranges_url', type=str, help='Parameter ranges URL', default=None)
+    args = parser.parse_args()
+
+    urls = {"settings": args.settings_url, "ranges": args.ranges_url}
+
+    for kind in SHEETS:
+        kind_dir = os.path.join(args.dir, kind)
+        if args.command == "fetch":
+            previous = latest_snapshot(kind_dir)
+            path = fetch_snapshot(kind, urls[kind], args.dir)
+            status = "unchanged" if path == previous else "new snapshot"
+            print(f"{kind}: {path} ({status})")
+        else:
+            latest = latest_snapshot(kind_dir)
+            for path in list_snapshots(kind_dir):
+                marker = " (latest)" if path == latest else ""
+                print(f"{kind}: {path}{marker}")
+
+
+if __name__ == "__main__":
+    main()
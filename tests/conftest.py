@@ -0,0 +1,31 @@
+import inspect
+import os
+import sys
+
+import pytest
+
+# The modules live at the top level of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def add_years_projection(monkeypatch):
+    """The model passes the projection mode as the second positional argument
+    of add_years, as in the AgriFoodPy pipeline branch. Released versions take
+    a pivot year there, so it is passed by keyword to them."""
+
+    import agrifoodpy.array_accessor as accessors
+
+    for cls in vars(accessors).values():
+        if not isinstance(cls, type) or "add_years" not in vars(cls):
+            continue
+        add_years = cls.add_years
+        if list(inspect.signature(add_years).parameters)[2] == "projection":
+            continue
+
+        def add_years_compat(self, years, *args, _add_years=add_years, **kwargs):
+            if args and isinstance(args[0], str):
+                return _add_years(self, years, projection=args[0], **kwargs)
+            return _add_years(self, years, *args, **kwargs)
+
+        monkeypatch.setattr(cls, "add_years", add_years_compat)
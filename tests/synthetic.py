@@ -0,0 +1,140 @@
+"""Synthetic datablock with the structure built by datablock_setup, small
+enough to run the full pipeline in the tests"""
+
+import copy
+
+import numpy as np
+import xarray as xr
+
+from pipeline_setup import set_baseline_scenario
+
+# Item groups and origins of the items selected by the pipeline nodes
+ITEMS = {
+    2511: ("Cereals - Excluding Beer", "Vegetal Products"),
+    2513: ("Cereals - Excluding Beer", "Vegetal Products"),
+    2546: ("Pulses", "Vegetal Products"),
+    2547: ("Pulses", "Vegetal Products"),
+    2617: ("Fruits - Excluding Wine", "Vegetal Products"),
+    2531: ("Starchy Roots", "Vegetal Products"),
+    2571: ("Vegetables Oils", "Vegetal Products"),
+    2731: ("Meat", "Animal Products"),
+    2732: ("Meat", "Animal Products"),
+    2733: ("Meat", "Animal Products"),
+    2734: ("Meat", "Animal Products"),
+    2735: ("Offals", "Animal Products"),
+    2740: ("Milk - Excluding Butter", "Animal Products"),
+    2743: ("Milk - Excluding Butter", "Animal Products"),
+    2948: ("Milk - Excluding Butter", "Animal Products"),
+    2949: ("Eggs", "Animal Products"),
+    2761: ("Fish, Seafood", "Animal Products"),
+}
+
+# Items shifted by the horticulture lever, and the items they replace
+HORTICULTURE_ITEMS = [2617, 2775, 2615, 2532, 2614, 2560, 2619, 2625, 2613,
+                      2620, 2612, 2551, 2563, 2602, 2611, 2640, 2641, 2618,
+                      2616, 2531, 2534, 2533, 2601, 2605, 2535]
+HORTICULTURE_TARGETS = [2659, 2513, 2546, 2656, 2658, 2657, 2520, 2642, 2633,
+                        2578, 2630, 2559, 2575, 2572, 2745, 2514, 2582, 2552,
+                        2517, 2516, 2586, 2570, 2580, 2562, 2577, 2576, 2547,
+                        2549, 2574, 2558, 2581, 2515, 2561, 2579, 2518, 2807,
+                        2571, 2555, 2645, 2542, 2537, 2536, 2541, 2557, 2573,
+                        2543, 2635, 2511, 2655]
+
+for item in HORTICULTURE_ITEMS:
+    ITEMS.setdefault(item, ("Vegetables", "Vegetal Products"))
+for item in HORTICULTURE_TARGETS:
+    ITEMS.setdefault(item, ("Oilcrops", "Vegetal Products"))
+
+LAND_CLASSES = ["Arable", "Improved grassland", "Semi-natural grassland",
+                "Broadleaf woodland", "Coniferous woodland", "Urban"]
+
+ELEMENTS = ["production", "imports", "exports", "food", "feed", "seed",
+            "processing", "losses", "other uses", "domestic supply"]
+
+# Advanced settings used by the nodes, as read from the settings sheet
+SETTINGS = {"n_scale": 20, "rda_kcal": 2250, "labmeat_co2e": 6.5,
+            "dairy_alternatives_co2e": 0.3, "cereals": 0,
+            "nitrogen_ghg_factor": 0.05, "methane_ghg_factor": 0.3,
+            "manure_ghg_factor": 0.2, "breeding_ghg_factor": 0.1,
+            "fossil_livestock_ghg_factor": 0.05, "fossil_arable_ghg_factor": 0.05,
+            "bdleaf_seq_ha_yr": 3.5, "conif_seq_ha_yr": 6.5,
+            "new_bdleaf_seq_ha_yr": 12.5, "new_conif_seq_ha_yr": 23.5,
+            "peatland_seq_ha_yr": 2.5, "managed_arable_seq_ha_yr": 1.0,
+            "managed_pasture_seq_ha_yr": 1.2, "mixed_farming_seq_ha_yr": 1.1,
+            "mixed_farming_production_scale": 0.9,
+            "mixed_farming_secondary_production_scale": 0.95,
+            "agroecology_tree_coverage": 0.1, "beccs_crops_seq_ha_yr": 20,
+            "dairy_herd_beef": 0.4, "baseline_beef_herd": 1.5e6,
+            "baseline_dairy_herd": 1.8e6,
+            "baseline_dairy_herd_breeding_aged_2_years_": 1.6e6,
+            "baseline_poultry_heads": 1.8e8, "baseline_pig_heads": 5e6,
+            "baseline_sheep_flock": 3.3e7}
+
+# Levers moved away from the baseline, so every node changes the datablock
+LEVERS = {"yield_proj": 0.1, "ruminant": -30, "dairy": -20, "pulses": 15,
+          "meat_alternatives": 20, "dairy_alternatives": 10, "waste": -10,
+          "foresting_pasture": 20, "land_BECCS": 5, "land_BECCS_pasture": 3,
+          "horticulture": 10, "pulse_production": 20, "lowland_peatland": 30,
+          "upland_peatland": 20, "mixed_farming": 5, "silvopasture": 10,
+          "pasture_soil_carbon": 10, "arable_soil_carbon": 10,
+          "methane_inhibitor": 50, "stock_density": 10, "manure_management": 20,
+          "animal_breeding": 20, "fossil_livestock": 30, "livestock_yield": 110,
+          "agroforestry": 10, "nitrogen": 20, "vertical_farming": 10,
+          "fossil_arable": 30, "waste_BECCS": 1, "overseas_BECCS": 1,
+          "DACCS": 2, "biochar": 1}
+
+
+def synthetic_datablock(seed=0):
+    """Datablock with random food, impact, population and land data"""
+
+    rng = np.random.default_rng(seed)
+    items = np.array(list(ITEMS))
+    item_coords = {"Item_name": ("Item", [f"item {i}" for i in items]),
+                   "Item_group": ("Item", [ITEMS[i][0] for i in items]),
+                   "Item_origin": ("Item", [ITEMS[i][1] for i in items])}
+
+    fbs = xr.Dataset({e: (("Year", "Item"), rng.uniform(1, 10, (1, len(items)))) for e in ELEMENTS},
+                     coords={"Year": [2020], "Item": items, "Region": 229, **item_coords})
+
+    years = np.arange(2020, 2051)
+    population = xr.DataArray(rng.uniform(6e7, 7e7, (2, len(years))) * [[1], [100]],
+                              dims=("Region", "Year"), coords={"Region": [826, 900], "Year": years})
+
+    datablock = {"food": {"g/cap/day": fbs}, "land": {}, "impact": {},
+                 "population": {"population": population}}
+
+    for key, quantity in [("kCal/g_food", "kCal/cap/day"),
+                          ("g_prot/g_food", "g_prot/cap/day"),
+                          ("g_fat/g_food", "g_fat/cap/day")]:
+        factor = xr.DataArray(rng.uniform(0, 5, len(items)), dims="Item",
+                              coords={"Item": items, "Year": 2020, **item_coords})
+        datablock["food"][key] = factor
+        datablock["food"][quantity] = fbs * factor
+
+    co2e = xr.DataArray(rng.uniform(0, 20, (len(items), 1)), dims=("Item", "Year"),
+                        coords={"Item": items, "Year": [2020]})
+    datablock["impact"]["gco2e/gfood"] = co2e
+    datablock["impact"]["g_co2e/year"] = fbs * co2e * population.sel(Region=826, Year=2020) * 365.25
+
+    shape = (4, 5)
+    map_coords = {"y": np.arange(shape[0]) * 1000., "x": np.arange(shape[1]) * 1000.}
+    land = rng.uniform(0, 1, (len(LAND_CLASSES),) + shape)
+    land = 100 * land / land.sum(axis=0)
+    land[:, 0, 0] = np.nan
+
+    datablock["land"]["percentage_land_use"] = xr.DataArray(
+        land, dims=("aggregate_class", "y", "x"),
+        coords={"aggregate_class": LAND_CLASSES, **map_coords})
+    datablock["land"]["dominant_classification"] = xr.DataArray(
+        rng.integers(1, 6, shape).astype(float), dims=("y", "x"), coords=map_coords)
+
+    datablock["land"]["baseline"] = copy.deepcopy(datablock["land"]["percentage_land_use"])
+    datablock["food"]["baseline"] = copy.deepcopy(datablock["food"]["g/cap/day"])
+
+    return datablock
+
+
+def scenario(levers):
+    params = set_baseline_scenario(dict(SETTINGS))
+    params.update(levers)
+    return params
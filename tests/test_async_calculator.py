@@ -0,0 +1,85 @@
+import asyncio
+import os
+import time
+
+import numpy as np
+
+from async_calculator import AsyncCalculator, arun_many
+from FFCObjectWithCache import FFCObjectiveWithCache
+from pipeline_setup import Z_NAMES
+
+def stub_calculator(datablock, params):
+    time.sleep(0.02)
+    return tuple(float(params["a"]) * float(datablock["scale"].sum()) * i
+                 for i in range(len(Z_NAMES)))
+
+def worker_pid(datablock, params):
+    return (os.getpid(), bool(datablock["scale"].flags.writeable))
+
+def test_process_pool_shares_datablock():
+    datablock = {"scale": np.ones(4)}
+    calculator = AsyncCalculator(max_concurrency=2, calculator=stub_calculator)
+    try:
+        z = asyncio.run(arun_many(datablock, [{"a": 1}, {"a": 2}, {"a": 1}], calculator=calculator))
+        assert [zi[1] for zi in z] == [4.0, 8.0, 4.0]
+        assert calculator.counters["evaluations"] == 2
+        assert len(calculator._shared) == 1
+
+        calculator.calculator = worker_pid
+        pid, writeable = asyncio.run(calculator.run(datablock, {"a": 3}))
+        assert pid != os.getpid()
+        assert not writeable
+    finally:
+        calculator.shutdown()
+    assert calculator._shared == {}
+
+def test_shared_datablocks_keyed_by_contents():
+    calculator = AsyncCalculator(max_concurrency=2, calculator=stub_calculator)
+    try:
+        # Equal datablocks share a segment
+        z = asyncio.run(calculator.run({"scale": np.ones(4)}, {"a": 1}))
+        z_equal = asyncio.run(calculator.run({"scale": np.ones(4)}, {"a": 2}))
+        assert (z[1], z_equal[1]) == (4.0, 8.0)
+        assert len(calculator._shared) == 1
+
+        # A datablock changed in place is published again
+        datablock = {"scale": np.ones(4)}
+        asyncio.run(calculator.run(datablock, {"a": 1}))
+        datablock["scale"][:] = 2.0
+        z_changed = asyncio.run(calculator.run(datablock, {"a": 1}))
+        assert z_changed[1] == 8.0
+        assert len(calculator._shared) == 2
+    finally:
+        calculator.shutdown()
+    assert calculator._shared == {}
+
+def test_thread_pool_coalesces_inflight_requests():
+    datablock = {"scale": np.ones(2)}
+    calculator = AsyncCalculator(max_concurrency=4, calculator=stub_calculator, processes=False)
+    try:
+        z = asyncio.run(arun_many(datablock, [{"a": i % 3} for i in range(12)], calculator=calculator))
+        assert [zi[1] for zi in z[:3]] == [0.0, 2.0, 4.0]
+        assert calculator.counters["evaluations"] == 3
+        assert calculator.counters["coalesced"] == 9
+    finally:
+        calculator.shutdown()
+
+def test_concurrent_acalculate_stores_once():
+    datablock = {"scale": np.ones(1)}
+    calculator = AsyncCalculator(max_concurrency=4, calculator=stub_calculator, processes=False)
+    wrapper = FFCObjectiveWithCache(["a"], datablock, {"a": 0.0})
+
+    evaluated = []
+    wrapper.on_evaluate = lambda x, z: evaluated.append(x)
+
+    async def main():
+        return await wrapper.acalculate_many([[1.0], [1.0], [2.0], [1.0]], calculator=calculator)
+
+    try:
+        out = asyncio.run(main())
+    finally:
+        calculator.shutdown()
+
+    assert [z["SSR prot"] for z in out] == [1.0, 1.0, 2.0, 1.0]
+    assert sorted(evaluated) == [(1.0,), (2.0,)]
+    assert wrapper._inflight == {}
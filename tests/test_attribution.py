@@ -0,0 +1,154 @@
+"""Attribution of scenario outputs to lever groups, on a fake calculator"""
+
+import itertools
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from FFCObjectWithCache import FFCObjectiveWithCache
+from attribution import attribute
+from pipeline_setup import Z_NAMES
+
+NAMES_X = ["ruminant", "dairy", "pig_poultry", "waste"]
+PARAMS = {"ruminant": 0.0, "dairy": 0.0, "pig_poultry": 0.0, "waste": 0.0,
+          "scaling_nutrient": "kCal/cap/day"}
+X = [-40.0, 10.0, 0.0, -25.0]
+
+# Linear and pairwise interaction coefficients of each output
+RNG = np.random.default_rng(0)
+LINEAR = RNG.normal(size=(len(Z_NAMES), len(NAMES_X)))
+PAIRWISE = RNG.normal(size=(len(Z_NAMES), len(NAMES_X), len(NAMES_X))) / 50
+
+
+class FakeCalculator:
+    """Batch calculator with lever interactions, recording its batches"""
+
+    def __init__(self, interactions=True):
+        self.interactions = interactions
+        self.batches = []
+
+    def __call__(self, datablock, params_list):
+        self.batches.append(len(params_list))
+        return [self.outputs(params) for params in params_list]
+
+    def outputs(self, params):
+        x = np.array([params[n] for n in NAMES_X])
+        z = LINEAR @ x
+        if self.interactions:
+            z = z + np.einsum("kij,i,j->k", PAIRWISE, x, x)
+        return tuple(z)
+
+
+def wrapper():
+    return FFCObjectiveWithCache(NAMES_X, {}, PARAMS)
+
+
+def outputs(calculator, x):
+    return np.array(calculator.outputs(dict(zip(NAMES_X, x))))
+
+
+def brute_force_shapley(calculator, x, groups):
+    """Average marginal contribution of each group over every order"""
+
+    x_base = np.zeros(len(NAMES_X))
+    contributions = np.zeros((len(groups), len(Z_NAMES)))
+
+    for order in itertools.permutations(range(len(groups))):
+        point = x_base.copy()
+        for g in order:
+            before = outputs(calculator, point)
+            for lever in groups[g]:
+                point[NAMES_X.index(lever)] = x[NAMES_X.index(lever)]
+            contributions[g] += outputs(calculator, point) - before
+
+    return contributions / math.factorial(len(groups))
+
+
+def test_default_groups():
+    calculator = FakeCalculator()
+
+    attribution = attribute(wrapper(), X, calculator=calculator)
+
+    # Only the levers changed by the scenario are attributed
+    assert list(attribution["one_at_a_time"].index) == ["ruminant", "dairy", "waste"]
+    assert list(attribution["one_at_a_time"].columns) == list(Z_NAMES)
+    assert "shapley" not in attribution
+
+    np.testing.assert_allclose(attribution["baseline"], outputs(calculator, [0, 0, 0, 0]))
+    np.testing.assert_allclose(attribution["scenario"], outputs(calculator, X))
+
+    # Baseline, scenario, and one point per group for each method, in one batch
+    assert attribution["evaluations"] == 8
+    assert calculator.batches == [8]
+
+    one_at_a_time = outputs(calculator, [-40, 0, 0, 0]) - outputs(calculator, [0, 0, 0, 0])
+    leave_one_out = outputs(calculator, X) - outputs(calculator, [0, 10, 0, -25])
+    np.testing.assert_allclose(attribution["one_at_a_time"].loc["ruminant"], one_at_a_time)
+    np.testing.assert_allclose(attribution["leave_one_out"].loc["ruminant"], leave_one_out)
+
+
+@pytest.mark.parametrize("groups", [None,
+                                    {"livestock": ["ruminant", "dairy", "pig_poultry"],
+                                     "waste": ["waste"]}])
+def test_shapley_matches_brute_force(groups):
+    calculator = FakeCalculator()
+
+    attribution = attribute(wrapper(), X, groups=groups, shapley=True, calculator=calculator)
+
+    group_levers = list(groups.values()) if groups else [["ruminant"], ["dairy"], ["waste"]]
+    expected = brute_force_shapley(calculator, X, group_levers)
+
+    np.testing.assert_allclose(attribution["shapley"].values, expected, atol=1e-12)
+
+    # Shapley contributions add up to the total change
+    total = attribution["scenario"] - attribution["baseline"]
+    pd.testing.assert_series_equal(attribution["shapley"].sum(), total, check_names=False)
+
+
+def test_additive_outputs():
+    attribution = attribute(wrapper(), X, shapley=True, calculator=FakeCalculator(False))
+
+    np.testing.assert_allclose(attribution["one_at_a_time"], attribution["leave_one_out"],
+                               atol=1e-12)
+    np.testing.assert_allclose(attribution["one_at_a_time"], attribution["shapley"],
+                               atol=1e-12)
+
+
+def test_cache_is_reused():
+    ffc_wrapper = wrapper()
+    calculator = FakeCalculator()
+
+    ffc_wrapper.calculate_many([X], calculator=calculator)
+    attribution = attribute(ffc_wrapper, X, calculator=calculator)
+    assert attribution["evaluations"] == 7
+
+    attribution = attribute(ffc_wrapper, X, calculator=calculator)
+    assert attribution["evaluations"] == 0
+    assert calculator.batches == [1, 7]
+
+
+def test_x_base():
+    calculator = FakeCalculator()
+    x_base = [-40.0, 0.0, 0.0, 0.0]
+
+    attribution = attribute(wrapper(), X, x_base=x_base, calculator=calculator)
+
+    assert list(attribution["one_at_a_time"].index) == ["dairy", "waste"]
+    np.testing.assert_allclose(attribution["baseline"], outputs(calculator, x_base))
+
+
+@pytest.mark.parametrize("groups", [{"a": ["ruminant", "dairy"], "b": ["dairy"]},
+                                    {"a": ["ruminant", "fish"]}])
+def test_invalid_groups(groups):
+    with pytest.raises(ValueError):
+        attribute(wrapper(), X, groups=groups, calculator=FakeCalculator())
+
+
+def test_too_many_shapley_groups():
+    calculator = FakeCalculator()
+
+    with pytest.raises(ValueError):
+        attribute(wrapper(), X, shapley=True, max_shapley_groups=2, calculator=calculator)
+    assert calculator.batches == []
@@ -0,0 +1,152 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from calculator_service import CalculatorService, MicroBatcher, make_server
+from pipeline_setup import Z_NAMES
+
+def stub_calculator(datablock, params_list):
+    """Outputs a * i for the i-th output, and fails for negative a"""
+    for params in params_list:
+        if params["a"] < 0:
+            raise ValueError(f"bad a = {params['a']}")
+    return [tuple(float(params["a"]) * i for i in range(len(Z_NAMES))) for params in params_list]
+
+@pytest.fixture
+def server():
+    calls = []
+
+    def calculator(datablock, params_list):
+        calls.append(len(params_list))
+        return stub_calculator(datablock, params_list)
+
+    service = CalculatorService({}, {"a": 1.0, "b": 2}, calculator=calculator, max_wait=0.02)
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield f"http://127.0.0.1:{server.server_address[1]}", calls
+
+    server.shutdown()
+    server.server_close()
+
+def _get(url):
+    with urllib.request.urlopen(url) as response:
+        return json.loads(response.read())
+
+def _post(url, payload):
+    request = urllib.request.Request(url, json.dumps(payload).encode(),
+                                     {"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read())
+
+def test_health(server):
+    url, _ = server
+    assert _get(f"{url}/health") == {"status": "ok"}
+
+def test_run_uses_default_params(server):
+    url, _ = server
+    status, reply = _post(f"{url}/run", {"params": {"a": 3}})
+    assert status == 200
+    assert reply["z"] == {zn: 3.0 * i for i, zn in enumerate(Z_NAMES)}
+
+    status, reply = _post(f"{url}/run", {})
+    assert reply["z"]["SSR prot"] == 1.0
+
+def test_run_many_deduplicates_and_caches(server):
+    url, calls = server
+    status, reply = _post(f"{url}/run_many", {"scenarios": [{"a": 7}, {"a": 7}, {"a": 8}]})
+    assert status == 200
+    assert [z["SSR prot"] for z in reply["z"]] == [7.0, 7.0, 8.0]
+    assert sum(calls) == 2
+
+    _post(f"{url}/run", {"params": {"a": 8}})
+    assert sum(calls) == 2
+
+    metrics = _get(f"{url}/metrics")
+    assert metrics["requests"] == 4
+    assert metrics["cache_hits"] == 1
+    assert metrics["evaluations"] == 2
+
+def test_unknown_endpoint(server):
+    url, _ = server
+    status, reply = _post(f"{url}/nothing", {})
+    assert status == 404
+
+def test_error_only_reaches_its_request(server):
+    url, _ = server
+    status, reply = _post(f"{url}/run", {"params": {"a": -1}})
+    assert status == 500
+    assert "bad a" in reply["error"]
+
+    metrics = _get(f"{url}/metrics")
+    assert metrics["errors"] == 1
+
+def test_batch_error_is_isolated():
+    batcher = MicroBatcher(lambda params_list: stub_calculator({}, params_list),
+                           max_batch_size=8, max_wait=0.2)
+
+    futures = [batcher.submit({"a": a}) for a in [1, -1, 2, 2]]
+
+    assert futures[0].result(timeout=5)[1] == 1.0
+    with pytest.raises(ValueError, match="bad a"):
+        futures[1].result(timeout=5)
+    assert futures[2].result(timeout=5)[1] == 2.0
+    assert futures[3].result(timeout=5)[1] == 2.0
+
+    metrics = batcher.metrics()
+    assert metrics["errors"] == 1
+    assert metrics["batches"] == 1
+
+def test_too_few_results():
+    # The last parameter set of every batch gets no result
+    batcher = MicroBatcher(lambda params_list: stub_calculator({}, params_list)[:-1],
+                           max_batch_size=8, max_wait=0.2)
+
+    futures = [batcher.submit({"a": a}) for a in [1, 2, 3]]
+
+    for future in futures:
+        with pytest.raises(ValueError, match="0 results for 1 parameter sets"):
+            future.result(timeout=5)
+    assert batcher.metrics()["errors"] == 3
+
+def test_unexpected_error_reaches_every_request(monkeypatch):
+    batcher = MicroBatcher(lambda params_list: stub_calculator({}, params_list),
+                           max_batch_size=8, max_wait=0.2)
+
+    def broken_evaluate(unique):
+        raise RuntimeError("broken batch")
+
+    with monkeypatch.context() as m:
+        m.setattr(batcher, "_evaluate", broken_evaluate)
+        futures = [batcher.submit({"a": a}) for a in [1, 1, 2]]
+        for future in futures:
+            with pytest.raises(RuntimeError, match="broken batch"):
+                future.result(timeout=5)
+
+    # The worker thread keeps serving requests
+    assert batcher.submit({"a": 3}).result(timeout=5)[1] == 3.0
+
+def _fake_run_calculator(datablock, params, **kwargs):
+    return tuple(float(params["a"]) * datablock["scale"] * i for i in range(len(Z_NAMES)))
+
+def test_default_calculator_uses_worker_pool(monkeypatch):
+    import parallel_batch
+
+    monkeypatch.setattr(parallel_batch, "run_calculator", _fake_run_calculator)
+    monkeypatch.setattr(parallel_batch, "run_calculator_batch",
+                        lambda datablock, params_list: [_fake_run_calculator(datablock, p) for p in params_list])
+
+    service = CalculatorService({"scale": 2.0}, {"a": 1.0}, workers=2)
+    try:
+        assert isinstance(service.calculator, parallel_batch.BatchPool)
+        z = service.run_many([{"a": 1}, {"a": 2}, {"a": 3}], timeout=60)
+        assert [zi["SSR prot"] for zi in z] == [2.0, 4.0, 6.0]
+    finally:
+        service.close()
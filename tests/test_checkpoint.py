@@ -0,0 +1,196 @@
+"""Checkpoints of optimisation runs, and runs resumed from them"""
+
+import argparse
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+import FFCObjectWithCache
+from checkpoint import RunCheckpoint, checkpoint_path, is_feasible
+from FFCObjectWithCache import FFCObjectiveWithCache
+from pipeline_setup import Z_NAMES
+from run_pipeline_scrip import CONSTRAINTS, optimize
+
+NAMES_X = ["ruminant", "dairy"]
+X_BOUNDS = [(-50.0, 50.0), (-50.0, 50.0)]
+PARAMS = {"ruminant": 0.0, "dairy": 0.0}
+THRESHOLDS = {"emissions": (-1, 10.0)}
+CONFIG = {"names_x": NAMES_X, "x_bounds": X_BOUNDS, "params": PARAMS}
+
+
+class FakeCalculator:
+    """Quadratic herd size peaking at (20, -10), with emissions growing with
+    the first lever. Raises KeyboardInterrupt after max_calls evaluations."""
+
+    def __init__(self, max_calls=None):
+        self.max_calls = max_calls
+        self.evaluated = []
+
+    def __call__(self, datablock, params, **kwargs):
+        if self.max_calls is not None and len(self.evaluated) >= self.max_calls:
+            raise KeyboardInterrupt
+
+        x = np.array([params[n] for n in NAMES_X])
+        self.evaluated.append(tuple(x))
+        z = dict.fromkeys(Z_NAMES, 1.0)
+        z["herd size"] = 1e6 - 100 * np.sum((x - [20.0, -10.0])**2)
+        z["emissions"] = x[0] - 5.0
+        return tuple(z[zn] for zn in Z_NAMES)
+
+
+def wrapper():
+    return FFCObjectiveWithCache(NAMES_X, {}, PARAMS)
+
+
+def run(ffc_wrapper, calculator, monkeypatch):
+    monkeypatch.setattr(FFCObjectWithCache, "run_calculator", calculator)
+    args = argparse.Namespace(zreq="herd size", niter=200, ffc_tol=1e-6)
+    return optimize(args, ffc_wrapper, [0.0, 0.0], X_BOUNDS)
+
+
+def z(herd_size, emissions):
+    return dict(dict.fromkeys(Z_NAMES, 1.0), **{"herd size": herd_size, "emissions": emissions})
+
+
+def test_checkpoint_path():
+    assert checkpoint_path("runs/herd") == "runs/herd.ckpt"
+
+
+def test_is_feasible():
+    assert is_feasible(z(1.0, 10.0), THRESHOLDS)
+    assert not is_feasible(z(1.0, 10.5), THRESHOLDS)
+    assert is_feasible(z(1.0, 10.5), {})
+
+
+def test_best_point():
+    checkpoint = RunCheckpoint("run.ckpt", CONFIG, "herd size", THRESHOLDS, every=0)
+
+    checkpoint.on_evaluate((1.0, 0.0), z(5.0, 0.0))
+    checkpoint.on_evaluate((2.0, 0.0), z(9.0, 20.0))
+    checkpoint.on_evaluate((3.0, 0.0), z(7.0, 0.0))
+    checkpoint.on_evaluate((4.0, 0.0), z(6.0, 0.0))
+
+    # The infeasible point is not kept, even with a larger herd size
+    assert checkpoint.nfev == 4
+    assert checkpoint.best_x == (3.0, 0.0)
+    assert checkpoint.best_z["herd size"] == 7.0
+
+    minimize = RunCheckpoint("run.ckpt", CONFIG, "herd size", THRESHOLDS, maximize=False)
+    minimize.update_best((3.0, 0.0), z(7.0, 0.0))
+    minimize.update_best((4.0, 0.0), z(6.0, 0.0))
+    assert minimize.best_x == (4.0, 0.0)
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / "run.ckpt")
+    checkpoint = RunCheckpoint(path, CONFIG, "herd size", THRESHOLDS, maximize=False, every=0)
+    checkpoint.cache[(1.0, 2.0)] = z(5.0, 0.0)
+    checkpoint.on_evaluate((1.0, 2.0), z(5.0, 0.0))
+
+    checkpoint.save(finished=True)
+    loaded = RunCheckpoint.load(path, every=3)
+
+    assert loaded.path == path
+    assert loaded.config == CONFIG
+    assert (loaded.z_name, loaded.thresholds, loaded.maximize) == ("herd size", THRESHOLDS, False)
+    assert loaded.every == 3
+    assert loaded.cache == {(1.0, 2.0): z(5.0, 0.0)}
+    assert loaded.nfev == 1
+    assert loaded.best_x == (1.0, 2.0)
+    assert loaded.best_z == z(5.0, 0.0)
+    assert loaded.finished
+
+
+def test_unsupported_version(tmp_path):
+    path = str(tmp_path / "run.ckpt")
+    checkpoint = RunCheckpoint(path, CONFIG, "herd size", THRESHOLDS)
+    state = dict(checkpoint.state(), version=0)
+    with open(path, "wb") as f:
+        pickle.dump(state, f)
+
+    with pytest.raises(ValueError, match="Unsupported checkpoint version 0"):
+        RunCheckpoint.load(path)
+
+
+def test_atomic_replace(tmp_path, monkeypatch):
+    path = str(tmp_path / "run.ckpt")
+    checkpoint = RunCheckpoint(path, CONFIG, "herd size", THRESHOLDS, every=0)
+    checkpoint.on_evaluate((1.0, 2.0), z(5.0, 0.0))
+    checkpoint.save()
+
+    # A write interrupted halfway leaves the previous checkpoint in place
+    def interrupted_dump(state, f, protocol=None):
+        f.write(b"partial")
+        raise KeyboardInterrupt
+
+    checkpoint.on_evaluate((3.0, 2.0), z(6.0, 0.0))
+    monkeypatch.setattr(pickle, "dump", interrupted_dump)
+    with pytest.raises(KeyboardInterrupt):
+        checkpoint.save()
+    monkeypatch.undo()
+
+    assert RunCheckpoint.load(path).nfev == 1
+
+    checkpoint.save()
+    assert RunCheckpoint.load(path).nfev == 2
+    assert os.listdir(tmp_path) == ["run.ckpt"]
+
+
+def test_attach(tmp_path, monkeypatch):
+    path = str(tmp_path / "run.ckpt")
+    checkpoint = RunCheckpoint(path, CONFIG, "herd size", THRESHOLDS, every=4)
+    checkpoint.cache[(0.0, 0.0)] = z(5.0, 0.0)
+    ffc_wrapper = wrapper()
+
+    checkpoint.attach(ffc_wrapper)
+
+    # The restored entries are in the wrapper cache, which the checkpoint
+    # now shares
+    assert ffc_wrapper._cache == {(0.0, 0.0): z(5.0, 0.0)}
+    assert checkpoint.cache is ffc_wrapper._cache
+
+    calculator = FakeCalculator()
+    monkeypatch.setattr(FFCObjectWithCache, "run_calculator", calculator)
+    for x in [[0.0, 0.0], [1.0, 0.0], [2.0, 0.0], [1.0, 0.0]]:
+        ffc_wrapper.objective(x, "herd size")
+    assert calculator.evaluated == [(1.0, 0.0), (2.0, 0.0)]
+    assert checkpoint.nfev == 2
+    assert not os.path.exists(path)
+
+    # Saved every 4 new evaluations
+    for x in [[3.0, 0.0], [4.0, 0.0]]:
+        ffc_wrapper.objective(x, "herd size")
+    assert RunCheckpoint.load(path).nfev == 4
+    assert len(RunCheckpoint.load(path).cache) == 5
+
+
+def test_resume_replays_from_cache(tmp_path, monkeypatch):
+    path = str(tmp_path / "run.ckpt")
+    uninterrupted = FakeCalculator()
+    expected = run(wrapper(), uninterrupted, monkeypatch)
+    nfev = len(uninterrupted.evaluated)
+
+    # A run interrupted halfway, saved as on an interrupt
+    checkpoint = RunCheckpoint(path, CONFIG, "herd size", CONSTRAINTS, every=5)
+    interrupted_wrapper = wrapper()
+    checkpoint.attach(interrupted_wrapper)
+    interrupted = FakeCalculator(max_calls=nfev // 2)
+    with pytest.raises(KeyboardInterrupt):
+        run(interrupted_wrapper, interrupted, monkeypatch)
+    checkpoint.save()
+
+    resumed_checkpoint = RunCheckpoint.load(path)
+    resumed_wrapper = wrapper()
+    resumed_checkpoint.attach(resumed_wrapper)
+    resumed = FakeCalculator()
+    result = run(resumed_wrapper, resumed, monkeypatch)
+
+    # The cached points are replayed without calling the calculator, and the
+    # resumed run ends where the uninterrupted run did
+    assert not set(resumed.evaluated) & set(interrupted.evaluated)
+    assert len(interrupted.evaluated) + len(resumed.evaluated) == nfev
+    np.testing.assert_array_equal(result.x, expected.x)
+    assert resumed_checkpoint.nfev == nfev
+    assert resumed_checkpoint.best_x == tuple(result.x)
@@ -0,0 +1,61 @@
+"""Endpoint years mode against the full 2021-2050 projection, on a synthetic
+datablock with the structure built by datablock_setup"""
+
+import copy
+
+import numpy as np
+import pytest
+import xarray as xr
+
+import agrifoodpy.food.food  # noqa: F401, registers the fbs accessor
+
+import model
+from pipeline_setup import ENDPOINT_YEARS, Z_NAMES, check_endpoint_years, run_calculator
+from synthetic import LEVERS, scenario, synthetic_datablock
+
+
+@pytest.fixture(scope="module")
+def datablock():
+    return synthetic_datablock()
+
+
+@pytest.mark.parametrize("yield_change", [None, 0.2])
+def test_project_future_endpoint_years(datablock, yield_change):
+    full = model.project_future(copy.deepcopy(datablock), yield_change)
+    endpoint = model.project_future(copy.deepcopy(datablock), yield_change, years=ENDPOINT_YEARS)
+
+    years = [2020] + ENDPOINT_YEARS
+    for group, key in [("food", "g/cap/day"), ("food", "kCal/cap/day"),
+                       ("food", "g_prot/cap/day"), ("food", "g_fat/cap/day"),
+                       ("impact", "gco2e/gfood")]:
+        assert list(endpoint[group][key].Year.values) == years
+        xr.testing.assert_allclose(endpoint[group][key], full[group][key].sel(Year=years),
+                                   rtol=1e-12)
+
+
+@pytest.mark.parametrize("levers", [{}, LEVERS], ids=["baseline", "levers"])
+def test_endpoint_years_outputs(datablock, levers):
+    params = scenario(levers)
+    datablock = dict(datablock, **params)
+
+    full = run_calculator(datablock, params, endpoint_years=False)
+    endpoint = run_calculator(datablock, params, endpoint_years=True)
+
+    assert len(full) == len(endpoint) == len(Z_NAMES)
+    for zn, z_full, z_endpoint in zip(Z_NAMES, full, endpoint):
+        assert np.isfinite(z_full), zn
+        np.testing.assert_allclose(z_endpoint, z_full, rtol=1e-12, err_msg=zn)
+
+    differences = check_endpoint_years(datablock, params)
+    assert list(differences) == Z_NAMES
+
+
+def test_levers_change_outputs(datablock):
+    # The comparison above is only meaningful if the levers reach the outputs
+    baseline = scenario({})
+    levers = scenario(LEVERS)
+    z_baseline = run_calculator(dict(datablock, **baseline), baseline, endpoint_years=True)
+    z_levers = run_calculator(dict(datablock, **levers), levers, endpoint_years=True)
+
+    changed = [zn for zn, a, b in zip(Z_NAMES, z_baseline, z_levers) if not np.isclose(a, b)]
+    assert changed == Z_NAMES
@@ -0,0 +1,73 @@
+"""Batched FaIR runs against agrifoodpy's single scenario fair_co2_only"""
+
+import numpy as np
+import pytest
+import xarray as xr
+
+pytest.importorskip("fair")
+
+from agrifoodpy.impact.model import fair_co2_only
+
+import parallel_batch
+from fair_batch import fair_co2_only_batch, temperature_sweep
+from pipeline_setup import Z_NAMES
+
+YEARS = np.arange(2020, 2051)
+
+
+def emission_series(a):
+    return xr.DataArray(a * np.linspace(1, -0.5, len(YEARS)), dims="Year", coords={"Year": YEARS})
+
+
+def fake_run_calculator(datablock, params, endpoint_years=None, outputs=None, **kwargs):
+    z = tuple(float(params["a"]) * i for i in range(len(Z_NAMES)))
+    if outputs is None:
+        return z
+    return z, {"emissions_series": emission_series(params["a"])}
+
+
+def fake_run_calculator_batch(datablock, params_list, **kwargs):
+    return [fake_run_calculator(datablock, params, **kwargs) for params in params_list]
+
+
+@pytest.mark.parametrize("chunk_size", [None, 2])
+def test_batch_matches_fair_co2_only(chunk_size):
+    rng = np.random.default_rng(0)
+    emissions = xr.DataArray(rng.uniform(-1, 2, (3, len(YEARS))), dims=("Scenario", "Year"),
+                             coords={"Scenario": [10, 11, 12], "Year": YEARS})
+
+    T, C, F = fair_co2_only_batch(emissions, chunk_size=chunk_size)
+
+    assert T.dims == ("Scenario", "timebounds")
+    assert list(T.Scenario.values) == [10, 11, 12]
+    for i in range(3):
+        T_i, C_i, F_i = fair_co2_only(emissions.isel(Scenario=i))
+        np.testing.assert_array_equal(T.isel(Scenario=i).values, T_i.values)
+        np.testing.assert_array_equal(C.isel(Scenario=i).values, C_i.values)
+        np.testing.assert_array_equal(F.isel(Scenario=i).values, F_i.values)
+
+
+def test_non_consecutive_years():
+    emissions = emission_series(1.).sel(Year=[2020, 2030])
+    with pytest.raises(ValueError):
+        fair_co2_only_batch(emissions)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_temperature_sweep_calculator(monkeypatch, workers):
+    monkeypatch.setattr(parallel_batch, "run_calculator", fake_run_calculator)
+    monkeypatch.setattr(parallel_batch, "run_calculator_batch", fake_run_calculator_batch)
+
+    datablock = {"scale": 1.0}
+    scenarios = [{"a": 1.0}, {"a": 2.0}, {"a": 1.0}]
+
+    with parallel_batch.BatchPool(datablock, workers=workers) as pool:
+        sweep = temperature_sweep(datablock, scenarios, calculator=pool)
+
+    reference = temperature_sweep(datablock, scenarios, calculator=fake_run_calculator_batch)
+
+    xr.testing.assert_equal(sweep, reference)
+    assert list(sweep["SSR prot"].values) == [1.0, 2.0, 1.0]
+
+    T, _, _ = fair_co2_only(emission_series(2.0))
+    np.testing.assert_array_equal(sweep["T"].isel(Scenario=1).values, T.values)
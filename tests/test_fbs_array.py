@@ -0,0 +1,143 @@
+"""Array-backed food balance sheet operations against the `fbs` accessor"""
+
+import numpy as np
+import pytest
+import xarray as xr
+
+import agrifoodpy.food.food  # noqa: F401, registers the fbs accessor
+
+from fbs_array import FBSArray, FBSOpChain
+from model import check_negative_source, feed_scale
+
+ELEMENTS = ["production", "imports", "exports", "food", "feed", "seed", "processing"]
+ITEMS = [2511, 2731, 2740, 2848]
+ORIGINS = ["Vegetal Products", "Animal Products", "Animal Products", "Animal Products"]
+YEARS = np.arange(2019, 2025)
+
+
+def food_balance_sheet(seed=0):
+    rng = np.random.default_rng(seed)
+    data = {element: (("Item", "Year"), rng.uniform(-2, 10, (len(ITEMS), len(YEARS))))
+            for element in ELEMENTS}
+    data["food"][1][0, 1] = np.nan
+    coords = {"Item": ITEMS, "Year": YEARS, "Item_origin": ("Item", ORIGINS)}
+    return xr.Dataset(data, coords=coords)
+
+
+def assert_fbs_equal(fbs_array, expected):
+    actual = fbs_array.to_xarray()
+    for element in ELEMENTS:
+        np.testing.assert_allclose(actual[element].values, expected[element].values,
+                                   rtol=1e-12, atol=1e-12)
+
+
+def test_round_trip_shares_buffer():
+    fbs = food_balance_sheet()
+    array = FBSArray.from_xarray(fbs)
+    out = array.to_xarray()
+
+    xr.testing.assert_identical(out, fbs)
+
+    # The Dataset returned by to_xarray is packed without copying
+    assert FBSArray.from_xarray(out).data is array.data
+    assert FBSArray.from_xarray(out, copy=True).data is not array.data
+
+
+@pytest.mark.parametrize("scale", [
+    1.2,
+    np.linspace(1, 2, len(YEARS)),
+    xr.DataArray(np.linspace(0.5, 1.5, len(YEARS)), dims="Year", coords={"Year": YEARS}),
+    xr.DataArray([0.5, 2.0, 1.5, 0.8], dims="Item", coords={"Item": ITEMS}),
+    # Out of order labels and years beyond the food balance sheet
+    xr.DataArray(np.linspace(2, 1, len(YEARS) + 2), dims="Year",
+                 coords={"Year": np.arange(2026, 2018, -1)}),
+])
+@pytest.mark.parametrize("items", [None, [2740, 2511]])
+def test_scale_add(scale, items):
+    fbs = food_balance_sheet()
+
+    expected = fbs.fbs.scale_add("food", "imports", scale, items=items)
+    out = FBSArray.from_xarray(fbs, copy=True).scale_add("food", "imports", scale, items=items)
+
+    assert_fbs_equal(out, expected)
+
+
+def test_scale_add_several_elements():
+    fbs = food_balance_sheet()
+    kwargs = {"add": [True, False], "elasticity": [0.3, 0.7]}
+
+    expected = fbs.fbs.scale_add("production", ["imports", "exports"], 0.8, **kwargs)
+    out = FBSArray.from_xarray(fbs, copy=True).scale_add("production", ["imports", "exports"],
+                                                         0.8, **kwargs)
+
+    assert_fbs_equal(out, expected)
+
+
+@pytest.mark.parametrize("scale", [
+    xr.DataArray([2.0, 3.0], dims="Year", coords={"Year": [2021, 2022]}),
+    xr.DataArray([0.5, 2.0], dims="Item", coords={"Item": [2511, 2848]}),
+    xr.DataArray(np.full((2, 3), 2.0), dims=("Item", "Year"),
+                 coords={"Item": [2731, 9999], "Year": [2020, 2021, 2030]}),
+])
+def test_scale_add_partial_scale(scale):
+    """Items and years missing from the scale are left unscaled"""
+
+    fbs = food_balance_sheet()
+    full_scale = scale.reindex(Item=ITEMS, fill_value=1.0) if "Item" in scale.dims else scale
+    full_scale = full_scale.reindex(Year=YEARS, fill_value=1.0) if "Year" in scale.dims \
+        else full_scale
+
+    expected = fbs.fbs.scale_add("food", "imports", full_scale)
+    out = FBSArray.from_xarray(fbs, copy=True).scale_add("food", "imports", scale)
+
+    assert_fbs_equal(out, expected)
+
+
+def test_scale_add_unsupported_dimension():
+    fbs = FBSArray.from_xarray(food_balance_sheet(), copy=True)
+    scale = xr.DataArray([1.0, 2.0], dims="Region")
+
+    with pytest.raises(ValueError):
+        fbs.scale_add("food", "imports", scale)
+
+
+def test_unknown_item():
+    fbs = FBSArray.from_xarray(food_balance_sheet(), copy=True)
+
+    with pytest.raises(KeyError):
+        fbs.scale_add("food", "imports", 2.0, items=[1234])
+
+
+@pytest.mark.parametrize("add", [True, False])
+def test_check_negative_source(add):
+    fbs = food_balance_sheet()
+
+    expected = check_negative_source(fbs.copy(deep=True), "production", add=add)
+    out = FBSArray.from_xarray(fbs, copy=True).check_negative_source("production", add=add)
+
+    assert_fbs_equal(out, expected)
+
+
+def test_op_chain_matches_accessor():
+    fbs = food_balance_sheet()
+    scale = xr.DataArray(np.linspace(0.6, 1.0, len(YEARS)), dims="Year", coords={"Year": YEARS})
+
+    expected = fbs.fbs.scale_add("food", ["imports", "production"], scale, items=[2731, 2740],
+                                 elasticity=[0.4, 0.6])
+    expected = feed_scale(expected, fbs)
+    expected = check_negative_source(expected, "imports", "exports", add=False)
+
+    chain = FBSOpChain().scale_add("food", ["imports", "production"], scale, items=[2731, 2740],
+                                   elasticity=[0.4, 0.6]) \
+                        .feed_scale() \
+                        .check_negative_source("imports", "exports", add=False)
+
+    assert_fbs_equal(FBSArray.from_xarray(chain.run(fbs)), expected)
+
+    # The input is not modified
+    xr.testing.assert_identical(fbs, food_balance_sheet())
+
+    ratio = chain.ratio(fbs)
+    for element in ELEMENTS:
+        expected_ratio = (expected[element] / fbs[element]).fillna(1)
+        np.testing.assert_allclose(ratio[element].values, expected_ratio.values, rtol=1e-12)
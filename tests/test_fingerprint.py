@@ -0,0 +1,191 @@
+"""Content fingerprints of datablocks and parameter sets"""
+
+import copy
+import gc
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+import xarray as xr
+
+import fingerprint as fp
+from fingerprint import (fingerprint, fingerprint_array, fingerprint_datablock,
+                         fingerprint_params, freeze_datablock)
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def synthetic_datablock():
+    years = np.arange(2020, 2026)
+    food = xr.Dataset({"production": (("Item", "Year"), np.arange(12.).reshape(2, 6)),
+                       "imports": (("Item", "Year"), np.ones((2, 6)))},
+                      coords={"Item": [2511, 2731], "Year": years,
+                              "Item_name": ("Item", ["Wheat", "Bovine Meat"])},
+                      attrs={"units": "g/cap/day"})
+    population = xr.DataArray(np.linspace(66e6, 70e6, 6), dims="Year",
+                              coords={"Year": years}, name="population")
+    return {"food": {"g/cap/day": food},
+            "population": population,
+            "land": np.arange(6).reshape(2, 3),
+            "global_parameters": {"timescale": 20, "labels": ["a", "b"]}}
+
+
+def modified(edit):
+    datablock = synthetic_datablock()
+    edit(datablock)
+    return datablock
+
+
+def test_params_are_canonical():
+    params = {"ruminant": 0, "dairy": -12.5, "scaling_nutrient": "kCal/cap/day",
+              "cereal_scaling": True}
+
+    same = {"cereal_scaling": np.bool_(True), "scaling_nutrient": "kCal/cap/day",
+            "dairy": np.float32(-12.5), "ruminant": 0.0}
+
+    assert fingerprint_params(params) == fingerprint_params(same)
+    assert fingerprint_params({"ruminant": 0}) == fingerprint_params({"ruminant": np.int64(0)})
+    assert fingerprint_params({"ruminant": [1, 2]}) == fingerprint_params({"ruminant": (1.0, 2.0)})
+
+
+@pytest.mark.parametrize("other", [{"ruminant": 1e-9}, {"ruminant": True}, {"ruminant": "0"},
+                                   {"dairy": 0}, {"ruminant": 0, "dairy": 0}])
+def test_params_differ(other):
+    assert fingerprint_params({"ruminant": 0}) != fingerprint_params(other)
+
+
+def test_equal_datablocks():
+    datablock = synthetic_datablock()
+
+    assert fingerprint_datablock(datablock) == fingerprint_datablock(synthetic_datablock())
+    assert fingerprint_datablock(datablock) == fingerprint_datablock(copy.deepcopy(datablock))
+
+    # Non contiguous arrays hash their contents
+    transposed = synthetic_datablock()
+    transposed["land"] = np.ascontiguousarray(transposed["land"].T).T
+    assert fingerprint_datablock(transposed) == fingerprint_datablock(datablock)
+
+
+def set_value(d):
+    d["food"]["g/cap/day"]["production"][0, 0] = 1.0
+
+
+def set_dtype(d):
+    d["land"] = d["land"].astype(np.float64)
+
+
+def set_shape(d):
+    d["land"] = d["land"].reshape(3, 2)
+
+
+def set_coordinate(d):
+    d["population"] = d["population"].assign_coords(Year=np.arange(2021, 2027))
+
+
+def set_item_name(d):
+    d["food"]["g/cap/day"] = d["food"]["g/cap/day"].assign_coords(
+        Item_name=("Item", ["Wheat", "Beef"]))
+
+
+def set_attribute(d):
+    d["food"]["g/cap/day"].attrs["units"] = "kg/cap/year"
+
+
+def set_dimension_name(d):
+    d["population"] = d["population"].rename(Year="year")
+
+
+def set_name(d):
+    d["population"].name = "pop"
+
+
+def set_key(d):
+    d["food"]["kCal/cap/day"] = d["food"].pop("g/cap/day")
+
+
+def set_coord_to_variable(d):
+    d["food"]["g/cap/day"] = d["food"]["g/cap/day"].reset_coords("Item_name")
+
+
+def set_parameter(d):
+    d["global_parameters"]["timescale"] = 25
+
+
+@pytest.mark.parametrize("edit", [set_value, set_dtype, set_shape, set_coordinate, set_item_name,
+                                  set_attribute, set_dimension_name, set_name, set_key,
+                                  set_coord_to_variable, set_parameter])
+def test_datablocks_differ(edit):
+    assert fingerprint_datablock(synthetic_datablock()) != fingerprint_datablock(modified(edit))
+
+
+def test_fingerprint_with_params():
+    datablock = synthetic_datablock()
+
+    assert fingerprint(datablock) == fingerprint_datablock(datablock)
+    assert fingerprint(datablock, {"ruminant": 0}) == fingerprint(datablock, {"ruminant": 0.0})
+    assert fingerprint(datablock, {"ruminant": 0}) != fingerprint(datablock, {"ruminant": 1})
+    assert fingerprint(datablock, {"ruminant": 0}) != fingerprint(datablock)
+
+
+def test_read_only_digests_are_memoised():
+    arr = np.arange(10.)
+    digest = fingerprint_array(arr)
+    assert id(arr) not in fp._array_digests
+
+    # Writable arrays are hashed again, so in place changes are seen
+    arr[0] = 1.0
+    assert fingerprint_array(arr) != digest
+
+    arr.flags.writeable = False
+    digest = fingerprint_array(arr)
+    assert fp._array_digests[id(arr)][1] == digest
+
+    # The memoised digest is used, and dropped with the array
+    key = id(arr)
+    fp._array_digests[key] = (fp._array_digests[key][0], b"memoised")
+    assert fingerprint_array(arr) == b"memoised"
+
+    del arr
+    gc.collect()
+    assert key not in fp._array_digests
+
+
+def test_views_of_writable_arrays_are_not_memoised():
+    base = np.arange(10.)
+    view = base[2:]
+    view.flags.writeable = False
+
+    digest = fingerprint_array(view)
+    base[5] = -1.0
+
+    assert fingerprint_array(view) != digest
+
+
+def test_freeze_datablock():
+    datablock = synthetic_datablock()
+    expected = fingerprint_datablock(datablock)
+
+    assert freeze_datablock(datablock) is datablock
+    assert not datablock["land"].flags.writeable
+    assert not datablock["population"].values.flags.writeable
+    assert not datablock["food"]["g/cap/day"]["production"].values.flags.writeable
+
+    assert fingerprint_datablock(datablock) == expected
+    assert fingerprint_datablock(datablock) == expected
+
+
+def test_fingerprint_across_processes():
+    datablock = synthetic_datablock()
+    params = {"ruminant": -20, "labels": ["a", "b"]}
+
+    code = ("import sys; sys.path.insert(0, 'tests'); "
+            "from test_fingerprint import synthetic_datablock; "
+            "from fingerprint import fingerprint; "
+            "print(fingerprint(synthetic_datablock(), {'labels': ['a', 'b'], 'ruminant': -20.0}))")
+    env = dict(os.environ, PYTHONHASHSEED="123")
+    output = subprocess.run([sys.executable, "-c", code], cwd=REPO, env=env, check=True,
+                            capture_output=True, text=True).stdout.strip()
+
+    assert output == fingerprint(datablock, params)
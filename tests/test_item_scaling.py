@@ -0,0 +1,60 @@
+"""Levers applied at once by item_scaling_multiple against their sequential
+application, on the synthetic datablock"""
+
+import copy
+
+import numpy as np
+import pytest
+import xarray as xr
+from agrifoodpy.pipeline import Pipeline
+
+from model import item_scaling_multiple, item_scaling_multiple_sequential
+from pipeline_setup import pipeline_setup
+from synthetic import LEVERS, scenario, synthetic_datablock
+
+
+def projected(params):
+    """Returns the datablock after project_future, and the parameters of
+    the item_scaling_multiple node"""
+
+    food_system = pipeline_setup(Pipeline(dict(synthetic_datablock(), **params)), params)
+    assert food_system.nodes[1] is item_scaling_multiple
+
+    food_system.run(to_node=1)
+    return food_system.datablock, food_system.params[1]
+
+
+@pytest.mark.parametrize("levers", [
+    {},
+    LEVERS,
+    dict(LEVERS, elasticity=0.3),
+    dict(LEVERS, cereal_scaling=False),
+    dict(LEVERS, scaling_nutrient="g/cap/day"),
+    {"ruminant": 10, "dairy": 5, "pulses": -20, "fruit_veg": 5},
+], ids=["baseline", "levers", "elasticity", "not_constant", "grams", "increase"])
+def test_fused_matches_sequential(levers):
+    datablock, kwargs = projected(scenario(levers))
+
+    fused = item_scaling_multiple(copy.deepcopy(datablock), **kwargs)
+    sequential = item_scaling_multiple_sequential(copy.deepcopy(datablock), **kwargs)
+
+    xr.testing.assert_allclose(fused["food"]["g/cap/day"], sequential["food"]["g/cap/day"],
+                               rtol=1e-12, atol=0)
+    if levers:
+        assert not np.allclose(fused["food"]["g/cap/day"]["food"],
+                               datablock["food"]["g/cap/day"]["food"])
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"non_sel_items": None},
+    {"items": [[2731, 2732], [2732, 2733]], "scale": [0.8, 1.2]},
+    {"non_sel_items": [2511, 2731]},
+], ids=["no_non_selected", "overlapping_groups", "overlapping_non_selected"])
+def test_sequential_fallback(kwargs):
+    datablock, node_kwargs = projected(scenario(LEVERS))
+    node_kwargs = dict(node_kwargs, **kwargs)
+
+    fused = item_scaling_multiple(copy.deepcopy(datablock), **node_kwargs)
+    sequential = item_scaling_multiple_sequential(copy.deepcopy(datablock), **node_kwargs)
+
+    xr.testing.assert_identical(fused["food"]["g/cap/day"], sequential["food"]["g/cap/day"])
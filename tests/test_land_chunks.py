@@ -0,0 +1,56 @@
+"""Dask backed land use maps against maps held in memory, on the synthetic
+datablock"""
+
+import collections
+
+import numpy as np
+import pytest
+from dask.callbacks import Callback
+
+from pipeline_setup import Z_NAMES, run_calculator
+from synthetic import LEVERS, scenario, synthetic_datablock
+
+# One persist of the map in each node that changes it, and one or two
+# reductions of it in each node that reads its totals
+MAX_COMPUTES = 40
+
+
+class CountTasks(Callback):
+    """Counts the dask computations and how many times each task runs"""
+
+    def __init__(self):
+        super().__init__()
+        self.computes = 0
+        self.tasks = collections.Counter()
+
+    def _start(self, dsk):
+        self.computes += 1
+
+    def _posttask(self, key, result, dsk, state, worker_id):
+        self.tasks[key] += 1
+
+
+def chunked_datablock():
+    datablock = synthetic_datablock()
+    for key in ["percentage_land_use", "baseline"]:
+        datablock["land"][key] = datablock["land"][key].chunk({"y": 2, "x": 2})
+    return datablock
+
+
+@pytest.mark.parametrize("levers", [{}, LEVERS], ids=["baseline", "levers"])
+def test_chunked_outputs(levers):
+    params = scenario(levers)
+
+    eager = run_calculator(dict(synthetic_datablock(), **params), params)
+
+    counter = CountTasks()
+    with counter:
+        chunked = run_calculator(dict(chunked_datablock(), **params), params)
+
+    for zn, z_eager, z_chunked in zip(Z_NAMES, eager, chunked):
+        np.testing.assert_allclose(z_chunked, z_eager, rtol=1e-12, err_msg=zn)
+
+    # The maps of the land nodes are computed once, rather than again for
+    # every total taken downstream
+    assert 0 < counter.computes <= MAX_COMPUTES
+    assert sum(counter.tasks.values()) < 1.5 * len(counter.tasks)
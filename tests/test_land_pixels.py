@@ -0,0 +1,89 @@
+"""Sparse pixel representation of the land use maps"""
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from land_pixels import pixel_index, spatial_dims, to_map, to_pixels, valid_pixels
+from pipeline_setup import Z_NAMES, run_calculator
+from synthetic import LEVERS, scenario, synthetic_datablock
+
+
+def land_map():
+    rng = np.random.default_rng(0)
+    data = rng.uniform(0, 100, (3, 4, 5))
+    data[:, 0, :] = np.nan          # sea along the first row
+    data[:, 2, 3] = np.nan
+    data[1, 3, 1] = np.nan          # a single class missing is still land
+    return xr.DataArray(data, dims=("aggregate_class", "y", "x"),
+                        coords={"aggregate_class": ["Arable", "Urban", "Woodland"],
+                                "y": np.arange(4) * 1000., "x": np.arange(5) * 1000.},
+                        name="land", attrs={"units": "%"})
+
+
+def sparse_datablock(datablock):
+    land = datablock["land"]
+    index = pixel_index(valid_pixels(land["percentage_land_use"]))
+    for key in ["percentage_land_use", "baseline", "dominant_classification"]:
+        land[key] = to_pixels(land[key], index)
+    land["pixel_index"] = index
+    return datablock
+
+
+def test_valid_pixels():
+    valid = valid_pixels(land_map())
+
+    assert valid.dims == ("y", "x")
+    assert not valid[0].any()
+    assert not valid[2, 3]
+    assert valid[3, 1]
+    assert int(valid.sum()) == 4 * 5 - 5 - 1
+
+
+def test_round_trip():
+    da = land_map()
+    index = pixel_index(valid_pixels(da))
+
+    pixels = to_pixels(da, index)
+    assert pixels.dims == ("aggregate_class", "pixel")
+    assert pixels.sizes["pixel"] == int(valid_pixels(da).sum())
+    assert spatial_dims(pixels) == ["pixel"]
+    assert spatial_dims(da) == ["y", "x"]
+
+    xr.testing.assert_identical(to_map(pixels, index), da)
+
+
+def test_round_trip_transposed_and_integer():
+    da = land_map().transpose("y", "x", "aggregate_class")
+    index = pixel_index(valid_pixels(da))
+
+    xr.testing.assert_identical(to_map(to_pixels(da, index), index),
+                                da.transpose("aggregate_class", "y", "x"))
+
+    # Cells outside the index are filled with zero for non floating arrays
+    grade = xr.DataArray(np.arange(20).reshape(4, 5) + 1, dims=("y", "x"),
+                         coords={"y": da.y, "x": da.x})
+    rebuilt = to_map(to_pixels(grade, index), index)
+    assert rebuilt.dtype == grade.dtype
+    np.testing.assert_array_equal(rebuilt, grade.where(valid_pixels(da), 0))
+
+
+def test_dask_pixels():
+    da = land_map()
+    index = pixel_index(valid_pixels(da))
+
+    pixels = to_pixels(da.chunk({"y": 2, "x": 2}), index)
+
+    assert pixels.chunks is not None
+    xr.testing.assert_identical(pixels.compute(), to_pixels(da, index))
+
+
+@pytest.mark.parametrize("levers", [{}, LEVERS], ids=["baseline", "levers"])
+def test_sparse_outputs(levers):
+    params = scenario(levers)
+
+    dense = run_calculator(dict(synthetic_datablock(), **params), params)
+    sparse = run_calculator(dict(sparse_datablock(synthetic_datablock()), **params), params)
+
+    for zn, z_dense, z_sparse in zip(Z_NAMES, dense, sparse):
+        np.testing.assert_allclose(z_sparse, z_dense, rtol=1e-12, err_msg=zn)
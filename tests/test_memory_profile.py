@@ -0,0 +1,139 @@
+"""Memory profiles of pipeline nodes, their names and their budget"""
+
+import tracemalloc
+
+import numpy as np
+import pytest
+from agrifoodpy.pipeline import Pipeline
+
+from memory_profile import MemoryBudgetExceeded, MemoryProfile, node_names
+from pipeline_setup import run_calculator
+from synthetic import scenario, synthetic_datablock
+
+
+def allocate(datablock, size=1_000_000):
+    datablock["array"] = np.ones(size // 8)
+    return datablock
+
+
+def release(datablock):
+    datablock.pop("array", None)
+    return datablock
+
+
+def pipeline():
+    food_system = Pipeline({})
+    food_system.add_node(allocate)
+    food_system.add_node(release, name="drop array")
+    food_system.add_node(allocate, params={"size": 2_000_000})
+    return food_system
+
+
+@pytest.fixture(autouse=True)
+def no_tracing():
+    assert not tracemalloc.is_tracing()
+    yield
+    assert not tracemalloc.is_tracing()
+
+
+def run(profile, food_system=None):
+    food_system = food_system or pipeline()
+    profile.start()
+    try:
+        profile.instrument(food_system)
+        food_system.run()
+    finally:
+        profile.stop()
+    return food_system
+
+
+def test_node_names():
+    # Generic names are replaced by the function names, numbered by
+    # position when a function is used by several nodes
+    assert node_names(pipeline()) == ["allocate (1)", "drop array", "allocate (3)"]
+
+    food_system = Pipeline({})
+    food_system.add_node(allocate, name="first")
+    food_system.add_node(release)
+    assert node_names(food_system) == ["first", "release"]
+
+
+def test_records():
+    profile = MemoryProfile()
+
+    run(profile)
+
+    assert [r["node"] for r in profile.records] == ["allocate (1)", "drop array", "allocate (3)"]
+    peaks = [r["peak_bytes"] for r in profile.records]
+    assert 1_000_000 <= peaks[0] < 1_100_000
+    assert 2_000_000 <= peaks[2] < 2_100_000
+    assert profile.records[1]["retained_bytes"] < 0
+    assert profile.records[2]["datablock_bytes"] == 2_000_000
+    assert profile.peak_bytes >= 2_000_000
+
+    assert list(profile.summary().index) == ["allocate (1)", "drop array", "allocate (3)"]
+
+
+def test_without_tracing():
+    profile = MemoryProfile(trace=False)
+
+    run(profile)
+
+    assert [r["peak_bytes"] for r in profile.records] == [None] * 3
+    assert profile.evaluation_peaks == [2_000_000]
+
+
+def test_budget_warns():
+    profile = MemoryProfile(budget=1.5e6, on_exceed="warn")
+
+    with pytest.warns(ResourceWarning, match="in node allocate \\(3\\), over the budget"):
+        food_system = run(profile)
+
+    # The evaluation carries on
+    assert len(profile.records) == 3
+    assert food_system.datablock["array"].nbytes == 2_000_000
+
+
+def test_budget_raises():
+    profile = MemoryProfile(budget=1.5e6, on_exceed="raise")
+
+    with pytest.raises(MemoryBudgetExceeded, match="in node allocate \\(3\\)"):
+        run(profile)
+
+    assert len(profile.records) == 3
+
+
+def test_budget_without_tracing():
+    profile = MemoryProfile(budget=1.5e6, on_exceed="raise", trace=False)
+
+    with pytest.raises(MemoryBudgetExceeded):
+        run(profile)
+
+
+def test_tracing_left_running():
+    # Tracing started by someone else is not stopped by the profile
+    tracemalloc.start()
+    try:
+        run(MemoryProfile())
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def test_invalid_on_exceed():
+    with pytest.raises(ValueError):
+        MemoryProfile(on_exceed="ignore")
+
+
+def test_run_calculator():
+    params = scenario({})
+    profile = MemoryProfile()
+
+    z_profiled = run_calculator(dict(synthetic_datablock(), **params), params, memory=profile)
+    z = run_calculator(dict(synthetic_datablock(), **params), params)
+
+    np.testing.assert_array_equal(z_profiled, z)
+    names = list(profile.summary().index)
+    assert names[:3] == ["deepcopy", "project_future", "item_scaling_multiple"]
+    assert not any(name.startswith("Node ") for name in names)
+    assert len(set(names)) == len(names)
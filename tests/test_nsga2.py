@@ -0,0 +1,158 @@
+"""NSGA-II ranking, and runs on a fake two objective calculator"""
+
+import numpy as np
+import pytest
+
+from FFCObjectWithCache import FFCObjectiveWithCache
+from nsga2 import (MINIMIZED, crowding_distance, dominance_matrix, load_pareto,
+                   non_dominated_fronts, nsga2, parse_objectives, write_pareto)
+from pipeline_setup import Z_NAMES
+from results_store import ResultsStore
+
+NAMES_X = ["ruminant", "dairy"]
+X_BOUNDS = [(0.0, 1.0), (0.0, 1.0)]
+PARAMS = {"ruminant": 0.0, "dairy": 0.0}
+
+# Herd size and emissions both grow with the first lever, the second lever
+# only adds emissions, so the front is dairy = 0. SSR kcal >= 0.2 cuts it.
+CONSTRAINTS = {"SSR kcal": (1, 0.2)}
+
+
+def fake_calculator(datablock, params_list):
+    outputs = []
+    for params in params_list:
+        x0, x1 = params["ruminant"], params["dairy"]
+        z = dict.fromkeys(Z_NAMES, 0.0)
+        z.update({"herd size": x0, "emissions": x0**2 + x1, "SSR kcal": x0})
+        outputs.append(tuple(z[zn] for zn in Z_NAMES))
+    return outputs
+
+
+def wrapper():
+    return FFCObjectiveWithCache(NAMES_X, {}, PARAMS)
+
+
+def test_parse_objectives():
+    assert MINIMIZED == ["emissions"]
+    assert parse_objectives(["herd size", "emissions"]) == {"herd size": 1, "emissions": -1}
+    assert parse_objectives(["min:herd size", "max:emissions"]) == {"herd size": -1, "emissions": 1}
+    assert parse_objectives(["SSR kcal"]) == {"SSR kcal": 1}
+
+
+def brute_force_dominates(F, violation, i, j):
+    if violation[i] <= 0 and violation[j] <= 0:
+        return np.all(F[i] <= F[j]) and np.any(F[i] < F[j])
+    if violation[i] <= 0:
+        return True
+    if violation[j] <= 0:
+        return False
+    return violation[i] < violation[j]
+
+
+def test_dominance_matrix():
+    rng = np.random.default_rng(0)
+    F = rng.integers(0, 4, (30, 2)).astype(float)
+    violation = np.where(rng.random(30) < 0.3, rng.integers(1, 3, 30), 0.)
+
+    dominates = dominance_matrix(F, violation)
+
+    for i in range(len(F)):
+        for j in range(len(F)):
+            assert dominates[i, j] == brute_force_dominates(F, violation, i, j)
+
+
+def test_non_dominated_fronts():
+    rng = np.random.default_rng(1)
+    F = rng.random((40, 3))
+    violation = np.where(rng.random(40) < 0.25, rng.random(40), 0.)
+
+    fronts = non_dominated_fronts(F, violation)
+
+    assert sorted(np.concatenate(fronts)) == list(range(40))
+
+    # No candidate is dominated by one in its front or in a later front,
+    # and each candidate after the first front is dominated by the one before
+    for k, front in enumerate(fronts):
+        later = np.concatenate(fronts[k:])
+        for i in front:
+            assert not any(brute_force_dominates(F, violation, j, i) for j in later)
+            if k > 0:
+                assert any(brute_force_dominates(F, violation, j, i) for j in fronts[k - 1])
+
+
+def test_feasible_front_first():
+    F = np.array([[0., 0.], [1., 1.], [2., 0.], [0., 2.]])
+    violation = np.array([0.5, 0., 0., 0.1])
+
+    fronts = non_dominated_fronts(F, violation)
+
+    assert [list(front) for front in fronts] == [[1, 2], [3], [0]]
+
+
+def test_crowding_distance():
+    F = np.array([[0., 4.], [1., 2.], [3., 1.], [4., 0.]])
+
+    distance = crowding_distance(F)
+
+    assert np.isinf(distance[[0, 3]]).all()
+    np.testing.assert_allclose(distance[1:3], [3 / 4 + 3 / 4, 3 / 4 + 2 / 4])
+
+    assert np.isinf(crowding_distance(F[:2])).all()
+
+
+def test_nsga2_front():
+    pareto = nsga2(wrapper(), ["herd size", "emissions"], X_BOUNDS, CONSTRAINTS,
+                   popsize=16, generations=15, seed=3, calculator=fake_calculator)
+
+    assert list(pareto.columns) == NAMES_X + list(Z_NAMES) + ["violation"]
+    assert (pareto["violation"] == 0).all()
+    assert (pareto["SSR kcal"] >= 0.2).all()
+    # Sorted from the best value of the first objective
+    assert pareto["herd size"].is_monotonic_decreasing
+
+    # The front spans the feasible herd sizes, mostly without the lever that
+    # only adds emissions, and its scenarios do not dominate each other
+    assert pareto["herd size"].min() < 0.3 and pareto["herd size"].max() > 0.95
+    assert (pareto["dairy"] < 0.05).mean() > 0.9
+    F = np.column_stack([-pareto["herd size"], pareto["emissions"]])
+    dominates = dominance_matrix(F, pareto["violation"].values)
+    assert not dominates.any()
+
+
+def test_nsga2_replays_from_cache():
+    ffc_wrapper = wrapper()
+    kwargs = {"x0": [0.5, 0.0], "popsize": 8, "generations": 4, "seed": 1}
+
+    pareto = nsga2(ffc_wrapper, ["herd size", "emissions"], X_BOUNDS, CONSTRAINTS,
+                   calculator=fake_calculator, **kwargs)
+    assert (0.5, 0.0) in ffc_wrapper._cache
+
+    def failing_calculator(datablock, params_list):
+        raise AssertionError("Resumed run evaluated a new scenario")
+
+    replayed = nsga2(ffc_wrapper, ["herd size", "emissions"], X_BOUNDS, CONSTRAINTS,
+                     calculator=failing_calculator, **kwargs)
+
+    assert replayed.equals(pareto)
+
+
+def test_unknown_objective():
+    with pytest.raises(ValueError):
+        nsga2(wrapper(), ["herd sizes"], X_BOUNDS, CONSTRAINTS, calculator=fake_calculator)
+
+
+def test_write_and_load_pareto(tmp_path):
+    pareto = nsga2(wrapper(), ["herd size", "emissions"], X_BOUNDS, CONSTRAINTS,
+                   popsize=8, generations=3, calculator=fake_calculator)
+
+    with ResultsStore(str(tmp_path / "results.sqlite")) as store:
+        ids = write_pareto(store, "front", pareto, PARAMS, NAMES_X, X_BOUNDS,
+                           ["herd size", "emissions"], CONSTRAINTS)
+        store.add_run("front_other", PARAMS, bounds=dict(zip(NAMES_X, X_BOUNDS)),
+                      x_opt={"ruminant": 0.0, "dairy": 0.0}, source="nsga2")
+
+        loaded = load_pareto(store, "front")
+
+    assert len(ids) == len(pareto) == len(loaded)
+    assert list(loaded["run_name"]) == [f"front_pareto{i:03d}" for i in range(len(pareto))]
+    assert (loaded["zreq"] == "herd size, emissions").all()
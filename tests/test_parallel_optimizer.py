@@ -0,0 +1,119 @@
+"""Feasibility ranking and CMA-ES runs on a fake calculator"""
+
+import numpy as np
+import pytest
+
+from FFCObjectWithCache import FFCObjectiveWithCache
+from parallel_optimizer import cmaes, constraint_violation, feasibility_order
+from pipeline_setup import Z_NAMES
+
+NAMES_X = ["ruminant", "dairy", "waste"]
+X_BOUNDS = [(-50.0, 50.0), (-50.0, 50.0), (0.0, 10.0)]
+PARAMS = {"ruminant": 0.0, "dairy": 0.0, "waste": 0.0}
+OPTIMUM = np.array([20.0, -10.0, 3.0])
+
+
+class FakeCalculator:
+    """Quadratic herd size peaking at OPTIMUM, with emissions growing with
+    the first lever. Records the size of each batch."""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, datablock, params_list):
+        self.batches.append(len(params_list))
+        outputs = []
+        for params in params_list:
+            x = np.array([params[n] for n in NAMES_X])
+            z = dict.fromkeys(Z_NAMES, 1.0)
+            z["herd size"] = 1e6 - 100 * np.sum((x - OPTIMUM)**2)
+            z["emissions"] = x[0] - 10.0
+            outputs.append(tuple(z[zn] for zn in Z_NAMES))
+        return outputs
+
+
+def wrapper():
+    return FFCObjectiveWithCache(NAMES_X, {}, PARAMS)
+
+
+def test_constraint_violation():
+    z = {"SSR kcal": 0.6, "emissions": 5.0, "herd size": 3e6}
+
+    assert constraint_violation(z, {}) == 0.
+    assert constraint_violation(z, {"SSR kcal": (1, 0.5), "emissions": (-1, 10.0)}) == 0.
+
+    # Excesses are relative to the thresholds, or absolute below one
+    assert constraint_violation(z, {"SSR kcal": (1, 0.7)}) == pytest.approx(0.1)
+    assert constraint_violation(z, {"emissions": (-1, 0.0)}) == pytest.approx(5.0)
+    assert constraint_violation(z, {"herd size": (-1, 2e6)}) == pytest.approx(0.5)
+    assert constraint_violation(z, {"SSR kcal": (1, 0.7), "herd size": (-1, 2e6)}) \
+        == pytest.approx(0.6)
+
+
+def test_feasibility_order():
+    f = np.array([3., 1., 2., -5., 0.])
+    violation = np.array([0., 0., 0.2, 0.1, 0.])
+
+    # Feasible by objective, then infeasible by violation
+    assert list(feasibility_order(f, violation)) == [4, 1, 0, 3, 2]
+
+
+def test_cmaes():
+    calculator = FakeCalculator()
+
+    result = cmaes(wrapper(), "herd size", [0.0, 0.0, 5.0], X_BOUNDS, {},
+                   maxiter=200, popsize=10, calculator=calculator)
+
+    assert result.success
+    np.testing.assert_allclose(result.x, OPTIMUM, atol=1e-3)
+    assert result.fun == pytest.approx(-1e6, abs=1e-3)
+    assert result.nit < 200
+    assert "tolerance" in result.message
+
+    # Each generation is one batch
+    assert result.nfev == 10 * result.nit
+    assert len(calculator.batches) == result.nit
+    assert max(calculator.batches) <= 10
+
+
+def test_cmaes_constrained():
+    # Emissions must not be positive, which moves the first lever to 10
+    result = cmaes(wrapper(), "herd size", [0.0, 0.0, 5.0], X_BOUNDS, {"emissions": (-1, 0.0)},
+                   maxiter=200, popsize=10, calculator=FakeCalculator())
+
+    assert result.success
+    assert result.maxcv == 0
+    np.testing.assert_allclose(result.x, [10.0, -10.0, 3.0], atol=0.05)
+    assert result.x[0] <= 10.0
+
+
+def test_cmaes_minimize_on_bound():
+    result = cmaes(wrapper(), "emissions", [0.0, 0.0, 5.0], X_BOUNDS, {}, maxiter=100,
+                   maximize=False, calculator=FakeCalculator())
+
+    assert result.x[0] == -50.0
+    assert result.fun == -60.0
+
+
+def test_cmaes_infeasible():
+    result = cmaes(wrapper(), "herd size", [0.0, 0.0, 5.0], X_BOUNDS,
+                   {"emissions": (-1, -100.0)}, maxiter=20, calculator=FakeCalculator())
+
+    assert not result.success
+    assert "no feasible point" in result.message
+    # The least infeasible point has the lowest emissions
+    assert result.x[0] == pytest.approx(-50.0, abs=1.0)
+    assert result.maxcv > 0
+
+
+def test_cmaes_replays_from_cache():
+    ffc_wrapper = wrapper()
+    result = cmaes(ffc_wrapper, "herd size", [0.0, 0.0, 5.0], X_BOUNDS, {}, maxiter=10,
+                   seed=4, calculator=FakeCalculator())
+
+    replay = FakeCalculator()
+    replayed = cmaes(ffc_wrapper, "herd size", [0.0, 0.0, 5.0], X_BOUNDS, {}, maxiter=10,
+                     seed=4, calculator=replay)
+
+    np.testing.assert_array_equal(replayed.x, result.x)
+    assert replay.batches == []
@@ -0,0 +1,64 @@
+"""Per capita quantities derived from the food weights and per gram factors"""
+
+import numpy as np
+import xarray as xr
+
+from model import PER_CAPITA_QUANTITIES, per_capita_quantities
+
+ELEMENTS = ["production", "imports", "exports", "food"]
+ITEMS = [2511, 2731, 2740, 2848]
+YEARS = [2020, 2050]
+
+
+def factor(items, values):
+    return xr.DataArray(values, dims="Item", coords={"Item": items,
+                                                     "Item_name": ("Item", [str(i) for i in items])})
+
+
+def synthetic_datablock():
+    rng = np.random.default_rng(0)
+    food = xr.Dataset({element: (("Item", "Year"), rng.uniform(0, 10, (len(ITEMS), len(YEARS))))
+                       for element in ELEMENTS},
+                      coords={"Item": ITEMS, "Year": YEARS})
+
+    return {"food": {"g/cap/day": food,
+                     "g_prot/g_food": factor(ITEMS, [0.1, 0.2, 0.03, 0.2]),
+                     "g_fat/g_food": factor(ITEMS, [0.01, 0.15, 0.04, 0.02]),
+                     # Out of order, with an item missing and an extra item
+                     "kCal/g_food": factor([2848, 2511, 2740, 9999], [1.5, 3.4, 0.6, 2.0])},
+            "impact": {"gco2e/gfood": factor([2731, 2511], [30.0, 1.2])}}
+
+
+def test_per_capita_quantities():
+    datablock = synthetic_datablock()
+    food = datablock["food"]["g/cap/day"]
+
+    per_cap = per_capita_quantities(datablock)
+
+    assert list(per_cap.Quantity.values) == list(PER_CAPITA_QUANTITIES)
+    assert list(per_cap.Item.values) == ITEMS
+
+    xr.testing.assert_allclose(per_cap.sel(Quantity="weight", drop=True), food)
+
+    for quantity, (_, location) in PER_CAPITA_QUANTITIES.items():
+        if location is None:
+            continue
+        # Joining each factor with the food weights drops the items without
+        # a factor, which add nothing to the item sums
+        joined = datablock[location[0]][location[1]].reset_coords(drop=True) * food
+        computed = per_cap.sel(Quantity=quantity, drop=True)
+        xr.testing.assert_allclose(computed.sum(dim="Item"), joined.sum(dim="Item"))
+
+        missing = np.setdiff1d(ITEMS, joined.Item.values)
+        assert (computed.sel(Item=missing).to_array() == 0).all()
+
+
+def test_selected_quantities_and_food():
+    datablock = synthetic_datablock()
+    food = datablock["food"]["g/cap/day"] * 2
+
+    per_cap = per_capita_quantities(datablock, ["protein", "energy"], food=food)
+
+    assert list(per_cap.Quantity.values) == ["protein", "energy"]
+    xr.testing.assert_allclose(per_cap.sel(Quantity="protein", drop=True),
+                               food * datablock["food"]["g_prot/g_food"].reset_coords(drop=True))
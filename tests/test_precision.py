@@ -0,0 +1,105 @@
+"""Reduced precision datablocks, on the synthetic datablock"""
+
+import copy
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from agrifoodpy.pipeline import Pipeline
+
+from datablock_setup import cast_datablock
+from pipeline_setup import Z_NAMES, pipeline_setup, run_calculator
+from precision_report import precision_report, sample_scenarios
+from synthetic import LEVERS, scenario, synthetic_datablock
+
+
+def floating_arrays(group):
+    """Yields the key and dtype of every floating point array of a datablock
+    group"""
+
+    for key, value in group.items():
+        if isinstance(value, xr.Dataset):
+            for name, var in value.data_vars.items():
+                if np.issubdtype(var.dtype, np.floating):
+                    yield f"{key}/{name}", var.dtype
+        elif isinstance(value, xr.DataArray) and np.issubdtype(value.dtype, np.floating):
+            yield key, value.dtype
+
+
+def test_cast_datablock():
+    datablock = synthetic_datablock()
+    datablock["land"]["mask"] = xr.DataArray(np.ones((2, 2), dtype=bool), dims=("y", "x"))
+    datablock["land"]["grade"] = xr.DataArray(np.arange(4), dims="x")
+    datablock["food"]["g/cap/day"]["count"] = datablock["food"]["g/cap/day"]["food"].astype(int)
+    datablock["timescale"] = 20
+    original = copy.deepcopy(datablock)
+
+    cast = cast_datablock(datablock, np.float32)
+
+    for group in ["food", "impact", "land", "population"]:
+        dtypes = dict(floating_arrays(cast[group]))
+        assert dtypes and all(dtype == np.float32 for dtype in dtypes.values()), group
+
+    assert cast["land"]["mask"].dtype == bool
+    assert cast["land"]["grade"].dtype == datablock["land"]["grade"].dtype
+    assert cast["food"]["g/cap/day"]["count"].dtype == datablock["food"]["g/cap/day"]["count"].dtype
+    assert cast["timescale"] == 20
+
+    # Values are kept, coordinates are unchanged, and the input is not modified
+    xr.testing.assert_allclose(cast["food"]["g/cap/day"].astype(np.float64),
+                               datablock["food"]["g/cap/day"].astype(np.float64), rtol=1e-6)
+    xr.testing.assert_identical(cast["land"]["percentage_land_use"].coords.to_dataset(),
+                                datablock["land"]["percentage_land_use"].coords.to_dataset())
+    xr.testing.assert_identical(datablock["food"]["g/cap/day"], original["food"]["g/cap/day"])
+
+
+@pytest.mark.parametrize("levers", [{}, LEVERS], ids=["baseline", "levers"])
+def test_float32_pipeline(levers):
+    params = scenario(levers)
+    datablock = dict(synthetic_datablock(), **params)
+
+    food_system = pipeline_setup(Pipeline(cast_datablock(datablock, np.float32)), params)
+    food_system.run()
+    result = food_system.datablock
+
+    # The food sheets and emissions are not promoted back to float64
+    dtypes = dict(floating_arrays(result["food"]))
+    dtypes.update(floating_arrays({k: result["impact"][k] for k in ["gco2e/gfood", "g_co2e/year"]}))
+    assert "g/cap/day/production" in dtypes and "g_co2e/year/production" in dtypes
+    promoted = [key for key, dtype in dtypes.items() if dtype != np.float32]
+    assert promoted == []
+
+    z_64 = run_calculator(datablock, params)
+    z_32 = run_calculator(cast_datablock(datablock, np.float32), params)
+    for zn, a, b in zip(Z_NAMES, z_64, z_32):
+        np.testing.assert_allclose(float(b), float(a), rtol=1e-4, err_msg=zn)
+
+
+def test_sample_scenarios():
+    params = {"ruminant": 0.0, "dairy": 5.0, "n_scale": 20}
+    bounds = [(-50.0, 0.0), (-20.0, 10.0)]
+
+    scenarios = sample_scenarios(params, ["ruminant", "dairy"], bounds, 5, seed=1)
+
+    assert len(scenarios) == 5
+    assert scenarios[0] == params
+    for sampled in scenarios[1:]:
+        assert sampled["n_scale"] == 20
+        assert -50.0 <= sampled["ruminant"] <= 0.0 and -20.0 <= sampled["dairy"] <= 10.0
+
+    assert sample_scenarios(params, ["ruminant", "dairy"], bounds, 5, seed=1) == scenarios
+
+
+def test_precision_report():
+    params = scenario({})
+    datablock = dict(synthetic_datablock(), **params)
+    scenarios = sample_scenarios(params, ["ruminant", "dairy"], [(-50.0, 0.0), (-20.0, 10.0)], 2)
+
+    report = precision_report(datablock, scenarios)
+
+    assert list(report.index) == list(Z_NAMES)
+    assert list(report.columns) == ["max abs error", "max rel error", "mean rel error"]
+    assert (report >= 0).all().all()
+    assert (report["mean rel error"] <= report["max rel error"]).all()
+    assert report["max rel error"].max() < 1e-4
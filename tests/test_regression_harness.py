@@ -0,0 +1,94 @@
+"""Regression harness checks against the golden values of the synthetic
+datablock, stored in tests/regression_golden.json.
+
+The golden values are recorded again, when a change to the outputs is
+intended, with
+
+UPDATE_GOLDEN=1 python -m pytest tests/test_regression_harness.py
+
+Only the outputs are checked by default, as the golden times and peak memory
+depend on the machine. Set REGRESSION_TIMING=1 to also check them, after
+recording the golden values on the same machine.
+"""
+
+import copy
+import json
+import os
+
+import numpy as np
+import pytest
+
+from pipeline_setup import Z_NAMES
+from regression_harness import check_golden, reference_scenarios, write_golden
+from synthetic import LEVERS, scenario, synthetic_datablock
+
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "regression_golden.json")
+
+# Each lever varies between its baseline value and its LEVERS value
+NAMES_X = list(LEVERS)
+X_BOUNDS = [tuple(sorted([scenario({})[lever], value])) for lever, value in LEVERS.items()]
+
+
+def thresholds():
+    if os.environ.get("REGRESSION_TIMING"):
+        return {}
+    return {"time_factor": np.inf, "memory_factor": np.inf}
+
+
+@pytest.fixture
+def golden():
+    with open(GOLDEN) as f:
+        return json.load(f)
+
+
+@pytest.mark.skipif(not os.environ.get("UPDATE_GOLDEN"), reason="Only run to record the golden values")
+def test_update_golden():
+    params_baseline = scenario({})
+    scenarios = reference_scenarios(params_baseline, NAMES_X, X_BOUNDS, n_samples=3)
+
+    write_golden(GOLDEN, synthetic_datablock(), params_baseline, scenarios, repeats=1)
+
+
+def test_reference_scenarios():
+    params_baseline = scenario({})
+
+    scenarios = reference_scenarios(params_baseline, NAMES_X, X_BOUNDS, n_samples=3)
+
+    assert [name for name, _ in scenarios] == ["baseline", "lower", "upper", "sample_1", "sample_2"]
+    assert scenarios[0][1] == params_baseline
+    for name, params in scenarios:
+        for lever, (lower, upper) in zip(NAMES_X, X_BOUNDS):
+            assert lower <= params[lever] <= upper, (name, lever)
+    assert [scenarios[2][1][lever] for lever in NAMES_X] == [upper for _, upper in X_BOUNDS]
+
+
+def test_golden_file(golden):
+    assert golden["z_names"] == list(Z_NAMES)
+    assert [s["name"] for s in golden["scenarios"]] == ["baseline", "lower", "upper",
+                                                        "sample_1", "sample_2"]
+
+
+def test_check_golden(golden):
+    report = check_golden(synthetic_datablock(), golden, repeats=1, **thresholds())
+
+    assert list(report.index) == [s["name"] for s in golden["scenarios"]]
+    assert (report["failed"] == "").all(), report.to_string()
+    assert (report["output error / tol"] <= 1).all()
+
+
+def test_check_golden_detects_changes(golden):
+    golden = copy.deepcopy(golden)
+    golden["scenarios"] = golden["scenarios"][:2]
+    golden["scenarios"][1]["z"]["emissions"] *= 1 + 1e-6
+    golden["scenarios"][0]["time_s"] = 1e-6
+
+    report = check_golden(synthetic_datablock(), golden, repeats=1, time_slack_s=0.0)
+
+    assert report.loc["baseline", "failed"] == "time"
+    assert report.loc["lower", "failed"] == "emissions"
+
+    # A different datablock is reported, as the cause of any differences
+    datablock = synthetic_datablock(seed=1)
+    with pytest.warns(UserWarning, match="datablock snapshot differs"):
+        check_golden(datablock, {**golden, "scenarios": golden["scenarios"][:1]}, repeats=1,
+                     **thresholds())
@@ -0,0 +1,93 @@
+"""Run logs written by run_pipeline_scrip and imported into the results store"""
+
+import os
+
+import pytest
+from scipy.optimize import OptimizeResult
+
+from pipeline_setup import Z_NAMES
+from results_store import ResultsStore, parse_log, z_column
+from run_pipeline_scrip import CONSTRAINTS, write_log
+from warm_start import find_warm_start
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PARAMS = {"n_scale": 20.0, "rda_kcal": 2250.0, "scaling_nutrient": "kCal/cap/day",
+          "cereal_scaling": True}
+NAMES_X = ["ruminant", "dairy"]
+X_BOUNDS = [(-50.0, 0.0), (-20.0, 10.0)]
+Z_OPT = dict(zip(Z_NAMES, [0.7, 0.75, 0.65, 0.7, -1.5, 2.1e6, 1.2e8, 3.4e6]))
+
+
+@pytest.fixture
+def store(tmp_path):
+    with ResultsStore(str(tmp_path / "results.sqlite")) as store:
+        yield store
+
+
+def write_run_log(path, **kwargs):
+    result = OptimizeResult(x=[-25.0, 5.0], fun=-2.1e6, success=True,
+                            message="Optimization terminated successfully.", nfev=42)
+    write_log(str(path), result, 1e-4, PARAMS, NAMES_X, X_BOUNDS, "https://example.org/?a=1",
+              **kwargs)
+
+
+def test_parse_log(tmp_path):
+    path = tmp_path / "run.log"
+    write_run_log(path, zreq="herd size", constraints=CONSTRAINTS, z=Z_OPT)
+
+    log = parse_log(str(path))
+
+    assert log["params"] == PARAMS
+    assert log["bounds"] == dict(zip(NAMES_X, X_BOUNDS))
+    assert log["x_opt"] == {"ruminant": -25.0, "dairy": 5.0}
+    assert log["thresholds"] == CONSTRAINTS
+    assert log["z"] == Z_OPT
+    assert log["header"]["Optimized output"] == "herd size"
+    assert log["header"]["Number of iterations"] == 42
+    assert log["url"] == "https://example.org/?a=1"
+
+
+def test_imported_log_is_warm_start(tmp_path, store):
+    path = tmp_path / "run.log"
+    write_run_log(path, zreq="herd size", constraints=CONSTRAINTS, z=Z_OPT)
+
+    run_id = store.import_log(str(path))
+    assert store.import_log(str(path)) is None
+
+    run = store.query("id = ?", (run_id,))[0]
+    assert run["zreq"] == "herd size"
+    assert run["thresholds"] == {k: list(v) for k, v in CONSTRAINTS.items()}
+    assert run["args"]["zreq"] == "herd size"
+    for zn in Z_NAMES:
+        assert run[z_column(zn)] == Z_OPT[zn]
+
+    warm_start = find_warm_start(store, PARAMS, dict(zip(NAMES_X, X_BOUNDS)),
+                                 "herd size", CONSTRAINTS)
+    assert warm_start["run"]["id"] == run_id
+    assert list(warm_start["x0"]) == [-25.0, 5.0]
+
+
+def test_older_log_is_not_warm_start(tmp_path, store):
+    path = tmp_path / "run.log"
+    write_run_log(path)
+
+    run_id = store.import_log(str(path))
+    run = store.query("id = ?", (run_id,))[0]
+    assert run["zreq"] is None
+    assert run["thresholds"] is None
+
+    assert find_warm_start(store, PARAMS, dict(zip(NAMES_X, X_BOUNDS)),
+                           "herd size", CONSTRAINTS) is None
+
+
+def test_import_repository_logs(store):
+    path = os.path.join(REPO, "results", "default.log")
+    log = parse_log(path)
+
+    assert log["params"] and log["bounds"] and log["x_opt"]
+    assert log["header"]["Optimization success"] is False
+    assert log["thresholds"] == log["z"] == {}
+
+    run_id = store.import_log(path)
+    assert store.query("id = ?", (run_id,))[0]["x_opt"] == log["x_opt"]
@@ -0,0 +1,37 @@
+"""Command line helpers of run_pipeline_scrip"""
+
+import pytest
+
+from run_pipeline_scrip import save_on_interrupt
+
+
+class RecordingCheckpoint:
+    path = "run.ckpt.json"
+
+    def __init__(self):
+        self.saved = 0
+
+    def save(self, finished=False):
+        self.saved += 1
+
+
+@pytest.mark.parametrize("error", [KeyboardInterrupt, RuntimeError])
+def test_save_on_interrupt(error):
+    checkpoint = RecordingCheckpoint()
+
+    with pytest.raises(error):
+        with save_on_interrupt(checkpoint, "run"):
+            raise error()
+
+    assert checkpoint.saved == 1
+
+
+def test_no_save_on_success():
+    checkpoint = RecordingCheckpoint()
+
+    with save_on_interrupt(checkpoint, "run"):
+        pass
+    with save_on_interrupt(None, "run"):
+        pass
+
+    assert checkpoint.saved == 0
@@ -0,0 +1,126 @@
+"""Expansion of scenario matrices into run configurations"""
+
+import pytest
+
+from run_pipeline_scrip import CONSTRAINTS
+from scenario_matrix import expand_matrix, run_parameters, run_thresholds
+
+ADV_SET = {"n_scale": 20.0, "rda_kcal": 2250.0,
+           "mixed_farming_secondary_production_scale": 0.1}
+
+RANGES = {"Test": {"ruminant": (-50.0, 0.0), "dairy": (-20.0, 10.0),
+                   "mixed_farming": (0.0, 0.0)}}
+
+MATRIX = {"name": "mixed",
+          "common": {"ranges": "Test", "base_param": {"mixed_farming": 25}},
+          "axes": {"forest": [{"label": ""},
+                              {"label": "forest19", "base_param": {"foresting_pasture": 19}}],
+                   "secondary": [{"label": ""},
+                                 {"label": "secondary015",
+                                  "adv_set": {"mixed_farming_secondary_production_scale": 0.15}}]}}
+
+
+def run_names(configs):
+    return [config["run_name"] for config in configs]
+
+
+def test_cartesian_product():
+    configs, duplicates = expand_matrix(MATRIX)
+
+    assert run_names(configs) == ["mixed", "mixed_secondary015",
+                                  "mixed_forest19", "mixed_forest19_secondary015"]
+    assert duplicates == {}
+
+    config = configs[-1]
+    assert config["base_param"] == {"mixed_farming": 25, "foresting_pasture": 19}
+    assert config["adv_set"] == {"mixed_farming_secondary_production_scale": 0.15}
+    assert config["zreq"] == "herd size"
+    assert config["population_projection"] == "Medium"
+
+    # Variants do not leak into the other configurations
+    assert configs[0]["base_param"] == {"mixed_farming": 25}
+    assert configs[0]["adv_set"] == {}
+
+
+def test_identical_configurations_run_once():
+    matrix = {"name": "m",
+              "axes": {"a": [{"label": "x", "niter": 20}, {"label": "y", "niter": 20.0}],
+                       "b": [{"label": ""}, {"label": "same", "thresholds": {}}]}}
+
+    configs, duplicates = expand_matrix(matrix)
+
+    assert run_names(configs) == ["m_x"]
+    assert duplicates == {"m_x_same": "m_x", "m_y": "m_x", "m_y_same": "m_x"}
+
+
+def test_overrides_equal_to_defaults_are_duplicates():
+    matrix = {"name": "m", "common": {"ranges": "Test"},
+              "axes": {"override": [
+                  {"label": ""},
+                  {"label": "adv", "adv_set": {"n_scale": 20}},
+                  {"label": "fixed", "base_param": {"mixed_farming": 0}},
+                  {"label": "threshold", "thresholds": {"emissions": CONSTRAINTS["emissions"][1]}},
+                  {"label": "pair", "thresholds": {"emissions": list(CONSTRAINTS["emissions"])}},
+                  {"label": "projection", "population_projection": "Medium"},
+                  {"label": "changed", "adv_set": {"n_scale": 25}}]}}
+
+    configs, duplicates = expand_matrix(matrix, ADV_SET, RANGES)
+
+    assert run_names(configs) == ["m", "m_changed"]
+    assert set(duplicates) == {"m_adv", "m_fixed", "m_threshold", "m_pair", "m_projection"}
+    assert set(duplicates.values()) == {"m"}
+
+    # Without the sheets, only the constraints are resolved
+    configs, duplicates = expand_matrix(matrix)
+    assert run_names(configs) == ["m", "m_adv", "m_fixed", "m_changed"]
+
+
+def test_population_projections_are_distinct():
+    matrix = {"name": "m", "common": {"ranges": "Test"},
+              "axes": {"population": [{"label": "medium"},
+                                      {"label": "high", "population_projection": "High"}]}}
+
+    configs, duplicates = expand_matrix(matrix, ADV_SET, RANGES)
+    assert run_names(configs) == ["m_medium", "m_high"]
+
+    params_medium, _, _ = run_parameters(configs[0], ADV_SET, RANGES)
+    params_high, names_x, x_bounds = run_parameters(configs[1], ADV_SET, RANGES)
+
+    assert "population_projection" not in params_medium
+    assert params_high["population_projection"] == "High"
+    assert names_x == ["ruminant", "dairy"]
+    assert x_bounds == [(-50.0, 0.0), (-20.0, 10.0)]
+    assert params_high["mixed_farming"] == 0.0
+
+
+def test_run_parameters():
+    config = dict(MATRIX["common"], adv_set={"n_scale": 25})
+
+    params, names_x, x_bounds = run_parameters(config, ADV_SET, RANGES)
+
+    assert names_x == ["ruminant", "dairy"]
+    assert x_bounds == [(-50.0, 0.0), (-20.0, 10.0)]
+    assert params["mixed_farming"] == 25
+    assert params["n_scale"] == 25
+
+
+def test_run_thresholds():
+    assert run_thresholds({}) == CONSTRAINTS
+
+    constraints = run_thresholds({"thresholds": {"emissions": 5,
+                                                 "SSR fat": None,
+                                                 "herd size": [-1, 2e6]}})
+
+    assert constraints["emissions"] == (-1, 5.0)
+    assert "SSR fat" not in constraints
+    assert constraints["herd size"] == (-1, 2e6)
+    assert constraints["SSR weight"] == CONSTRAINTS["SSR weight"]
+
+
+@pytest.mark.parametrize("thresholds", [{"herd size": 2e6},
+                                        {"herd sizes": [1, 2e6]},
+                                        {"emissions": [2, 0.0]},
+                                        {"emissions": [1, 0.0, 3]}])
+def test_invalid_thresholds(thresholds):
+    with pytest.raises(ValueError):
+        run_thresholds({"thresholds": thresholds})
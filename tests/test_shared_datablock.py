@@ -0,0 +1,103 @@
+"""Datablocks published in shared memory and attached by worker processes"""
+
+import copy
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from fingerprint import fingerprint_datablock
+from shared_datablock import SharedDatablock, attach_datablock
+
+
+def synthetic_datablock():
+    rng = np.random.default_rng(0)
+    years = np.arange(2020, 2051)
+    food = xr.Dataset({"production": (("Item", "Year"), rng.uniform(0, 10, (3, len(years)))),
+                       "imports": (("Item", "Year"), rng.uniform(0, 10, (3, len(years))))},
+                      coords={"Item": [2511, 2731, 2740], "Year": years,
+                              "Item_name": ("Item", ["Wheat", "Bovine Meat", "Butter"]),
+                              "Item_origin": ("Item", ["Vegetal Products", "Animal Products",
+                                                       "Animal Products"])},
+                      attrs={"units": "g/cap/day"})
+    land = xr.DataArray(rng.integers(0, 8, (4, 5)).astype(np.float32), dims=("y", "x"),
+                        coords={"y": np.arange(4), "x": np.arange(5)}, name="ALC_grade")
+    return {"food": {"g/cap/day": food},
+            "land": {"dominant_classification": land},
+            "mask": rng.uniform(size=(4, 5)) > 0.5,
+            "empty": np.empty(0),
+            "labels": np.array(["a", "b"], dtype=object),
+            "global_parameters": {"timescale": 20, "scaling_nutrient": "kCal/cap/day"}}
+
+
+def worker_fingerprint(manifest):
+    datablock = attach_datablock(manifest)
+    production = datablock["food"]["g/cap/day"]["production"].values
+    return fingerprint_datablock(datablock), production.flags.writeable
+
+
+def test_attach_same_process():
+    datablock = synthetic_datablock()
+
+    with SharedDatablock(datablock) as shared:
+        attached = attach_datablock(shared.manifest)
+
+        xr.testing.assert_identical(attached["food"]["g/cap/day"], datablock["food"]["g/cap/day"])
+        xr.testing.assert_identical(attached["land"]["dominant_classification"],
+                                    datablock["land"]["dominant_classification"])
+        np.testing.assert_array_equal(attached["mask"], datablock["mask"])
+        np.testing.assert_array_equal(attached["labels"], datablock["labels"])
+        assert attached["empty"].shape == (0,)
+        assert attached["global_parameters"] == datablock["global_parameters"]
+        assert fingerprint_datablock(attached) == fingerprint_datablock(datablock)
+
+        # Shared buffers are read-only views, and copies of them are writable
+        production = attached["food"]["g/cap/day"]["production"].values
+        assert not production.flags.writeable
+        assert not attached["mask"].flags.writeable
+        with pytest.raises(ValueError):
+            production[0, 0] = 1.0
+
+        copied = copy.deepcopy(attached)
+        copied["food"]["g/cap/day"]["production"][0, 0] = -1.0
+        assert datablock["food"]["g/cap/day"]["production"][0, 0] != -1.0
+
+        del attached, production, copied
+
+
+def test_manifest_is_small():
+    datablock = synthetic_datablock()
+    datablock["land"]["pixels"] = xr.DataArray(np.ones((500, 400)), dims=("y", "x"))
+
+    with SharedDatablock(datablock) as shared:
+        assert shared.nbytes >= datablock["land"]["pixels"].nbytes
+        assert len(pickle.dumps(shared.manifest)) < 10000
+
+
+@pytest.mark.parametrize("start_method", ["fork", "spawn"])
+def test_attach_worker_process(start_method):
+    if start_method not in multiprocessing.get_all_start_methods():
+        pytest.skip(f"{start_method} start method not available")
+
+    datablock = synthetic_datablock()
+    context = multiprocessing.get_context(start_method)
+
+    with SharedDatablock(datablock) as shared:
+        with ProcessPoolExecutor(max_workers=2, mp_context=context) as pool:
+            results = list(pool.map(worker_fingerprint, [shared.manifest] * 4))
+
+    assert results == [(fingerprint_datablock(datablock), False)] * 4
+
+
+def test_close():
+    shared = SharedDatablock(synthetic_datablock())
+    manifest = shared.manifest
+
+    shared.close()
+    shared.close()
+
+    with pytest.raises(FileNotFoundError):
+        attach_datablock(manifest)
@@ -0,0 +1,168 @@
+"""Snapshot store of the settings and ranges sheets, fetched from a local HTTP
+server serving fixture CSVs"""
+
+import functools
+import json
+import os
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from sheet_snapshots import (fetch_snapshot, latest_snapshot, list_snapshots,
+                             load_sheet)
+
+SETTINGS_CSV = """key,type,value,description
+n_scale,float,20,Adoption timescale
+rda_kcal,float,2250,Recommended daily calories
+scaling_nutrient,string,kCal/cap/day,Nutrient used to scale items
+cereal_scaling,bool,TRUE,Scale cereals to keep calories constant
+comment,,,Rows without a type are skipped
+"""
+
+RANGES_CSV = """Parameter ranges,,,,,
+,,,,,
+Name,Description,Author,ruminant,dairy,waste
+Min Test,,,-50,-20,-50
+Max Test,,,0,10,
+Min Wide,,,-100,-100,-100
+Max Wide,,,100,100,100
+"""
+
+SETTINGS = {"n_scale": 20.0, "rda_kcal": 2250.0,
+            "scaling_nutrient": "kCal/cap/day", "cereal_scaling": True}
+
+RANGES = {"Test": {"ruminant": (-50.0, 0.0), "dairy": (-20.0, 10.0)},
+          "Wide": {"ruminant": (-100.0, 100.0), "dairy": (-100.0, 100.0),
+                   "waste": (-100.0, 100.0)}}
+
+FIXTURES = {"settings": (SETTINGS_CSV, SETTINGS),
+            "ranges": (RANGES_CSV, RANGES)}
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def sheet_server(tmp_path):
+    """Serves a directory of sheet CSVs, returns (directory, base URL)"""
+
+    served = tmp_path / "served"
+    served.mkdir()
+    for kind, (text, _) in FIXTURES.items():
+        (served / f"{kind}.csv").write_text(text)
+
+    handler = functools.partial(QuietHandler, directory=str(served))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield served, f"http://127.0.0.1:{server.server_address[1]}"
+
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+@pytest.mark.parametrize("kind", ["settings", "ranges"])
+def test_load_sheet_from_url(sheet_server, kind):
+    _, base_url = sheet_server
+    assert load_sheet(kind, f"{base_url}/{kind}.csv") == FIXTURES[kind][1]
+
+
+@pytest.mark.parametrize("kind", ["settings", "ranges"])
+def test_fetch_snapshot(sheet_server, tmp_path, kind):
+    served, base_url = sheet_server
+    url = f"{base_url}/{kind}.csv"
+    store = tmp_path / "snapshots"
+    kind_dir = os.path.join(store, kind)
+
+    path = fetch_snapshot(kind, url, str(store))
+    assert os.path.dirname(path) == kind_dir
+    assert latest_snapshot(kind_dir) == path
+    with open(path) as f:
+        assert f.read() == FIXTURES[kind][0]
+
+    with open(os.path.splitext(path)[0] + ".json") as f:
+        stored = json.load(f)
+    assert stored["source"] == url
+
+    # Snapshot loaded from the directory and from the CSV file
+    assert load_sheet(kind, kind_dir) == FIXTURES[kind][1]
+    assert load_sheet(kind, path) == FIXTURES[kind][1]
+
+    # Unchanged contents do not add a version
+    assert fetch_snapshot(kind, url, str(store)) == path
+    assert list_snapshots(kind_dir) == [path]
+
+    # Changed contents add a version, which becomes the latest
+    text, expected = FIXTURES[kind]
+    (served / f"{kind}.csv").write_text(text.replace("20", "30", 1))
+    new_path = fetch_snapshot(kind, url, str(store))
+
+    assert new_path != path
+    assert sorted(list_snapshots(kind_dir)) == sorted([path, new_path])
+    assert latest_snapshot(kind_dir) == new_path
+    assert load_sheet(kind, kind_dir) != expected
+    assert load_sheet(kind, path) == expected
+
+
+def test_broken_sheet_is_not_stored(sheet_server, tmp_path):
+    served, base_url = sheet_server
+    store = tmp_path / "snapshots"
+    kind_dir = os.path.join(store, "ranges")
+
+    path = fetch_snapshot("ranges", f"{base_url}/ranges.csv", str(store))
+
+    # A range without its "Max" row cannot be parsed
+    broken = "\n".join(line for line in RANGES_CSV.splitlines() if not line.startswith("Max Wide"))
+    (served / "ranges.csv").write_text(broken + "\n")
+    with pytest.raises(KeyError):
+        fetch_snapshot("ranges", f"{base_url}/ranges.csv", str(store))
+
+    assert list_snapshots(kind_dir) == [path]
+    assert latest_snapshot(kind_dir) == path
+
+
+@pytest.mark.parametrize("kind", ["settings", "ranges"])
+def test_load_sheet_cache_invalidation(sheet_server, tmp_path, kind):
+    _, base_url = sheet_server
+    path = fetch_snapshot(kind, f"{base_url}/{kind}.csv", str(tmp_path / "snapshots"))
+    cache_path = os.path.splitext(path)[0] + ".json"
+
+    # The parsed form is read from the cache while the CSV is unchanged
+    with open(cache_path) as f:
+        cached = json.load(f)
+    cached["data"] = {"from": "cache"} if kind == "settings" else {"Cached": {"dairy": [1, 2]}}
+    with open(cache_path, "w") as f:
+        json.dump(cached, f)
+
+    expected_cached = {"from": "cache"} if kind == "settings" else {"Cached": {"dairy": (1, 2)}}
+    assert load_sheet(kind, path) == expected_cached
+
+    # Editing the CSV invalidates the cache, which is rewritten
+    with open(path, "a") as f:
+        f.write("\n")
+    assert load_sheet(kind, path) == FIXTURES[kind][1]
+
+    with open(cache_path) as f:
+        rewritten = json.load(f)
+    assert rewritten["source"] == path
+    assert load_sheet(kind, path) == FIXTURES[kind][1]
+
+
+def test_missing_cache_is_written(tmp_path):
+    path = tmp_path / "ranges.csv"
+    path.write_text(RANGES_CSV)
+
+    assert load_sheet("ranges", str(path)) == RANGES
+    assert (tmp_path / "ranges.json").exists()
+
+
+def test_empty_snapshot_directory(tmp_path):
+    assert list_snapshots(str(tmp_path / "missing")) == []
+    assert latest_snapshot(str(tmp_path)) is None
+    with pytest.raises(FileNotFoundError):
+        load_sheet("settings", str(tmp_path))
@@ -0,0 +1,95 @@
+"""Warm starts from the closest compatible run in the results store"""
+
+import numpy as np
+import pytest
+
+from results_store import ResultsStore
+from warm_start import config_features, find_warm_start
+
+PARAMS = {"n_scale": 20.0, "rda_kcal": 2250.0, "herd_baseline": 3.0e6,
+          "scaling_nutrient": "kCal/cap/day", "cereal_scaling": True}
+BOUNDS = {"ruminant": (-50.0, 0.0), "dairy": (-20.0, 10.0)}
+THRESHOLDS = {"SSR kcal": (1, 0.68), "emissions": (-1, 0.0)}
+
+
+@pytest.fixture
+def store(tmp_path):
+    with ResultsStore(str(tmp_path / "results.sqlite")) as store:
+        yield store
+
+
+def add_run(store, name, x_opt, params=None, bounds=BOUNDS, zreq="herd size",
+            thresholds=THRESHOLDS, fun=-2e6):
+    return store.add_run(name, dict(PARAMS, **(params or {})), bounds=bounds,
+                         x_opt=dict(zip(bounds, x_opt)), zreq=zreq,
+                         thresholds=thresholds, result={"fun": fun})
+
+
+def test_config_features():
+    names = ["param:n_scale", "param:cereal_scaling", "param:missing", "threshold:SSR kcal"]
+
+    features = config_features(PARAMS, THRESHOLDS, names)
+
+    np.testing.assert_array_equal(features, [20.0, 1.0, np.nan, 0.68])
+
+
+def test_no_runs(store):
+    assert find_warm_start(store, PARAMS, BOUNDS, "herd size", THRESHOLDS) is None
+
+
+def test_closest_run(store):
+    add_run(store, "far", [-40.0, 5.0], {"n_scale": 40.0})
+    close = add_run(store, "close", [-30.0, -5.0], {"n_scale": 22.0})
+
+    warm_start = find_warm_start(store, PARAMS, BOUNDS, "herd size", THRESHOLDS)
+
+    assert warm_start["run"]["id"] == close
+    assert warm_start["x0"] == [-30.0, -5.0]
+    assert warm_start["distance"] > 0
+
+
+def test_features_are_scaled(store):
+    # Each feature is scaled by its range, so 10 thousand heads out of a range
+    # of 100 thousand are closer than 5 years out of a range of 5 years
+    heads = add_run(store, "heads", [-40.0, 5.0], {"herd_baseline": 3.01e6})
+    add_run(store, "timescale", [-30.0, -5.0], {"n_scale": 25.0})
+    add_run(store, "herd", [-20.0, 0.0], {"herd_baseline": 3.1e6})
+
+    warm_start = find_warm_start(store, PARAMS, BOUNDS, "herd size", THRESHOLDS)
+    assert warm_start["run"]["id"] == heads
+    assert warm_start["distance"] == pytest.approx(0.1)
+
+
+def test_threshold_distance(store):
+    add_run(store, "strict", [-40.0, 5.0], thresholds={"SSR kcal": (1, 0.9), "emissions": (-1, 0.0)})
+    loose = add_run(store, "loose", [-30.0, -5.0],
+                    thresholds={"SSR kcal": (1, 0.7), "emissions": (-1, 0.0)})
+
+    warm_start = find_warm_start(store, PARAMS, BOUNDS, "herd size", THRESHOLDS)
+    assert warm_start["run"]["id"] == loose
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"zreq": "emissions"},
+    {"bounds": {"ruminant": (-50.0, 0.0), "waste": (-20.0, 10.0)}},
+    {"thresholds": {"SSR kcal": (1, 0.68)}},
+    {"thresholds": None},
+    {"params": {"scaling_nutrient": "g/cap/day"}},
+    {"params": {"extra_setting": 1.0}},
+    {"fun": None},
+])
+def test_incompatible_runs(store, kwargs):
+    add_run(store, "other", [-30.0, -5.0], **kwargs)
+
+    assert find_warm_start(store, PARAMS, BOUNDS, "herd size", THRESHOLDS) is None
+
+
+def test_x0_clipped_to_new_bounds(store):
+    add_run(store, "wide", [-80.0, 5.0], bounds={"ruminant": (-100.0, 0.0), "dairy": (-20.0, 10.0)})
+
+    # Bounds are matched by name, in the order of the new run
+    bounds = {"dairy": (-20.0, 0.0), "ruminant": (-50.0, 0.0)}
+    warm_start = find_warm_start(store, PARAMS, bounds, "herd size", THRESHOLDS)
+
+    assert warm_start["x0"] == [0.0, -50.0]
+    assert warm_start["distance"] == 0
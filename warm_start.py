@@ -0,0 +1,102 @@
+"""Warm starts for optimisation runs from previously solved configurations.
+
+Past runs in the results store are indexed with a KD-tree over their
+configuration: the numeric baseline parameters and the constraint thresholds.
+Only runs that optimise the same output, vary the same parameters, use the
+same constraints and share the same non-numeric settings are candidates. Each
+feature is scaled by its range over the candidates, so that parameters in
+percentages, heads and tonnes count equally.
+"""
+
+import numpy as np
+
+def _split_params(params):
+    """Splits parameters into numeric values and other (string) settings"""
+    numeric, other = {}, {}
+    for k, v in params.items():
+        if isinstance(v, (bool, np.bool_)):
+            numeric[k] = float(v)
+        elif isinstance(v, (int, float, np.integer, np.floating)):
+            numeric[k] = float(v)
+        else:
+            other[k] = str(v)
+    return numeric, other
+
+def _thresholds(thresholds):
+    return {k: float(v[1]) for k, v in (thresholds or {}).items()}
+
+def config_features(params, thresholds, names):
+    """Returns the feature vector of a configuration, for the given feature
+    names. Parameters are prefixed with "param:" and thresholds with
+    "threshold:"."""
+    numeric, _ = _split_params(params)
+    thresholds = _thresholds(thresholds)
+    values = []
+    for name in names:
+        kind, key = name.split(":", 1)
+        source = numeric if kind == "param" else thresholds
+        values.append(source.get(key, np.nan))
+    return np.array(values, dtype=float)
+
+def find_warm_start(store, params, bounds, zreq, thresholds):
+    """Finds the previously solved configuration closest to a new problem.
+
+    Parameters
+    ----------
+    store : results_store.ResultsStore
+        Store with the past runs.
+    params : dict
+        Baseline parameters of the new run.
+    bounds : dict
+        Varied parameter name -> (min, max) of the new run.
+    zreq : str
+        Name of the optimised output.
+    thresholds : dict
+        Constraint thresholds, as in run_pipeline_scrip.CONSTRAINTS.
+
+    Returns
+    -------
+    warm_start : dict or None
+        Dictionary with the neighbouring "run", its scaled "distance" and the
+        starting point "x0" for the new run, or None if there is no
+        compatible past run.
+    """
+    from scipy.spatial import cKDTree
+
+    numeric, other = _split_params(params)
+    threshold_values = _thresholds(thresholds)
+
+    candidates = []
+    for run in store.query("zreq = ? AND fun IS NOT NULL", (zreq,)):
+        if set(run["bounds"]) != set(bounds) or not run["x_opt"]:
+            continue
+        if set(_thresholds(run["thresholds"])) != set(threshold_values):
+            continue
+        run_numeric, run_other = _split_params(run["params"])
+        if run_other != other or set(run_numeric) != set(numeric):
+            continue
+        candidates.append(run)
+
+    if not candidates:
+        return None
+
+    names = [f"param:{k}" for k in sorted(numeric)] + \
+            [f"threshold:{k}" for k in sorted(threshold_values)]
+
+    features = np.array([config_features(run["params"], run["thresholds"], names)
+                         for run in candidates])
+    query = config_features(params, thresholds, names)
+
+    # Scale each feature by its range, ignoring those which never change
+    span = np.nanmax(np.vstack([features, query]), axis=0) - \
+           np.nanmin(np.vstack([features, query]), axis=0)
+    span[~(span > 0)] = 1.0
+
+    tree = cKDTree(np.nan_to_num(features / span))
+    distance, index = tree.query(np.nan_to_num(query / span), k=1)
+    run = candidates[int(index)]
+
+    # Start from the neighbour's optimum, clipped to the new bounds
+    x0 = [float(np.clip(run["x_opt"][name], *bounds[name])) for name in bounds]
+
+    return {"run": run, "distance": float(distance), "x0": x0}